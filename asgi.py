@@ -0,0 +1,113 @@
+# ASGI 模式：python-socketio 的 AsyncServer 跑在 uvicorn 上，遊戲邏輯與事件處理器和 main.py 共用
+# 用法: python asgi.py（或 uvicorn asgi:app，但後者不會接管 SIGTERM 排空）
+import asyncio
+import functools
+import os
+import signal
+
+import socketio
+import uvicorn
+
+os.environ['SERVER_MODE'] = 'asgi'  # main 不必建立 Flask-SocketIO 伺服器
+
+import main  # noqa: E402
+
+
+class AsyncTransport:
+    # 處理器是同步函式，在事件迴圈上直接執行；送出與進出房間依序放進佇列，由單一工作依序送出
+    def __init__(self, sio):
+        self.sio = sio
+        self.loop = None
+        self.outbox = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.outbox = asyncio.Queue()
+        self.loop.create_task(self._send_outbox())
+
+    async def _send_outbox(self):
+        while True:
+            operation = await self.outbox.get()
+            try:
+                await operation()
+            except Exception:
+                main.app.logger.exception("送出 Socket.IO 訊息失敗")
+
+    def emit(self, event, data, to=None, namespace='/'):
+        self.outbox.put_nowait(functools.partial(self.sio.emit, event, data, to=to, namespace=namespace))
+
+    def enter_room(self, sid, room, namespace='/'):
+        self.outbox.put_nowait(functools.partial(self.sio.enter_room, sid, room, namespace=namespace))
+
+    def leave_room(self, sid, room, namespace='/'):
+        self.outbox.put_nowait(functools.partial(self.sio.leave_room, sid, room, namespace=namespace))
+
+    def environ(self, sid, namespace='/'):
+        return self.sio.get_environ(sid, namespace=namespace)
+
+    def call_later(self, delay, fn, *args):
+        self.loop.call_later(delay, fn, *args)
+
+    def run_in_worker(self, fn, callback):
+        future = self.loop.run_in_executor(None, fn)
+        future.add_done_callback(lambda done: callback(done.result()))
+
+    def yield_now(self):
+        pass  # 同步處理器無法讓出，送出本來就經過佇列
+
+
+def register_handlers(sio):
+    for (namespace, event), handler in main.SOCKET_HANDLERS.items():
+        if event == 'connect':
+            async def dispatch(sid, environ, auth=None, handler=handler):
+                return handler(sid, auth)
+        else:
+            async def dispatch(sid, *args, handler=handler):
+                return handler(sid, *args)
+        sio.on(event, namespace=namespace)(dispatch)
+
+
+async def http_app(scope, receive, send):
+    if scope['type'] != 'http':
+        return
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    status, response_headers, body = main.handle_http(scope['path'], headers)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response_headers.items()]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+transport = AsyncTransport(sio)
+main.transport = transport
+register_handlers(sio)
+
+
+def startup():
+    transport.start()
+    # 分析器會經由 call_later 排程定期輸出，事件迴圈啟動後才能設定
+    if main.PROFILE_MODE != 'off':
+        main.profiler.configure(main.PROFILE_MODE, main.PROFILE_ROOM, main.PROFILE_RATE)
+    main.start_background_tasks()
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app, on_startup=startup)
+
+
+class DrainingServer(uvicorn.Server):
+    # SIGTERM 先進入排空模式，由 main.finish_drain 決定何時結束；其他訊號照 uvicorn 原本的方式關閉
+    def handle_exit(self, sig, frame):
+        if sig == signal.SIGTERM and transport.loop and not main.drain_state['draining']:
+            transport.loop.call_soon_threadsafe(main.start_drain)
+            return
+        super().handle_exit(sig, frame)
+
+
+if __name__ == '__main__':
+    main.set_memory_trace(main.MEMORY_TRACE_FRAMES)
+    main.start_logging()
+    port = int(os.environ.get("PORT", 5000))
+    DrainingServer(uvicorn.Config(app, host="0.0.0.0", port=port)).run()
@@ -0,0 +1,125 @@
+# 比較 eventlet(main.py) 與 ASGI(asgi.py) 兩種模式：可同時維持的連線數、記憶體與事件往返延遲
+# 用法: python benchmarks/bench_modes.py [--clients 500] [--rounds 20] [--modes eventlet,asgi]
+# 需要 aiohttp(python-socketio 的 asyncio 客戶端)；連線數多時先調高 ulimit -n
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {'eventlet': 'main.py', 'asgi': 'asgi.py'}
+ROLES = [{'role': 'villager', 'count': 2}, {'role': 'werewolf', 'count': 2}]
+
+
+def start_server(mode, port, extra_env=None):
+    with socket.socket() as probe:
+        if probe.connect_ex(('127.0.0.1', port)) == 0:
+            raise RuntimeError(f'連接埠 {port} 已被占用，量到的會是別的伺服器')
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        STATS_DIR='',
+        RATINGS_DB='',
+        HANDOFF_DIR='',
+        IP_RATE_MULTIPLIER='1000000',  # 所有客戶端都來自本機，不能讓 IP 限流干擾結果
+        RATE_LIMITS=json.dumps({'create_room': [1000, 1000], 'set_roles': [1000, 1000]}),
+        **(extra_env or {})
+    )
+    proc = subprocess.Popen([sys.executable, SERVERS[mode]], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and proc.poll() is None:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/readyz', timeout=1)
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'{mode} 伺服器沒有在時限內啟動')
+
+
+def rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def open_client(url):
+    client = socketio.AsyncClient(reconnection=False)
+    created = asyncio.get_running_loop().create_future()
+    updates = asyncio.Queue()
+    client.on('room_created', lambda data: created.done() or created.set_result(data))
+    client.on('roles_updated', lambda data: updates.put_nowait(time.perf_counter()))
+    await client.connect(url, transports=['websocket'])
+    await client.emit('create_room', {'player_name': 'bench'})
+    room = await asyncio.wait_for(created, 10)
+    return client, room, updates
+
+
+async def run_rounds(client, room, updates, rounds, latencies):
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await client.emit('set_roles', {'room_id': room['room_id'], 'player_id': room['player_id'], 'roles': ROLES})
+        finished = await asyncio.wait_for(updates.get(), 10)
+        latencies.append((finished - started) * 1000)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float('nan')
+
+
+async def bench(mode, port, clients, rounds):
+    proc = start_server(mode, port)
+    try:
+        idle_rss = rss_mb(proc.pid)
+        url = f'http://127.0.0.1:{port}'
+        opened = await asyncio.gather(*(open_client(url) for _ in range(clients)), return_exceptions=True)
+        connected = [item for item in opened if not isinstance(item, BaseException)]
+        held_rss = rss_mb(proc.pid)
+        latencies = []
+        started = time.perf_counter()
+        await asyncio.gather(*(run_rounds(c, room, updates, rounds, latencies) for c, room, updates in connected),
+                             return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        await asyncio.gather(*(c.disconnect() for c, _, _ in connected), return_exceptions=True)
+        return {
+            'mode': mode,
+            'connected': len(connected),
+            'failed': clients - len(connected),
+            'idle_rss_mb': round(idle_rss, 1),
+            'rss_mb': round(held_rss, 1),
+            'kb_per_connection': round((held_rss - idle_rss) * 1024 / max(len(connected), 1), 1),
+            'events_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2)
+        }
+    finally:
+        proc.kill()  # SIGTERM 會進入排空模式，量測結束直接停掉
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--modes', default='eventlet,asgi')
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+    for mode in args.modes.split(','):
+        result = asyncio.run(bench(mode, args.port, args.clients, args.rounds))
+        print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
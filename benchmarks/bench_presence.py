@@ -0,0 +1,100 @@
+# 量測在線狀態巡檢的成本：大量房間與玩家同時在線時，一次 sweep_presence 與一次心跳各要多久
+# 用法: python benchmarks/bench_presence.py [--players 12000] [--away 0.01]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+ROLES = [{'role': 'villager', 'count': 5}, {'role': 'werewolf', 'count': 4}, {'role': 'seer', 'count': 1},
+         {'role': 'witch', 'count': 1}, {'role': 'guard', 'count': 1}]
+ROOM_SIZE = sum(role['count'] for role in ROLES)
+
+
+class CountingTransport:
+    # 只計算送出次數，不排程下一次巡檢，量到的是巡檢本身
+    def __init__(self):
+        self.emits = 0
+
+    def emit(self, event, data, to=None, namespace='/'):
+        self.emits += 1
+
+    def enter_room(self, sid, room, namespace='/'):
+        pass
+
+    def leave_room(self, sid, room, namespace='/'):
+        pass
+
+    def call_later(self, delay, fn, *args):
+        pass
+
+    def yield_now(self):
+        pass
+
+
+def build_rooms(players):
+    rooms = []
+    for number in range(players // ROOM_SIZE):
+        game = main.WerewolfGame(f'bench{number:05d}', seed=number)
+        for seat in range(ROOM_SIZE):
+            game.add_player(f'p{seat}', f'sid-{number}-{seat}')
+        game.set_custom_roles(ROLES)
+        game.start_game()
+        main.games[game.room_id] = game
+        rooms.append(game)
+    return rooms
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {'median_ms': round(samples[len(samples) // 2], 3), 'max_ms': round(samples[-1], 3)}
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=12000)
+    parser.add_argument('--away', type=float, default=0.01, help='暫離玩家比例')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    transport = main.transport = CountingTransport()
+    rooms = build_rooms(args.players)
+    players = [(game, pid) for game in rooms for pid in game.players]
+    results = {'rooms': len(rooms), 'players': len(players)}
+
+    def refresh():
+        now = time.monotonic()
+        for game, pid in players:
+            game.mark_seen(pid, now)
+
+    # 全部在線：每房間只做一次 min
+    refresh()
+    results['all_present'] = timed(main.sweep_presence, args.repeat)
+    # 部分暫離：第一次巡檢要標記、代為確認並廣播，之後每次只重新比對有人暫離的房間
+    stale = time.monotonic() - main.AWAY_AFTER - 1
+    step = max(int(1 / args.away), 1) if args.away else 0
+    for game, pid in players[::step] if step else []:
+        game.last_seen[game.players[pid]['seat']] = stale
+    transport.emits = 0
+    results['first_away_sweep'] = timed(main.sweep_presence, 1)
+    results['first_away_sweep'].update(away=main.presence_stats['away'], broadcasts=transport.emits)
+    results['steady_away'] = timed(main.sweep_presence, args.repeat)
+    # 心跳本身：兩次查表加一次陣列寫入
+    game, pid = players[len(players) // 2]
+    sid, payload = game.players[pid]['socket_id'], {'room_id': game.room_id, 'player_id': pid}
+    started = time.perf_counter()
+    for _ in range(100000):
+        main.handle_heartbeat(sid, payload)
+    results['heartbeat_us'] = round((time.perf_counter() - started) / 100000 * 1e6, 3)
+    print(results)
+
+
+if __name__ == '__main__':
+    run()
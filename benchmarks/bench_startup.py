@@ -0,0 +1,146 @@
+# 量測冷啟動：匯入 main 的時間、行程啟動到 /healthz 與 /readyz 回 200 的時間，以及就緒後第一個頁面與第一個事件的延遲
+# 可先放入交接快照(--handoff-rooms)與積分資料(--profiles)，量接手房間與載入資料對就緒時間的影響
+# 用法: python benchmarks/bench_startup.py [--runs 5] [--modes eventlet,asgi] [--handoff-rooms 500] [--profiles 100000]
+# 需要 aiohttp(python-socketio 的 asyncio 客戶端)
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {'eventlet': 'main.py', 'asgi': 'asgi.py'}
+IMPORTS = {'eventlet': 'main', 'asgi': 'asgi'}
+ROLES = [{'role': 'villager', 'count': 3}, {'role': 'werewolf', 'count': 2}, {'role': 'seer', 'count': 1}]
+
+
+def write_handoff(directory, rooms):
+    # 在另一個行程裡建立對局並存成交接快照，本行程不必載入 main
+    script = f'''
+import json, sys
+sys.path.insert(0, {ROOT!r})
+import main
+snapshot = []
+for number in range({rooms}):
+    game = main.WerewolfGame(f'boot{{number:05d}}', seed=number)
+    for seat in range(6):
+        game.add_player(f'p{{seat}}', None)
+    game.set_custom_roles({ROLES!r})
+    game.start_game()
+    snapshot.append(game.to_dict())
+with open({os.path.join(directory, 'rooms-bench.json')!r}, 'w') as f:
+    json.dump(snapshot, f, ensure_ascii=False)
+'''
+    subprocess.run([sys.executable, '-c', script], check=True, stderr=subprocess.DEVNULL,
+                   env=dict(os.environ, STATS_DIR='', RATINGS_DB='', HANDOFF_DIR=''))
+
+
+def write_profiles(path, count):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE IF NOT EXISTS profiles (
+        profile_id TEXT PRIMARY KEY, name TEXT, rating REAL, games INTEGER, wins INTEGER)''')
+    conn.executemany('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)',
+                     ((f'{i:032x}', f'player{i}', 1500.0 + (i * 7919) % 600 - 300, 10, 5) for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def import_ms(mode):
+    script = f'import time; t = time.perf_counter(); import {IMPORTS[mode]}; print((time.perf_counter() - t) * 1000)'
+    out = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True,
+                         env=dict(os.environ, STATS_DIR='', RATINGS_DB='', HANDOFF_DIR=''))
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def wait_for(url, deadline):
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return time.monotonic()
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.01)
+    raise RuntimeError(f'{url} 沒有在時限內回 200')
+
+
+async def first_event(url):
+    client = socketio.AsyncClient(reconnection=False)
+    created = asyncio.get_running_loop().create_future()
+    client.on('room_created', lambda data: created.done() or created.set_result(data))
+    started = time.perf_counter()
+    await client.connect(url, transports=['websocket'])
+    await client.emit('create_room', {'player_name': 'boot'})
+    await asyncio.wait_for(created, 10)
+    elapsed = (time.perf_counter() - started) * 1000
+    await client.disconnect()
+    return elapsed
+
+
+def boot(mode, port, handoff_rooms, profiles):
+    with socket.socket() as probe:
+        if probe.connect_ex(('127.0.0.1', port)) == 0:
+            raise RuntimeError(f'連接埠 {port} 已被占用，量到的會是別的伺服器')
+    with tempfile.TemporaryDirectory() as workdir:
+        handoff_dir = os.path.join(workdir, 'handoff')
+        os.makedirs(handoff_dir)
+        ratings_db = os.path.join(workdir, 'ratings.sqlite3')
+        if handoff_rooms:
+            write_handoff(handoff_dir, handoff_rooms)
+        if profiles:
+            write_profiles(ratings_db, profiles)
+        env = dict(os.environ, PORT=str(port), STATS_DIR='', RATINGS_DB=ratings_db, HANDOFF_DIR=handoff_dir,
+                   IP_RATE_MULTIPLIER='1000000')
+        base = f'http://127.0.0.1:{port}'
+        started = time.monotonic()
+        proc = subprocess.Popen([sys.executable, SERVERS[mode]], cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = started + 60
+            live = wait_for(base + '/healthz', deadline)
+            ready = wait_for(base + '/readyz', deadline)
+            rooms = json.loads(urllib.request.urlopen(base + '/readyz', timeout=1).read())['rooms']
+            page_started = time.perf_counter()
+            urllib.request.urlopen(base + '/', timeout=10).read()
+            first_page = (time.perf_counter() - page_started) * 1000
+            event = asyncio.run(first_event(base))
+        finally:
+            proc.kill()  # SIGTERM 會進入排空模式，量測結束直接停掉
+            proc.wait()
+    return {
+        'live_ms': (live - started) * 1000,
+        'ready_ms': (ready - started) * 1000,
+        'first_page_ms': first_page,
+        'first_event_ms': event,
+        'rooms': rooms
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--modes', default='eventlet,asgi')
+    parser.add_argument('--handoff-rooms', type=int, default=0, help='啟動前放入交接目錄的房間數')
+    parser.add_argument('--profiles', type=int, default=0, help='啟動前寫入積分資料庫的玩家數')
+    parser.add_argument('--port', type=int, default=5097)
+    args = parser.parse_args()
+    for mode in args.modes.split(','):
+        imports = [import_ms(mode) for _ in range(args.runs)]
+        boots = [boot(mode, args.port, args.handoff_rooms, args.profiles) for _ in range(args.runs)]
+        result = {'mode': mode, 'runs': args.runs, 'import_ms': round(statistics.median(imports), 1)}
+        for key in ('live_ms', 'ready_ms', 'first_page_ms', 'first_event_ms'):
+            result[key] = round(statistics.median(run[key] for run in boots), 1)
+        result['restored_rooms'] = boots[-1]['rooms']
+        print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
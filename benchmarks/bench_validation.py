@@ -0,0 +1,39 @@
+# 比較預編譯格式檢查與舊的 KeyError 例外路徑的成本
+# 用法: python benchmarks/bench_validation.py
+import os
+import sys
+import timeit
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import EVENT_VALIDATORS  # noqa: E402
+
+validate = EVENT_VALIDATORS['night_action']
+bad_payload = {'room_id': 'abcd1234', 'action_type': 'kill'}
+good_payload = {'room_id': 'abcd1234', 'player_id': 'p' * 36, 'action_type': 'kill', 'target_id': 't' * 36}
+
+
+def legacy_handler(data):
+    room_id = data['room_id']
+    player_id = data['player_id']
+    return room_id, player_id
+
+
+def legacy_path():
+    # Socket.IO 伺服器遇到例外時會記錄完整 traceback
+    try:
+        legacy_handler(bad_payload)
+    except KeyError:
+        traceback.format_exc()
+
+
+if __name__ == '__main__':
+    n = 100000
+    for name, fn in [
+        ('validator (bad payload)', lambda: validate(bad_payload)),
+        ('validator (good payload)', lambda: validate(good_payload)),
+        ('KeyError + traceback', legacy_path),
+    ]:
+        seconds = timeit.timeit(fn, number=n)
+        print(f"{name:28s} {seconds / n * 1e6:8.2f} µs/call")
@@ -0,0 +1,219 @@
+# 長時間浸泡測試：持續建房、加入、打到遊戲結束再斷線，定期取樣伺服器的記憶體、物件數、房間數與處理延遲，
+# 暖機後的成長超過門檻即以非零狀態結束
+# 用法: python benchmarks/soak.py [--duration 3600] [--workers 20] [--interval 30] [--url http://host:port --admin-token ...]
+# 需要 aiohttp(python-socketio 的 asyncio 客戶端)；未指定 --url 時自行啟動本機伺服器
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_modes import start_server  # noqa: E402
+
+ROLES = [{'role': 'villager', 'count': 3}, {'role': 'werewolf', 'count': 2}, {'role': 'seer', 'count': 1}]
+BOTS = 4  # 每局兩個真人加四個機器人
+CONFIRM_EVENTS = {'night': 'night_confirm', 'day': 'day_confirm', 'voting': 'vote_confirm'}
+
+
+class Player:
+    # 每個階段一到就確認，死了就不動，直到遊戲結束
+    def __init__(self):
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.room_id = None
+        self.player_id = None
+        self.ended = asyncio.Event()
+        self.seated = asyncio.get_running_loop().create_future()
+        for event in ('room_created', 'joined_room'):
+            self.client.on(event, self.on_seated)
+        for event in ('role_assigned', 'phase_changed'):
+            self.client.on(event, self.on_state)
+        self.client.on('error', self.on_error)
+
+    def on_seated(self, data):
+        self.room_id, self.player_id = data['room_id'], data['player_id']
+        if not self.seated.done():
+            self.seated.set_result(data)
+
+    def on_error(self, data):
+        if not self.seated.done():
+            self.seated.set_exception(RuntimeError(data['message']))
+
+    async def on_state(self, data):
+        state = data['game_state']
+        if state['game_state'] == 'ended':
+            self.ended.set()
+            return
+        me = next((p for p in state['players'] if p['id'] == self.player_id), None)
+        event = CONFIRM_EVENTS.get(state['game_state'])
+        if me and me['alive'] and event:
+            await self.client.emit(event, {'room_id': self.room_id, 'player_id': self.player_id})
+
+    def payload(self, **extra):
+        return dict(room_id=self.room_id, player_id=self.player_id, **extra)
+
+
+async def play_game(url, timeout):
+    host, guest = Player(), Player()
+    try:
+        await host.client.connect(url, transports=['websocket'])
+        await guest.client.connect(url, transports=['websocket'])
+        await host.client.emit('create_room', {'player_name': 'soak-host'})
+        await asyncio.wait_for(host.seated, timeout)
+        await guest.client.emit('join_room', {'player_name': 'soak-guest', 'room_id': host.room_id})
+        await asyncio.wait_for(guest.seated, timeout)
+        await host.client.emit('add_bot', host.payload(count=BOTS))
+        await host.client.emit('set_roles', host.payload(roles=ROLES))
+        await host.client.emit('start_game', host.payload())
+        await asyncio.wait_for(host.ended.wait(), timeout)
+    finally:
+        await asyncio.gather(host.client.disconnect(), guest.client.disconnect(), return_exceptions=True)
+
+
+async def churn(url, deadline, timeout, results):
+    while time.monotonic() < deadline:
+        try:
+            await play_game(url, timeout)
+            results['games'] += 1
+        except Exception as exc:
+            results['failures'] += 1
+            results['last_error'] = repr(exc)
+            await asyncio.sleep(1)
+
+
+class Monitor:
+    # 透過管理命名空間取樣：stats 由伺服器定期推送，每次收到再要一份記憶體報告
+    def __init__(self, url, token):
+        self.url = url
+        self.token = token
+        self.client = socketio.AsyncClient()
+        self.samples = []
+        self.stats = None
+        self.started = time.monotonic()
+        self.client.on('stats', self.on_stats, namespace='/admin')
+        self.client.on('memory_report', self.on_memory, namespace='/admin')
+
+    async def start(self):
+        await self.client.connect(self.url, namespaces=['/admin'], auth={'admin_token': self.token},
+                                  transports=['websocket'])
+
+    async def on_stats(self, stats):
+        self.stats = stats
+        await self.client.emit('memory_report', {'limit': 1}, namespace='/admin')
+
+    def on_memory(self, report):
+        if self.stats is None:
+            return
+        latency = self.stats['latency_ms']
+        busy = [summary['p95'] for summary in latency.values() if summary['count'] >= 10]
+        sample = {
+            't': round(time.monotonic() - self.started, 1),
+            'rss_mb': report['rss_mb'],
+            'objects': report['objects'],
+            'rooms': report['room_count'],
+            'room_kb': round(report['room_bytes'] / 1024, 1),
+            'connections': self.stats['connections'],
+            'events_per_sec': self.stats['events_per_sec'],
+            'p95_ms': round(max(busy), 2) if busy else None
+        }
+        self.samples.append(sample)
+        self.stats = None
+        print(json.dumps(sample), flush=True)
+
+    async def final_report(self):
+        future = asyncio.get_running_loop().create_future()
+        self.client.on('memory_report', lambda report: future.done() or future.set_result(report), namespace='/admin')
+        await self.client.emit('memory_report', {'limit': 5}, namespace='/admin')
+        return await asyncio.wait_for(future, 30)
+
+
+def check_drift(samples, warmup, args):
+    # 暖機後第一個樣本當基準，與最後三個樣本的中位數比較
+    steady = [s for s in samples if s['t'] >= warmup]
+    if len(steady) < 4:
+        return ['樣本太少，無法判斷（延長 --duration 或縮短 --interval）']
+    base, tail = steady[0], steady[-3:]
+    problems = []
+    rss_growth = statistics.median(s['rss_mb'] for s in tail) - base['rss_mb']
+    if rss_growth > args.max_rss_growth:
+        problems.append(f"RSS 成長 {rss_growth:.1f} MB，超過 {args.max_rss_growth} MB")
+    object_growth = statistics.median(s['objects'] for s in tail) / base['objects'] - 1
+    if object_growth > args.max_object_growth:
+        problems.append(f"物件數成長 {object_growth:.0%}，超過 {args.max_object_growth:.0%}")
+    quarter = max(len(steady) // 4, 1)
+    head_p95 = [s['p95_ms'] for s in steady[:quarter] if s['p95_ms'] is not None]
+    tail_p95 = [s['p95_ms'] for s in steady[-quarter:] if s['p95_ms'] is not None]
+    if head_p95 and tail_p95:
+        before, after = statistics.median(head_p95), statistics.median(tail_p95)
+        # 絕對差距太小時不算，避免毫秒以下的雜訊觸發
+        if after > before * args.max_latency_drift and after - before > 5:
+            problems.append(f"p95 延遲由 {before:.1f} ms 升到 {after:.1f} ms")
+    return problems
+
+
+async def soak(args):
+    proc = None
+    url, token = args.url, args.admin_token
+    if not url:
+        token = token or 'soak'
+        proc = start_server(args.mode, args.port, {
+            'ADMIN_TOKEN': token,
+            'ADMIN_PUSH_INTERVAL': str(args.interval),
+            'BOT_THINK_TIME': str(args.bot_think_time)
+        })
+        url = f'http://127.0.0.1:{args.port}'
+    try:
+        monitor = Monitor(url, token)
+        await monitor.start()
+        results = {'games': 0, 'failures': 0, 'last_error': None}
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*(churn(url, deadline, args.game_timeout, results) for _ in range(args.workers)))
+        samples = list(monitor.samples)  # 只比較對局進行中的樣本
+        # 所有客戶端都斷線後，房間應該全部回收
+        await asyncio.sleep(max(args.interval, 3))
+        final = await monitor.final_report()
+        await monitor.client.disconnect()
+    finally:
+        if proc:
+            proc.kill()
+            proc.wait()
+    problems = check_drift(samples, args.warmup, args)
+    if final['room_count']:
+        problems.append(f"所有玩家離線後仍有 {final['room_count']} 個房間：{[r['room_id'] for r in final['rooms']]}")
+    total = results['games'] + results['failures']
+    if total and results['failures'] / total > args.max_failure_rate:
+        problems.append(f"{results['failures']}/{total} 局失敗，最後錯誤：{results['last_error']}")
+    print(json.dumps({'games': results['games'], 'failures': results['failures'], 'problems': problems},
+                     ensure_ascii=False))
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=3600, help='持續秒數')
+    parser.add_argument('--workers', type=int, default=20, help='同時進行的對局數')
+    parser.add_argument('--interval', type=float, default=30, help='取樣間隔(秒)')
+    parser.add_argument('--warmup', type=float, default=120, help='這段時間內的樣本不列入基準')
+    parser.add_argument('--game-timeout', type=float, default=120)
+    parser.add_argument('--bot-think-time', type=float, default=0.05)
+    parser.add_argument('--max-rss-growth', type=float, default=50, help='MB')
+    parser.add_argument('--max-object-growth', type=float, default=0.2, help='比例')
+    parser.add_argument('--max-latency-drift', type=float, default=3.0, help='倍數')
+    parser.add_argument('--max-failure-rate', type=float, default=0.01)
+    parser.add_argument('--mode', choices=('eventlet', 'asgi'), default='eventlet')
+    parser.add_argument('--port', type=int, default=5098)
+    parser.add_argument('--url', help='改測已在執行的伺服器')
+    parser.add_argument('--admin-token', default=os.environ.get('ADMIN_TOKEN'))
+    args = parser.parse_args()
+    if args.url and not args.admin_token:
+        parser.error('測外部伺服器需要 --admin-token 或 ADMIN_TOKEN')
+    sys.exit(0 if asyncio.run(soak(args)) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+let socket = null;
+let tracing = false;
+
+function connectAdmin() {
+    const token = document.getElementById('admin-token').value;
+    if (!token) { alert('請輸入管理員權杖'); return; }
+    if (socket) socket.disconnect();
+    socket = io('/admin', { auth: { admin_token: token } });
+    socket.on('connect', function() {
+        document.getElementById('admin-login').classList.add('hidden');
+        document.getElementById('dashboard').classList.remove('hidden');
+    });
+    socket.on('connect_error', function() {
+        alert('無法連線，請確認管理員權杖');
+        socket.disconnect();
+    });
+    socket.on('stats', renderStats);
+    socket.on('room_detail', function(data) {
+        document.getElementById('room-detail').textContent = JSON.stringify(data, null, 2);
+    });
+    socket.on('memory_report', renderMemory);
+    socket.on('memory_trace', function(data) {
+        tracing = data.tracing;
+        document.getElementById('trace-toggle').textContent = tracing ? '停止 tracemalloc' : '開始 tracemalloc';
+    });
+    socket.on('error', function(data) {
+        document.getElementById('room-detail').textContent = data.message;
+    });
+}
+function requestRoom() {
+    const roomId = document.getElementById('detail-room-id').value.trim();
+    if (socket && roomId) socket.emit('room_detail', { room_id: roomId });
+}
+function renderStats(stats) {
+    document.getElementById('stat-connections').textContent = stats.connections;
+    document.getElementById('stat-rooms').textContent = stats.room_count;
+    document.getElementById('stat-events').textContent = stats.events_per_sec;
+    document.getElementById('stat-rss').textContent = stats.rss_mb;
+    document.getElementById('stat-offload').textContent = stats.offload.pending;
+    document.getElementById('stat-rejections').textContent =
+        Object.values(stats.schema_rejections).reduce((a, b) => a + b, 0);
+    document.getElementById('stat-log').textContent = stats.log.enabled ? `${stats.log.queued}/${stats.log.dropped}` : '未啟用';
+    document.getElementById('stat-presence').textContent = `${stats.presence.away}/${stats.presence.players}（巡檢 ${stats.presence.sweep_ms} ms）`;
+    document.getElementById('stat-draining').textContent = stats.draining ? '排空中' : '';
+    document.getElementById('room-states').textContent =
+        Object.entries(stats.rooms).map(([state, count]) => `${state}: ${count}`).join(' | ') || '沒有房間';
+    const rows = Object.entries(stats.latency_ms).sort((a, b) => b[1].p95 - a[1].p95).map(([event, l]) => {
+        const row = document.createElement('tr');
+        [event, l.count, l.p50, l.p95, l.p99, l.max].forEach(value => {
+            const cell = document.createElement('td');
+            cell.textContent = typeof value === 'number' && !Number.isInteger(value) ? value.toFixed(2) : value;
+            row.appendChild(cell);
+        });
+        return row;
+    });
+    document.getElementById('latency').replaceChildren(...rows);
+}
+function requestMemory() {
+    if (socket) socket.emit('memory_report', {});
+}
+function toggleTrace() {
+    if (socket) socket.emit('memory_trace', { frames: tracing ? 0 : 1 });
+}
+function tableRows(items, columns) {
+    return items.map(item => {
+        const row = document.createElement('tr');
+        columns(item).forEach(value => {
+            const cell = document.createElement('td');
+            cell.textContent = value;
+            row.appendChild(cell);
+        });
+        return row;
+    });
+}
+function renderMemory(report) {
+    tracing = report.tracing;
+    const fields = Object.entries(report.field_bytes).slice(0, 5)
+        .map(([field, bytes]) => `${field} ${(bytes / 1024).toFixed(1)} KB`).join(' | ');
+    document.getElementById('memory-summary').textContent =
+        `${report.room_count} 個房間共 ${(report.room_bytes / 1024).toFixed(1)} KB（RSS ${report.rss_mb} MB）：${fields}`;
+    document.getElementById('memory-rooms').replaceChildren(...tableRows(report.rooms, room =>
+        [room.room_id, room.game_state, `${room.connected}/${room.players}`, room.game_log_lines, (room.bytes / 1024).toFixed(1)]));
+    const sites = report.trace ? report.trace.sites : [];
+    document.getElementById('memory-sites').replaceChildren(...tableRows(sites, site =>
+        [site.site, site.size_kb, site.size_diff_kb, site.count, site.count_diff]));
+}
@@ -0,0 +1,683 @@
+const socket = io();
+let currentRoomId = null;
+let currentPlayerId = null;
+let isHost = false;
+let myRole = null;
+let gameState = null;
+let witchKilledId = null;
+let isSpectator = false;
+let profileId = localStorage.getItem('werewolf_profile_id');
+let resumeToken = null;
+let pendingResume = null;  // 伺服器移轉後等待接回的座位
+
+// 角色配置更新；角色清單與預設組合由伺服器的 role_catalog 提供
+let roleCatalog = null;
+function roleInputs() {
+    return document.querySelectorAll('#role-config input[type="number"]');
+}
+function updateRoleCount() {
+    let total = 0;
+    roleInputs().forEach(input => { total += parseInt(input.value) || 0; });
+    document.getElementById('total-roles').textContent = total;
+}
+function renderRoleCatalog(catalog) {
+    roleCatalog = catalog;
+    const container = document.getElementById('role-config');
+    const counts = {};
+    roleInputs().forEach(input => { counts[input.id.slice(0, -'-count'.length)] = input.value; });
+    container.innerHTML = '';
+    catalog.roles.forEach(role => {
+        const row = document.createElement('div');
+        row.className = 'role-config';
+        row.title = role.description;
+        const label = document.createElement('label');
+        label.textContent = role.name + ':';
+        const input = document.createElement('input');
+        input.type = 'number';
+        input.id = role.role + '-count';
+        input.min = 0;
+        input.max = catalog.max_total;
+        input.value = counts[role.role] || 0;
+        input.addEventListener('change', updateRoleCount);
+        row.append(label, input);
+        container.appendChild(row);
+    });
+    const select = document.getElementById('preset-select');
+    select.innerHTML = '<option value="">選擇預設組合</option>';
+    catalog.presets.forEach(preset => {
+        const option = document.createElement('option');
+        option.value = preset.preset_id;
+        option.textContent = `${preset.name}（${preset.stats.players}人）`;
+        select.appendChild(option);
+    });
+    updateRoleCount();
+}
+function formatBalance(stats) {
+    const lean = stats.balance > 0.05 ? '偏好人' : stats.balance < -0.05 ? '偏狼人' : '均勢';
+    return `${stats.players}人，狼人${stats.wolves}名，神職${stats.specials}名，平衡 ${stats.balance}（${lean}）`;
+}
+document.addEventListener('DOMContentLoaded', function() {
+    const roleInputs = document.querySelectorAll('#role-config input[type="number"]');
+    roleInputs.forEach(input => {
+        input.addEventListener('change', updateRoleCount);
+    });
+    updateRoleCount();
+});
+function createRoom() {
+    const playerName = document.getElementById('player-name').value.trim();
+    if (!playerName) { showToast('請輸入玩家名字', 'error'); return; }
+    socket.emit('create_room', { player_name: playerName, profile_id: profileId });
+}
+function joinRoom() {
+    const playerName = document.getElementById('player-name').value.trim();
+    const roomId = document.getElementById('room-id').value.trim();
+    if (!playerName || !roomId) { showToast('請輸入玩家名字和房間ID', 'error'); return; }
+    socket.emit('join_room', { player_name: playerName, room_id: roomId, profile_id: profileId });
+}
+function rememberProfile(id) {
+    if (!id) return;
+    profileId = id;
+    localStorage.setItem('werewolf_profile_id', id);
+}
+function joinTournament() {
+    const playerName = document.getElementById('player-name').value.trim();
+    const tournamentId = document.getElementById('room-id').value.trim();
+    if (!playerName || !tournamentId) { showToast('請輸入玩家名字和錦標賽ID（填在房間ID欄）', 'error'); return; }
+    socket.emit('join_tournament', { player_name: playerName, tournament_id: tournamentId, profile_id: profileId });
+}
+socket.on('tournament_joined', function(data) {
+    rememberProfile(data.profile_id);
+    document.getElementById('login-screen').classList.add('hidden');
+    document.getElementById('tournament').classList.remove('hidden');
+});
+// 每輪由伺服器分桌開局，換桌時清掉上一桌的畫面
+socket.on('tournament_table', function(data) {
+    currentRoomId = data.room_id;
+    currentPlayerId = data.player_id;
+    resumeToken = data.resume_token;
+    playerCards.forEach(entry => entry.el.remove());
+    playerCards.clear();
+    renderedLog = [];
+    document.getElementById('game-log').textContent = '';
+    showToast(`第 ${data.round} 輪：房間 ${data.room_id}`);
+});
+socket.on('tournament_standings', function(data) {
+    const stateText = { registering: '報名中', playing: '比賽中', between_rounds: '準備下一輪', finished: '已結束' };
+    document.getElementById('tournament-name').textContent = data.name;
+    document.getElementById('tournament-status').textContent =
+        `${stateText[data.state] || data.state}｜第 ${data.round}/${data.rounds} 輪｜進行中 ${data.tables_playing}/${data.tables} 桌`;
+    const list = document.getElementById('tournament-standings');
+    const fragment = document.createDocumentFragment();
+    data.standings.forEach(entry => {
+        const item = document.createElement('li');
+        item.textContent = `${entry.name}：${entry.points} 分（${entry.wins}/${entry.games} 勝）`;
+        fragment.appendChild(item);
+    });
+    list.textContent = '';
+    list.appendChild(fragment);
+});
+function showLeaderboard() {
+    socket.emit('get_leaderboard', { limit: 20 });
+}
+socket.on('leaderboard', function(data) {
+    const list = document.getElementById('leaderboard');
+    list.innerHTML = '';
+    data.top.forEach(entry => {
+        const item = document.createElement('li');
+        item.textContent = `${entry.name}：${entry.rating}（${entry.wins}/${entry.games} 勝）`;
+        list.appendChild(item);
+    });
+    list.classList.remove('hidden');
+});
+function spectateRoom() {
+    const playerName = document.getElementById('player-name').value.trim();
+    const roomId = document.getElementById('room-id').value.trim();
+    if (!roomId) { showToast('請輸入房間ID', 'error'); return; }
+    socket.emit('spectate_room', { spectator_name: playerName, room_id: roomId });
+}
+function updateRoles() {
+    const roles = [];
+    roleInputs().forEach(input => {
+        const count = parseInt(input.value) || 0;
+        if (count > 0) { roles.push({ role: input.id.slice(0, -'-count'.length), count: count }); }
+    });
+    socket.emit('set_roles', { room_id: currentRoomId, player_id: currentPlayerId, roles: roles });
+}
+function applyPreset() {
+    const presetId = document.getElementById('preset-select').value;
+    if (!presetId) { showToast('請選擇預設組合', 'error'); return; }
+    socket.emit('apply_preset', { room_id: currentRoomId, player_id: currentPlayerId, preset_id: presetId });
+}
+// 機器人補位，真人在開局前加入會頂替機器人
+function addBot() {
+    socket.emit('add_bot', { room_id: currentRoomId, player_id: currentPlayerId });
+}
+function startGame() {
+    socket.emit('start_game', { room_id: currentRoomId, player_id: currentPlayerId });
+}
+function confirmNightAction() {
+    const actionType = document.querySelector('#night-buttons .btn.selected')?.dataset.action;
+    const target = document.getElementById('night-target').value;
+    const additionalTarget = document.getElementById('additional-target').value;
+    if (!actionType) { showToast('請選擇行動類型', 'error'); return; }
+    if (!target && actionType !== 'peek') { showToast('請選擇目標', 'error'); return; }
+    socket.emit('night_action', {
+        room_id: currentRoomId,
+        player_id: currentPlayerId,
+        action_type: actionType,
+        target_id: target || null,
+        additional_target: additionalTarget || null
+    });
+}
+function nightConfirm() {
+    socket.emit('night_confirm', { room_id: currentRoomId, player_id: currentPlayerId });
+    document.getElementById('night-confirm-btn').classList.add('hidden');
+}
+function confirmDayAction() {
+    const actionType = document.querySelector('#day-buttons .btn.selected')?.dataset.action;
+    const target = document.getElementById('day-target').value;
+    if (!actionType || !target) { showToast('請選擇行動類型和目標', 'error'); return; }
+    socket.emit('day_action', {
+        room_id: currentRoomId,
+        player_id: currentPlayerId,
+        action_type: actionType,
+        target_id: target
+    });
+}
+function dayConfirm() {
+    socket.emit('day_confirm', { room_id: currentRoomId, player_id: currentPlayerId });
+    document.getElementById('day-confirm-btn').classList.add('hidden');
+}
+// 狼人聊天室
+function sendWolfMessage() {
+    const msg = document.getElementById('wolf-chat-input').value.trim();
+    if (!msg) return;
+    socket.emit('wolf_night_chat', {
+        room_id: currentRoomId,
+        player_id: currentPlayerId,
+        message: msg
+    });
+    document.getElementById('wolf-chat-input').value = '';
+}
+function appendWolfMessages(messages) {
+    const box = document.getElementById('wolf-chat-messages');
+    const fragment = document.createDocumentFragment();
+    messages.forEach(data => {
+        const msgDiv = document.createElement('div');
+        msgDiv.textContent = `${data.player_name}: ${data.message}`;
+        fragment.appendChild(msgDiv);
+    });
+    box.appendChild(fragment);
+    while (box.childElementCount > 200) box.removeChild(box.firstChild);
+    box.scrollTop = box.scrollHeight;
+}
+socket.on('wolf_night_message', function(data) { appendWolfMessages([data]); });
+socket.on('wolf_night_messages', function(data) { appendWolfMessages(data.messages); });
+socket.on('wolf_chat_history', function(data) {
+    document.getElementById('wolf-chat-messages').innerHTML = '';
+    appendWolfMessages(data.messages);
+});
+// 狼王報復彈窗
+function showWolfKingRevengeSelector(alivePlayers) {
+    const selector = document.createElement('select');
+    selector.innerHTML = '<option value="">選擇要帶走的玩家</option>';
+    alivePlayers.forEach(player => {
+        if (player.id !== currentPlayerId) {
+            selector.innerHTML += `<option value="${player.id}">${player.name}</option>`;
+        }
+    });
+    const btn = document.createElement('button');
+    btn.textContent = '確定帶走';
+    btn.className = 'btn btn-danger';
+    btn.onclick = function() {
+        const val = selector.value;
+        if (!val) { showToast('請選擇玩家', 'error'); return; }
+        socket.emit('wolf_king_revenge', {
+            room_id: currentRoomId,
+            target_id: val
+        });
+        document.body.removeChild(document.getElementById('wolfking-revenge-modal'));
+    };
+    const modal = document.createElement('div');
+    modal.id = 'wolfking-revenge-modal';
+    modal.style = 'position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.7);display:flex;align-items:center;justify-content:center;z-index:10000;';
+    modal.innerHTML = `<div style="background:#333;color:#fff;padding:40px;border-radius:12px;text-align:center;">
+        <h2>你是狼王，請選擇要帶走的人</h2>
+    </div>`;
+    modal.querySelector('div').appendChild(selector);
+    modal.querySelector('div').appendChild(document.createElement('br'));
+    modal.querySelector('div').appendChild(btn);
+    document.body.appendChild(modal);
+}
+function vote() {
+    const target = document.getElementById('vote-target').value;
+    if (!target) { showToast('請選擇投票目標', 'error'); return; }
+    socket.emit('vote', { room_id: currentRoomId, player_id: currentPlayerId, target_id: target });
+}
+function voteConfirm() {
+    socket.emit('vote_confirm', { room_id: currentRoomId, player_id: currentPlayerId });
+    document.getElementById('vote-confirm-btn').classList.add('hidden');
+}
+// 玩家卡片以 id 為鍵保留，只改動內容有變的卡片
+const playerCards = new Map();  // player_id -> { el, key }
+function playerCardKey(player) {
+    return [player.name, player.bot, player.alive, player.role, player.team, player.can_vote, player.away].join('|');
+}
+function fillPlayerCard(card, player) {
+    card.className = `player-card ${player.alive ? 'player-alive' : 'player-dead'}${player.away ? ' player-away' : ''}`;
+    card.textContent = '';
+    const name = document.createElement('strong');
+    name.textContent = player.name;
+    card.appendChild(name);
+    const lines = [];
+    if (player.bot) card.appendChild(document.createTextNode(' (機器人)'));
+    if (player.role) lines.push(`${player.role} (${player.team})`);
+    lines.push(player.alive ? '存活' : '死亡');
+    if (!player.can_vote && player.alive) lines.push('無投票權');
+    if (player.away) lines.push('暫離');
+    lines.forEach(text => {
+        card.appendChild(document.createElement('br'));
+        const line = document.createElement('small');
+        line.textContent = text;
+        card.appendChild(line);
+    });
+}
+function updatePlayersList(players) {
+    const playersContainer = document.getElementById('players-list');
+    const seen = new Set();
+    let previous = null;
+    players.forEach(player => {
+        seen.add(player.id);
+        let entry = playerCards.get(player.id);
+        if (!entry) {
+            entry = { el: document.createElement('div'), key: null };
+            playerCards.set(player.id, entry);
+        }
+        const key = playerCardKey(player);
+        if (entry.key !== key) {
+            fillPlayerCard(entry.el, player);
+            entry.key = key;
+            renderStats.cards++;
+        }
+        // 順序沒變時不移動節點
+        const expected = previous ? previous.nextSibling : playersContainer.firstChild;
+        if (expected !== entry.el) playersContainer.insertBefore(entry.el, expected);
+        previous = entry.el;
+    });
+    playerCards.forEach((entry, id) => {
+        if (!seen.has(id)) {
+            entry.el.remove();
+            playerCards.delete(id);
+            renderStats.cards++;
+        }
+    });
+}
+// 選單內容沒變時整組略過，重建時保留原本的選擇
+function fillSelect(select, placeholder, players) {
+    const key = players.map(p => p.id + ':' + p.name).join(',');
+    if (select.dataset.key === key) return;
+    const selected = select.value;
+    const fragment = document.createDocumentFragment();
+    [{ id: '', name: placeholder }].concat(players).forEach(player => {
+        const option = document.createElement('option');
+        option.value = player.id;
+        option.textContent = player.name;
+        fragment.appendChild(option);
+    });
+    select.textContent = '';
+    select.appendChild(fragment);
+    select.value = players.some(p => p.id === selected) ? selected : '';
+    select.dataset.key = key;
+}
+// 可用行動與目標都由伺服器算好(legal_actions)，這裡只負責畫出來
+const ACTION_LABELS = {
+    night: { kill: '殺人', check: '查驗', protect: '守護', poison: '毒殺', antidote: '解藥', exchange: '交換', peek: '偷看' },
+    day: { duel: '決鬥', self_destruct: '自爆' }
+};
+let legalActions = {};
+let renderedLegal = null;
+function targetOptions(ids) {
+    const names = new Map((gameState ? gameState.players : []).map(p => [p.id, p.name]));
+    return (ids || []).map(id => ({ id: id, name: names.get(id) || id }));
+}
+function updateActionButtons(legal, phase) {
+    const key = `${phase}:${JSON.stringify(legal)}`;
+    if (key === renderedLegal) return;
+    renderedLegal = key;
+    legalActions = legal;
+    const nightButtons = document.getElementById('night-buttons');
+    const dayButtons = document.getElementById('day-buttons');
+    nightButtons.innerHTML = '';
+    dayButtons.innerHTML = '';
+    ['night-target', 'additional-target', 'day-target'].forEach(id => document.getElementById(id).classList.add('hidden'));
+    ['night', 'day'].forEach(period => {
+        const container = period === 'night' ? nightButtons : dayButtons;
+        Object.keys(ACTION_LABELS[period]).forEach(action => {
+            if (action in legal) addActionButton(container, action, ACTION_LABELS[period][action]);
+        });
+    });
+    document.getElementById('confirm-night-action').classList.toggle('hidden', !nightButtons.childElementCount);
+    document.getElementById('confirm-day-action').classList.toggle('hidden', !dayButtons.childElementCount);
+    // 狼人代表制：不是首狼的狼人不能殺人，顯示提示
+    const wolfWithoutKill = phase === 'night' && myRole && myRole.team === 'werewolf' && !('kill' in legal);
+    document.getElementById('not-wolf-leader-tip').classList.toggle('hidden', !wolfWithoutKill);
+    fillSelect(document.getElementById('vote-target'), '選擇投票目標', targetOptions(legal.vote));
+    document.getElementById('vote-btn').classList.toggle('hidden', !('vote' in legal));
+}
+function addActionButton(container, action, text) {
+    const button = document.createElement('button');
+    button.className = 'btn';
+    button.textContent = text;
+    button.dataset.action = action;
+    button.onclick = function() {
+        container.querySelectorAll('.btn').forEach(btn => btn.classList.remove('selected'));
+        this.classList.add('selected');
+        const targets = targetOptions(legalActions[action]);
+        if (container.id === 'night-buttons') {
+            fillSelect(document.getElementById('night-target'), '選擇目標', targets);
+            fillSelect(document.getElementById('additional-target'), '選擇第二個目標', targets);
+            document.getElementById('additional-target').classList.add('hidden');
+        } else {
+            fillSelect(document.getElementById('day-target'), '選擇目標', targets);
+        }
+        if (action === 'exchange') {
+            document.getElementById('night-target').classList.remove('hidden');
+            document.getElementById('additional-target').classList.remove('hidden');
+        } else if (action !== 'peek') {
+            if (container.id === 'night-buttons') {
+                document.getElementById('night-target').classList.remove('hidden');
+            } else {
+                document.getElementById('day-target').classList.remove('hidden');
+            }
+        }
+        if (container.id === 'night-buttons') {
+            document.getElementById('confirm-night-action').classList.remove('hidden');
+        } else {
+            document.getElementById('confirm-day-action').classList.remove('hidden');
+        }
+    };
+    container.appendChild(button);
+}
+// 遊戲記錄只送最後幾行，與上次的尾端對齊後只補新的行
+let renderedLog = [];
+function updateGameLog(lines) {
+    const gameLog = document.getElementById('game-log');
+    let overlap = Math.min(renderedLog.length, lines.length);
+    while (overlap > 0 && renderedLog.slice(-overlap).some((line, i) => line !== lines[i])) overlap--;
+    const fragment = document.createDocumentFragment();
+    lines.slice(overlap).forEach(line => {
+        const div = document.createElement('div');
+        div.textContent = line;
+        fragment.appendChild(div);
+    });
+    renderedLog = lines.slice();
+    if (!fragment.childNodes.length) return;
+    gameLog.appendChild(fragment);
+    while (gameLog.childElementCount > 200) gameLog.removeChild(gameLog.firstChild);
+    gameLog.scrollTop = gameLog.scrollHeight;
+}
+let renderedPhase = null;
+function updateGameState(state) {
+    gameState = state;
+    document.getElementById('current-players').textContent = state.players.length;
+    const phaseIndicator = document.getElementById('phase-indicator');
+    const phaseText = {
+        'waiting': '等待開始',
+        'night': `第${state.day_count}夜`,
+        'day': `第${state.day_count}天`,
+        'voting': '投票階段',
+        'ended': '遊戲結束',
+        'wolf_king_revenge': '狼王報復'
+    };
+    phaseIndicator.textContent = phaseText[state.game_state] || state.game_state;
+    phaseIndicator.className = `phase-indicator ${state.game_state}`;
+    updatePlayersList(state.players);
+    updateGameLog(state.game_log);
+    isHost = state.is_host;
+    // 狼王報復觸發
+    if (state.game_state === "wolf_king_revenge" && state.revenge_waiting && state.revenge_waiting.wolf_king_id === currentPlayerId) {
+        if (!document.getElementById('wolfking-revenge-modal')) {
+            showWolfKingRevengeSelector(state.players.filter(p => p.alive && p.id !== currentPlayerId));
+        }
+    } else if (document.getElementById('wolfking-revenge-modal')) {
+        document.body.removeChild(document.getElementById('wolfking-revenge-modal'));
+    }
+    // 私人狀態(發角色、接回座位)帶著自己的合法行動
+    if (state.legal_actions) updateActionButtons(state.legal_actions, state.game_state);
+    // 以下只在換階段時重設，同一階段內的更新不會把已按下的確認按鈕或女巫資訊蓋掉
+    const phase = `${state.game_state}:${state.day_count}`;
+    if (phase === renderedPhase) return;
+    renderedPhase = phase;
+    document.getElementById('phase-progress').textContent = '';
+    document.getElementById('night-actions').classList.toggle('hidden', state.game_state !== 'night');
+    document.getElementById('day-actions').classList.toggle('hidden', state.game_state !== 'day');
+    document.getElementById('voting-area').classList.toggle('hidden', state.game_state !== 'voting');
+    // 狼人聊天室只在夜晚且自己是狼人可見，記錄跨夜保留
+    document.getElementById('wolf-chat').classList.toggle('hidden', !(state.game_state === 'night' && myRole && myRole.team === 'werewolf'));
+    // 確認按鈕顯示判斷
+    document.getElementById('night-confirm-btn').classList.toggle('hidden', state.game_state !== 'night');
+    document.getElementById('day-confirm-btn').classList.toggle('hidden', state.game_state !== 'day');
+    document.getElementById('vote-confirm-btn').classList.toggle('hidden', state.game_state !== 'voting');
+    // 女巫夜晚資訊顯示重設
+    document.getElementById('witch-night-info').classList.add('hidden');
+    document.getElementById('witch-night-info').textContent = '';
+}
+// 同一個影格內收到的多次狀態只畫最後一次
+let pendingState = null;
+let renderScheduled = false;
+const renderStats = { renders: 0, skipped: 0, cards: 0, last: 0, max: 0, total: 0 };
+function renderState(state) {
+    if (pendingState) renderStats.skipped++;
+    pendingState = state;
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(flushRender);
+}
+function flushRender() {
+    renderScheduled = false;
+    if (!pendingState) return;
+    const state = pendingState;
+    pendingState = null;
+    const started = performance.now();
+    updateGameState(state);
+    const elapsed = performance.now() - started;
+    renderStats.renders++;
+    renderStats.last = elapsed;
+    renderStats.max = Math.max(renderStats.max, elapsed);
+    renderStats.total += elapsed;
+    updateDebugPanel();
+}
+// 除錯面板：網址加上 ?debug=1 開啟，顯示瀏覽器端的渲染耗時
+const debugEnabled = new URLSearchParams(location.search).has('debug');
+function updateDebugPanel() {
+    if (!debugEnabled) return;
+    const panel = document.getElementById('debug-panel');
+    panel.classList.remove('hidden');
+    panel.textContent = `渲染 ${renderStats.renders} 次（合併 ${renderStats.skipped}）` +
+        ` | 上次 ${renderStats.last.toFixed(1)} ms | 平均 ${(renderStats.total / renderStats.renders).toFixed(1)} ms` +
+        ` | 最長 ${renderStats.max.toFixed(1)} ms | 卡片更新 ${renderStats.cards}`;
+}
+// 不阻塞的提示，取代 alert
+function showToast(message, kind) {
+    const container = document.getElementById('toasts');
+    const toast = document.createElement('div');
+    toast.className = `toast ${kind || ''}`;
+    toast.textContent = message;
+    container.appendChild(toast);
+    while (container.childElementCount > 5) container.removeChild(container.firstChild);
+    setTimeout(() => toast.remove(), 3000);
+}
+// 女巫夜晚得知誰被殺
+socket.on('witch_night_info', function(data) {
+    flushRender();  // 先套用同一批送來的換階段狀態，否則會把這裡的資訊重設掉
+    if (data && data.killed_player_id && data.killed_player_name) {
+        document.getElementById('witch-night-info').classList.remove('hidden');
+        document.getElementById('witch-night-info').textContent = `今晚被殺的是：${data.killed_player_name}`;
+        witchKilledId = data.killed_player_id;
+    } else {
+        document.getElementById('witch-night-info').classList.add('hidden');
+        document.getElementById('witch-night-info').textContent = '';
+        witchKilledId = null;
+    }
+});
+socket.on('room_created', function(data) {
+    currentRoomId = data.room_id;
+    currentPlayerId = data.player_id;
+    resumeToken = data.resume_token;
+    rememberProfile(data.profile_id);
+    document.getElementById('current-room-id').textContent = currentRoomId;
+    document.getElementById('login-screen').classList.add('hidden');
+    document.getElementById('room-setup').classList.remove('hidden');
+    document.getElementById('host-controls').classList.remove('hidden');
+    renderState(data.game_state);
+});
+socket.on('joined_room', function(data) {
+    currentRoomId = data.room_id;
+    currentPlayerId = data.player_id;
+    resumeToken = data.resume_token;
+    rememberProfile(data.profile_id);
+    document.getElementById('login-screen').classList.add('hidden');
+    document.getElementById('room-setup').classList.remove('hidden');
+    renderState(data.game_state);
+});
+// 觀戰：延遲的公開狀態，不顯示行動區
+socket.on('spectating', function(data) {
+    isSpectator = true;
+    currentRoomId = data.room_id;
+    document.getElementById('login-screen').classList.add('hidden');
+    document.getElementById('game-screen').classList.remove('hidden');
+    document.getElementById('action-area').classList.add('hidden');
+    document.getElementById('phase-indicator').title = `觀戰延遲 ${data.delay} 秒`;
+    if (data.game_state) renderState(data.game_state);  // 房間還沒有到期的畫面時，等第一個 spectator_update
+});
+socket.on('spectator_update', function(data) { renderState(data.game_state); });
+socket.on('player_joined', function(data) { renderState(data.game_state); });
+socket.on('roles_updated', function(data) {
+    const counts = {};
+    data.roles.forEach(role => { counts[role.role] = role.count; });
+    roleInputs().forEach(input => { input.value = counts[input.id.slice(0, -'-count'.length)] || 0; });
+    document.getElementById('preset-select').value = data.preset_id || '';
+    document.getElementById('role-balance').textContent = formatBalance(data.stats);
+    updateRoleCount();
+    renderState(data.game_state);
+});
+socket.on('role_catalog', renderRoleCatalog);
+function showRole(data) {
+    myRole = data.role_info;
+    document.getElementById('my-role').textContent = myRole.role;
+    document.getElementById('my-team').textContent = myRole.team === 'werewolf' ? '狼人陣營' : '好人陣營';
+    document.getElementById('my-ability').textContent = myRole.description;
+    if (myRole.teammates && myRole.teammates.length > 0) {
+        document.getElementById('teammates').classList.remove('hidden');
+        document.getElementById('teammate-list').textContent = myRole.teammates.map(t => t.name).join(', ');
+    } else {
+        document.getElementById('teammates').classList.add('hidden');
+    }
+    document.getElementById('room-setup').classList.add('hidden');
+    document.getElementById('game-screen').classList.remove('hidden');
+    document.getElementById('role-info').classList.remove('hidden');
+    renderedPhase = null;  // 角色可能換了，行動按鈕要重建
+    renderedLegal = null;
+    renderState(data.game_state);
+}
+socket.on('role_assigned', showRole);
+socket.on('phase_changed', function(data) { renderState(data.game_state); });
+// 換階段後伺服器另外私下送來自己的合法行動；先畫完公開狀態，目標名稱才對得上
+socket.on('legal_actions', function(data) {
+    flushRender();
+    updateActionButtons(data.actions, data.game_state);
+});
+// 大房間的確認/投票進度（伺服器端節流）
+socket.on('phase_progress', function(data) {
+    flushRender();
+    if (!gameState || data.phase !== gameState.game_state) return;
+    let text = `已確認 ${data.confirmed} 人，尚餘 ${data.pending} 人`;
+    if (data.phase === 'voting') text = `已投票 ${data.votes_cast} 人，` + text;
+    document.getElementById('phase-progress').textContent = text;
+});
+socket.on('ratings_updated', function(data) {
+    const gameLog = document.getElementById('game-log');
+    data.forEach(change => {
+        const line = document.createElement('div');
+        line.textContent = `${change.name} 積分 ${change.rating}（${change.delta >= 0 ? '+' : ''}${change.delta}）`;
+        gameLog.appendChild(line);
+    });
+    gameLog.scrollTop = gameLog.scrollHeight;
+});
+// 滾動更新：舊伺服器排空時暫停建房，移轉後帶著 resume_token 連到接手的伺服器接回座位
+socket.on('server_draining', function(data) {
+    const line = document.createElement('div');
+    line.textContent = data.message;
+    document.getElementById('game-log').appendChild(line);
+});
+socket.on('server_migrating', function(data) {
+    if (data.room_id !== currentRoomId || !resumeToken) return;
+    pendingResume = { attempts: 0 };
+    if (data.reconnect_url) socket.io.uri = data.reconnect_url;
+    socket.disconnect();
+    setTimeout(() => socket.connect(), 1000);
+});
+function resumeSession() {
+    socket.emit('resume_session', { room_id: currentRoomId, player_id: currentPlayerId, resume_token: resumeToken });
+}
+socket.on('connect', function() {
+    if (!roleCatalog) socket.emit('get_role_catalog', {});
+    if (pendingResume) resumeSession();
+});
+// 在線狀態：連線後依伺服器給的間隔送心跳，只有入座的玩家需要送
+let heartbeatTimer = null;
+socket.on('presence_config', function(data) {
+    clearInterval(heartbeatTimer);
+    heartbeatTimer = setInterval(function() {
+        if (currentRoomId && currentPlayerId && !isSpectator && !pendingResume) {
+            socket.emit('heartbeat', { room_id: currentRoomId, player_id: currentPlayerId });
+        }
+    }, data.heartbeat_interval * 1000);
+});
+socket.on('presence_changed', function(data) { renderState(data.game_state); });
+socket.on('resume_failed', function(data) {
+    if (pendingResume && data.retry && ++pendingResume.attempts < 15) {
+        setTimeout(resumeSession, 2000);
+        return;
+    }
+    pendingResume = null;
+    showToast('錯誤：' + data.message, 'error');
+});
+socket.on('session_resumed', function(data) {
+    pendingResume = null;
+    if (data.role_info) {
+        showRole(data);
+    } else {
+        renderState(data.game_state);
+    }
+});
+socket.on('check_result', function(data) {
+    showToast(`查驗結果：${data.target_name} 是 ${data.result}`);
+});
+socket.on('day_action_result', function(data) {
+    showToast(data.message);
+    renderState(data.game_state);
+});
+socket.on('action_result', function(data) {
+    if (data.success) {
+        showToast('行動成功：' + data.message, 'success');
+        document.querySelectorAll('#night-buttons .btn, #day-buttons .btn').forEach(btn => btn.classList.remove('selected'));
+        document.getElementById('night-target').classList.add('hidden');
+        document.getElementById('additional-target').classList.add('hidden');
+        document.getElementById('day-target').classList.add('hidden');
+        document.getElementById('confirm-night-action').classList.add('hidden');
+        document.getElementById('confirm-day-action').classList.add('hidden');
+    } else {
+        showToast('行動失敗：' + data.message, 'error');
+    }
+});
+socket.on('vote_result', function(data) {
+    if (data.success) { showToast('投票成功', 'success'); }
+    else { showToast('投票失敗：' + data.message, 'error'); }
+});
+socket.on('error', function(data) {
+    showToast('錯誤：' + data.message, 'error');
+});
+const style = document.createElement('style');
+style.textContent = `.btn.selected { background: #ff6b6b !important; transform: scale(1.05); }`;
+document.head.appendChild(style);
@@ -0,0 +1,128 @@
+# 結構化日誌：每筆一行 JSON，事件迴圈只負責入列，由背景執行緒批次寫出
+# 佇列滿時直接丟棄並計數，寫檔變慢也不會卡住事件迴圈
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'level': record.levelname, 'logger': record.name}
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        else:
+            entry['msg'] = record.getMessage()
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchWriter(threading.Thread):
+    # 取到第一筆後，在 flush_interval 內盡量湊滿 batch_size 筆再一次寫出
+    def __init__(self, log_queue, stream, batch_size, flush_interval):
+        super().__init__(name='event-log-writer', daemon=True)
+        self.queue = log_queue
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.formatter = JsonLinesFormatter()
+        self.written = 0
+        self.batches = 0
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            record = self.queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            self.stream.write(''.join(self.formatter.format(record) + '\n' for record in batch))
+            self.stream.flush()
+            self.written += len(batch)
+            self.batches += 1
+
+
+class EventLog:
+    def __init__(self):
+        self.enabled = False
+        self.logger = logging.getLogger('werewolf.events')
+        self.sample_rates = {}
+        self.sampler = random.Random()  # 不能用房間的亂數產生器，抽樣會改變對局結果
+        self.handler = None
+        self.writer = None
+
+    def start(self, path, level, sample_rates, batch_size, flush_interval, queue_size):
+        stream = open(path, 'a', encoding='utf-8') if path else sys.stdout
+        log_queue = queue.Queue(queue_size)
+        self.handler = DroppingQueueHandler(log_queue)
+        # 其他 logger(含 app.logger)也走同一條佇列，輸出都是 JSON lines
+        root = logging.getLogger()
+        root.addHandler(self.handler)
+        root.setLevel(level)
+        self.writer = BatchWriter(log_queue, stream, batch_size, flush_interval)
+        self.writer.start()
+        self.sample_rates = sample_rates
+        self.enabled = True
+
+    def event(self, kind, sample_key=None, level=logging.INFO, **fields):
+        if not self.enabled:
+            return
+        rate = self.sample_rates.get(sample_key or kind, 1.0)
+        if rate < 1.0:
+            if self.sampler.random() >= rate:
+                return
+            fields['sample_rate'] = rate  # 統計時以 1/rate 加權還原
+        fields['kind'] = kind
+        self.logger.log(level, kind, extra={'fields': fields})
+
+    def stop(self, timeout=2.0):
+        # 結束行程前呼叫，把佇列裡剩下的寫完
+        if not self.enabled:
+            return
+        self.enabled = False
+        logging.getLogger().removeHandler(self.handler)
+        try:
+            self.handler.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.writer.join(timeout)
+
+    def stats(self):
+        if not self.handler:
+            return {'enabled': False}
+        return {
+            'enabled': self.enabled,
+            'queued': self.handler.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'written': self.writer.written,
+            'batches': self.writer.batches
+        }
@@ -1,98 +1,457 @@
-from flask import Flask, render_template_string, request
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask import Flask, Response, request
+from flask_socketio import SocketIO
+import bisect
+import cProfile
+import functools
+import gc
+import gzip
+import hashlib
+import heapq
+import hmac
+import json
+import logging
+import math
+import os
 import random
+import secrets
+import signal
+import sys
+import time
+import tracemalloc
 import uuid
+from array import array
+from collections import Counter, deque, namedtuple
 from datetime import datetime
+from eventlog import EventLog
+from presets import BUILTIN_PRESETS, PresetLibrary, RoleConfigError, balance_stats, validate_roles
+from ratings import RatingService
+from stats import WINNER_TEAMS, StatsStore
+from tournament import Tournament
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'werewolf_game_secret'
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(cors_allowed_origins="*")  # 伺服器在檔尾 init_app 時才建立，見 SERVER_MODE
+
+
+class FlaskTransport:
+    # 事件處理器只透過 transport 收發訊息與排程，eventlet 與 ASGI(asgi.py)兩種模式共用同一套處理器
+    def __init__(self, socketio):
+        self.socketio = socketio
+
+    def emit(self, event, data, to=None, namespace='/'):
+        self.socketio.emit(event, data, to=to, namespace=namespace)
+
+    def enter_room(self, sid, room, namespace='/'):
+        self.socketio.server.enter_room(sid, room, namespace=namespace)
+
+    def leave_room(self, sid, room, namespace='/'):
+        self.socketio.server.leave_room(sid, room, namespace=namespace)
+
+    def environ(self, sid, namespace='/'):
+        return self.socketio.server.get_environ(sid, namespace=namespace)
+
+    def call_later(self, delay, fn, *args):
+        def run():
+            self.socketio.sleep(delay)
+            fn(*args)
+        self.socketio.start_background_task(run)
+
+    def run_in_worker(self, fn, callback):
+        # eventlet 模式交給 tpool 的原生執行緒；threading 模式下背景工作本來就在獨立執行緒
+        def run():
+            if self.socketio.async_mode == 'eventlet':
+                from eventlet import tpool
+                callback(tpool.execute(fn))
+            else:
+                callback(fn())
+        self.socketio.start_background_task(run)
+
+    def yield_now(self):
+        self.socketio.sleep(0)
+
+
+transport = FlaskTransport(socketio)
+
+# 伺服器模式：eventlet(main.py)或 asgi(asgi.py 匯入本檔前設定)；ASGI 模式不建立 Flask-SocketIO 伺服器，也就不載入 eventlet
+SERVER_MODE = os.environ.get("SERVER_MODE", "eventlet")
+# 觀戰設定：延遲秒數、每房間最多觀眾數、待送畫面上限
+SPECTATOR_DELAY = float(os.environ.get("SPECTATOR_DELAY", 10))
+MAX_SPECTATORS = int(os.environ.get("MAX_SPECTATORS", 500))
+SPECTATOR_QUEUE_LIMIT = int(os.environ.get("SPECTATOR_QUEUE_LIMIT", 50))
+SPECTATOR_PUMP_INTERVAL = 0.5
+
+# 限流設定：事件名稱 -> (每秒補充令牌數, 桶容量)，可用 RATE_LIMITS 環境變數(JSON)覆寫
+RATE_LIMITS = {
+    'create_room': (0.2, 3),
+    'join_room': (1, 5),
+    'spectate_room': (1, 5),
+    'set_roles': (2, 5),
+    'apply_preset': (2, 5),
+    'start_game': (1, 3),
+    'night_action': (2, 6),
+    'day_action': (2, 6),
+    'vote': (2, 6),
+    'wolf_night_chat': (2, 8),
+}
+RATE_LIMITS.update({k: tuple(v) for k, v in json.loads(os.environ.get("RATE_LIMITS", "{}")).items()})
+DEFAULT_RATE_LIMIT = (10, 20)
+IP_RATE_MULTIPLIER = float(os.environ.get("IP_RATE_MULTIPLIER", 10))  # 同一 IP 的額度為單一連線的倍數
+TRUST_PROXY = os.environ.get("TRUST_PROXY") == "1"
+MAX_TRACKED_IPS = 10000
+# 准入控制：超過房間數或記憶體門檻時拒絕新的 create_room/join_room，0 表示不限制
+MAX_ROOMS = int(os.environ.get("MAX_ROOMS", 0))
+MAX_RSS_MB = int(os.environ.get("MAX_RSS_MB", 0))
+# 狼人聊天室：保留的歷史訊息數、單則長度上限、合併送出的時間窗(毫秒，0 表示逐則送出)
+WOLF_CHAT_HISTORY = int(os.environ.get("WOLF_CHAT_HISTORY", 100))
+WOLF_CHAT_MAX_LEN = int(os.environ.get("WOLF_CHAT_MAX_LEN", 200))
+WOLF_CHAT_BATCH_MS = int(os.environ.get("WOLF_CHAT_BATCH_MS", 0))
+# 大房間的確認/投票進度廣播最短間隔(秒)
+PROGRESS_BROADCAST_INTERVAL = float(os.environ.get("PROGRESS_BROADCAST_INTERVAL", 0.5))
+# 對局統計目錄，設為空字串可停用
+STATS_DIR = os.environ.get("STATS_DIR", "data/stats")
+# 玩家積分資料庫，設為空字串可停用
+RATINGS_DB = os.environ.get("RATINGS_DB", "data/ratings.sqlite3")
+# 滾動更新：收到 SIGTERM 後不再接受新房間，等進行中的對局結束(最多 DRAIN_TIMEOUT 秒)，
+# 剩下的房間寫入交接目錄由下一個行程接手；DRAIN_EXIT_DELAY 為交接完成後自行結束前的等待秒數，負數表示交給編排系統結束
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", 300))
+DRAIN_EXIT_DELAY = float(os.environ.get("DRAIN_EXIT_DELAY", 5))
+HANDOFF_DIR = os.environ.get("HANDOFF_DIR", "data/handoff")
+HANDOFF_POLL_INTERVAL = float(os.environ.get("HANDOFF_POLL_INTERVAL", 2))
+SUCCESSOR_URL = os.environ.get("SUCCESSOR_URL") or None  # 未設定時客戶端重新連回同一個網址
+# 機器人玩家：每個房間的上限與每個階段行動前的等待秒數
+MAX_BOTS_PER_ROOM = int(os.environ.get("MAX_BOTS_PER_ROOM", 12))
+BOT_THINK_TIME = float(os.environ.get("BOT_THINK_TIME", 1.5))
+# 在線狀態：客戶端每 HEARTBEAT_INTERVAL 秒送一次心跳，超過 AWAY_AFTER 秒沒收到即視為暫離；
+# 每 PRESENCE_SWEEP_INTERVAL 秒巡檢一次所有房間，暫離的玩家由巡檢代為確認，不會卡住階段推進
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", 5))
+AWAY_AFTER = float(os.environ.get("AWAY_AFTER", 15))
+PRESENCE_SWEEP_INTERVAL = float(os.environ.get("PRESENCE_SWEEP_INTERVAL", 2))
+# 夜晚能力 -> 對應的行動；女巫的毒藥與解藥依剩餘藥水另外處理
+NIGHT_ABILITY_ACTIONS = {'check': 'check', 'protect': 'protect', 'exchange': 'exchange', 'peek': 'peek'}
+# 額外的角色預設組合(JSON：preset_id -> {'name', 'roles': {角色: 人數}})，與內建組合合併，設為空字串不載入
+ROLE_PRESETS_FILE = os.environ.get("ROLE_PRESETS_FILE", "")
+# 錦標賽：一輪全部結束到重新分桌前的等待秒數與報名人數上限
+TOURNAMENT_ROUND_DELAY = float(os.environ.get("TOURNAMENT_ROUND_DELAY", 10))
+MAX_TOURNAMENT_ENTRANTS = int(os.environ.get("MAX_TOURNAMENT_ENTRANTS", 1000))
+# 管理員權杖，未設定時停用所有管理功能
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# 管理面板推送統計的間隔(秒)與房間詳情附帶的日誌筆數
+ADMIN_PUSH_INTERVAL = float(os.environ.get("ADMIN_PUSH_INTERVAL", 1))
+ADMIN_LOG_TAIL = 50
+# 記憶體報告列出最大的房間數與 tracemalloc 差異列出的配置位置數；MEMORY_TRACE_FRAMES > 0 時啟動即開始追蹤
+MEMORY_TOP_ROOMS = 20
+MEMORY_TRACE_TOP = 25
+MEMORY_TRACE_FRAMES = int(os.environ.get("MEMORY_TRACE_FRAMES", 0))
+# 效能剖析：PROFILE_MODE=off|cprofile|sample，可限定單一房間(PROFILE_ROOM)或抽樣比例(PROFILE_RATE)
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "off")
+PROFILE_ROOM = os.environ.get("PROFILE_ROOM") or None
+PROFILE_RATE = float(os.environ.get("PROFILE_RATE", 1.0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_DUMP_INTERVAL = 60
+# 結構化日誌(JSON lines)：LOG_FILE 空白時寫到 stdout；LOG_SAMPLE_RATES(JSON)為事件名稱 -> 記錄比例，高頻事件只抽樣
+LOG_FILE = os.environ.get("LOG_FILE", "")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATES = {'wolf_night_chat': 0.1}
+LOG_SAMPLE_RATES.update(json.loads(os.environ.get("LOG_SAMPLE_RATES", "{}")))
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 256))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", 0.2))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# 前端靜態檔：啟動時建立帶版本號的資源並預先壓縮
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'client')
+CLIENT_FILES = {
+    'app.css': 'text/css; charset=utf-8',
+    'app.js': 'application/javascript; charset=utf-8',
+    'admin.js': 'application/javascript; charset=utf-8',
+    'vendor/socket.io.min.js': 'application/javascript; charset=utf-8',
+}
+CLIENT_PAGES = {'/': 'index.html', '/admin': 'admin.html'}
+SOCKETIO_CDN = 'https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.8.1/socket.io.min.js'
+
+def is_admin(data):
+    token = data.get('admin_token') if isinstance(data, dict) else None
+    return bool(ADMIN_TOKEN) and isinstance(token, str) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+class Profiler:
+    MODES = ('off', 'cprofile', 'sample')
+
+    def __init__(self):
+        self.mode = 'off'
+        self.room_id = None
+        self.rate = 1.0
+        self.active = 0  # 目前是否在被選中的呼叫內
+        self.cprofile = None
+        self.stacks = Counter()  # 抽樣得到的折疊堆疊 -> 次數
+        self.dumping = False
+
+    def configure(self, mode, room_id=None, rate=1.0):
+        if mode not in self.MODES:
+            raise ValueError(mode)
+        if mode == 'sample' and not hasattr(signal, 'setitimer'):
+            raise ValueError('sample')
+        path = self.dump() if self.mode != 'off' else None
+        if self.mode == 'sample':
+            signal.setitimer(signal.ITIMER_PROF, 0)
+        self.mode = mode
+        self.room_id = room_id
+        self.rate = rate
+        self.cprofile = cProfile.Profile() if mode == 'cprofile' else None
+        if mode == 'sample':
+            signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, PROFILE_SAMPLE_INTERVAL, PROFILE_SAMPLE_INTERVAL)
+        if mode != 'off' and not self.dumping:
+            self.dumping = True
+            call_later(PROFILE_DUMP_INTERVAL, self._periodic_dump)
+        return path
+
+    def selected(self, room_id):
+        if self.room_id and room_id != self.room_id:
+            return False
+        return self.rate >= 1 or random.random() < self.rate
+
+    def run(self, fn, room_id, args, kwargs):
+        if self.mode == 'off' or self.active or not self.selected(room_id):
+            return fn(*args, **kwargs)
+        self.active += 1
+        prof = self.cprofile
+        if prof:
+            prof.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if prof:
+                prof.disable()
+            self.active -= 1
+
+    def _sample(self, signum, frame):
+        # 只記錄被選中的事件，其餘時間的訊號直接忽略
+        if not self.active:
+            return
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def _periodic_dump(self):
+        if self.mode == 'off':
+            self.dumping = False
+            return
+        self.dump()
+        call_later(PROFILE_DUMP_INTERVAL, self._periodic_dump)
+
+    def dump(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        if self.cprofile:
+            # pstats 格式，可用 flameprof / gprof2dot 轉成火焰圖
+            path = os.path.join(PROFILE_DIR, f"werewolf-{os.getpid()}-{stamp}.prof")
+            self.cprofile.dump_stats(path)
+            return path
+        if self.stacks:
+            # 折疊堆疊格式，可直接交給 flamegraph.pl / speedscope
+            path = os.path.join(PROFILE_DIR, f"werewolf-{os.getpid()}-{stamp}.folded")
+            with open(path, 'w') as f:
+                for stack, count in self.stacks.items():
+                    f.write(f"{stack} {count}\n")
+            self.stacks.clear()
+            return path
+        return None
+
+profiler = Profiler()
+
+def profiled(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return profiler.run(method, self.room_id, (self,) + args, kwargs)
+    return wrapper
+
+# 角色定義，所有房間共用同一份，不可修改
+ROLE_DEFINITIONS = {
+    'villager': {'name': '村民', 'team': 'village', 'ability': None, 'description': '普通村民，沒有特殊能力'},
+    'werewolf': {'name': '狼人', 'team': 'werewolf', 'ability': 'kill', 'description': '每晚可以殺死一名玩家'},
+    'seer': {'name': '預言家', 'team': 'village', 'ability': 'check', 'description': '每晚可以查驗一名玩家身份'},
+    'witch': {'name': '女巫', 'team': 'village', 'ability': 'potion', 'description': '有解藥和毒藥各一瓶'},
+    'hunter': {'name': '獵人', 'team': 'village', 'ability': 'shoot', 'description': '死亡時可以開槍帶走一名玩家'},
+    'guard': {'name': '守衛', 'team': 'village', 'ability': 'protect', 'description': '每晚可以守護一名玩家'},
+    'wolf_king': {'name': '狼王', 'team': 'werewolf', 'ability': 'kill_on_death', 'description': '死亡時可以帶走一名玩家'},
+    'white_wolf_king': {'name': '白狼王', 'team': 'werewolf', 'ability': 'self_destruct', 'description': '白天可以自爆帶走一名玩家'},
+    'knight': {'name': '騎士', 'team': 'village', 'ability': 'duel', 'description': '白天可以挑戰一名玩家決鬥'},
+    'idiot': {'name': '白痴', 'team': 'village', 'ability': 'survive_vote', 'description': '被投票出局時不會死亡，但失去投票權'},
+    'magician': {'name': '魔術師', 'team': 'village', 'ability': 'exchange', 'description': '每晚可以交換兩名玩家的身份'},
+    'little_girl': {'name': '小女孩', 'team': 'village', 'ability': 'peek', 'description': '夜晚可以偷看狼人行動'}
+}
 
 class WerewolfGame:
-    def __init__(self, room_id):
+    def __init__(self, room_id, seed=None):
         self.room_id = room_id
+        self.tracked = False  # 是否已登記在 games，登記後狀態變動會更新 room_states
+        self._legal = None  # 本階段各玩家的合法行動，換階段或有人死亡時重算
+        # 每個房間自己的亂數產生器；種子記錄下來即可重現整場對局，種子不能讓玩家知道
+        self.seed = secrets.randbits(64) if seed is None else seed
+        self.rng = random.Random(self.seed)
         self.players = {}
         self.game_state = "waiting"
         self.current_phase = "waiting"
         self.day_count = 0
         self.votes = {}
+        self.vote_counts = {}  # 目標 -> 票數，投票時即時維護
+        self.vote_buckets = {}  # 票數 -> 得到該票數的目標集合
+        self.vote_max = 0
         self.night_actions = {}
         self.game_log = []
         self.alive_players = set()
         self.host_id = None
         self.custom_roles = []
+        self.role_preset = None  # 套用中的預設組合；自訂配置為 None
         self.revenge_waiting = None
         self.night_confirmations = set()
         self.day_confirmations = set()
         self.voting_confirmations = set()
         self.last_wolf_target = None  # 被狼人刀的目標
+        self.spectators = {}  # 觀眾 socket_id -> 名字
+        self.spectator_frames = deque()  # (送出時間, 事件, 內容)
+        self.spectator_view = None  # 最近一個已過延遲時間的公開狀態，新觀眾加入時送這份
+        self.wolf_chat = deque(maxlen=WOLF_CHAT_HISTORY)
+        self.wolf_chat_pending = []  # 合併送出前暫存的訊息
+        self.wolf_room_members = set()  # 目前在狼人頻道內的玩家
+        self.revision = 0  # 狀態版本號，任何會影響畫面的變動都要遞增
+        self.throttles = {}  # 節流廣播的狀態
+        self.bot_turn_pending = False  # 每個房間同時只排一個機器人回合
+        self.last_seen = array('d')  # 座位 -> 最後一次收到心跳的時間(monotonic)；機器人與已離開的座位為 inf
+        self.away = set()  # 暫離的玩家
+        self.presence_dirty = False  # 在線狀態有變，等下次巡檢合併廣播
+        self.tournament_id = None  # 錦標賽的桌，一般房間為 None
+        self.tournament_seats = {}  # 玩家 -> 參賽者 ID
+        self.started_at = None
+        self.winner = None
+        self.deaths = {}  # 玩家 -> (死因, 第幾天, 開局後秒數)
+        self._views = None
+        self._views_revision = -1
 
-        self.all_roles = {
-            'villager': {'name': '村民', 'team': 'village', 'ability': None, 'description': '普通村民，沒有特殊能力'},
-            'werewolf': {'name': '狼人', 'team': 'werewolf', 'ability': 'kill', 'description': '每晚可以殺死一名玩家'},
-            'seer': {'name': '預言家', 'team': 'village', 'ability': 'check', 'description': '每晚可以查驗一名玩家身份'},
-            'witch': {'name': '女巫', 'team': 'village', 'ability': 'potion', 'description': '有解藥和毒藥各一瓶'},
-            'hunter': {'name': '獵人', 'team': 'village', 'ability': 'shoot', 'description': '死亡時可以開槍帶走一名玩家'},
-            'guard': {'name': '守衛', 'team': 'village', 'ability': 'protect', 'description': '每晚可以守護一名玩家'},
-            'wolf_king': {'name': '狼王', 'team': 'werewolf', 'ability': 'kill_on_death', 'description': '死亡時可以帶走一名玩家'},
-            'white_wolf_king': {'name': '白狼王', 'team': 'werewolf', 'ability': 'self_destruct', 'description': '白天可以自爆帶走一名玩家'},
-            'knight': {'name': '騎士', 'team': 'village', 'ability': 'duel', 'description': '白天可以挑戰一名玩家決鬥'},
-            'idiot': {'name': '白痴', 'team': 'village', 'ability': 'survive_vote', 'description': '被投票出局時不會死亡，但失去投票權'},
-            'magician': {'name': '魔術師', 'team': 'village', 'ability': 'exchange', 'description': '每晚可以交換兩名玩家的身份'},
-            'little_girl': {'name': '小女孩', 'team': 'village', 'ability': 'peek', 'description': '夜晚可以偷看狼人行動'}
-        }
+        self.all_roles = ROLE_DEFINITIONS
         self.witch_potions = {}
 
+    @property
+    def game_state(self):
+        return self._game_state
+
+    @game_state.setter
+    def game_state(self, value):
+        if self.tracked:
+            room_states[self._game_state] -= 1
+            room_states[value] += 1
+            event_log.event('phase', room_id=self.room_id, previous=self._game_state, state=value, day=self.day_count)
+        self._game_state = value
+        self._legal = None
+
     def get_wolf_leader(self):
-        alive_wolves = [pid for pid in self.alive_players if self.players[pid]['role'] in ['werewolf', 'wolf_king', 'white_wolf_king']]
-        return min(alive_wolves) if alive_wolves else None
+        # 依座位順序取第一隻存活的狼，不受玩家 ID 亂數影響
+        for pid, player in self.players.items():
+            if player['alive'] and player['role'] in ('werewolf', 'wolf_king', 'white_wolf_king'):
+                return pid
+        return None
 
-    def add_player(self, player_name, socket_id):
+    def add_player(self, player_name, socket_id, profile_id=None, bot=False):
         player_id = str(uuid.uuid4())
         self.players[player_id] = {
             'name': player_name,
             'socket_id': socket_id,
+            'bot': bot,
+            'resume_token': secrets.token_urlsafe(16),  # 只給玩家本人，換機後憑此接回座位
+            'profile_id': profile_id,
             'role': None,
             'alive': True,
             'voted_for': None,
             'can_vote': True,
-            'special_status': {}
+            'special_status': {},
+            'seat': len(self.last_seen)
         }
-        if self.host_id is None:
+        self.last_seen.append(math.inf if bot else time.monotonic())
+        if self.host_id is None and not bot:
             self.host_id = player_id
+        self.touch()
         return player_id
 
+    def add_bot(self):
+        names = {player['name'] for player in self.players.values()}
+        number = 1
+        while f"機器人{number}" in names:
+            number += 1
+        return self.add_player(f"機器人{number}", None, bot=True)
+
+    def take_bot_seat(self):
+        # 開局前真人加入時頂替一個機器人的座位
+        for pid, player in self.players.items():
+            if player['bot']:
+                self.remove_player(pid)
+                return player['name']
+        return None
+
+    def has_humans(self):
+        return any(not player['bot'] for player in self.players.values())
+
     def remove_player(self, player_id):
         if player_id in self.players:
+            if player_id in self.votes:
+                self._tally(self.votes.pop(player_id), -1)
+            # 投給離開玩家的票一併作廢
+            for voter in [v for v, target in self.votes.items() if target == player_id]:
+                self._tally(self.votes.pop(voter), -1)
+            self._kill(player_id, 'left')
+            self.last_seen[self.players[player_id]['seat']] = math.inf
+            self.away.discard(player_id)
             del self.players[player_id]
-            self.alive_players.discard(player_id)
-            if player_id == self.host_id and self.players:
-                self.host_id = next(iter(self.players.keys()))
+            self.deaths.pop(player_id, None)
+            if player_id == self.host_id:
+                # 房主只交給真人
+                self.host_id = next((pid for pid, p in self.players.items() if not p['bot']), None)
+            self.touch()
 
     def set_custom_roles(self, roles_config):
-        self.custom_roles = roles_config
-        return True
+        try:
+            roles = validate_roles(roles_config, self.all_roles)
+        except RoleConfigError as exc:
+            return False, str(exc)
+        self.custom_roles = roles
+        self.role_preset = None
+        return True, "角色配置已更新"
+
+    def apply_preset(self, preset):
+        # 預設組合載入時已檢查過，直接共用它的角色清單
+        self.custom_roles = preset['roles']
+        self.role_preset = preset['preset_id']
+        return True, f"已套用「{preset['name']}」"
 
+    @profiled
     def start_game(self):
         if len(self.players) < 4:
             return False, "至少需要4名玩家"
         if not self.custom_roles:
             return False, "請先設置角色配置"
+        if self.role_preset is None:
+            # 自訂配置(含交接還原的)開局前再檢查一次；預設組合不必
+            try:
+                validate_roles(self.custom_roles, self.all_roles)
+            except RoleConfigError as exc:
+                return False, str(exc)
         total_roles = sum(role['count'] for role in self.custom_roles)
         if total_roles != len(self.players):
             return False, f"角色總數({total_roles})與玩家人數({len(self.players)})不匹配"
         role_list = []
         for role_config in self.custom_roles:
             role_list.extend([role_config['role']] * role_config['count'])
-        random.shuffle(role_list)
+        self.rng.shuffle(role_list)
         player_ids = list(self.players.keys())
         for i, player_id in enumerate(player_ids):
             self.players[player_id]['role'] = role_list[i]
             if role_list[i] == 'witch':
                 self.witch_potions[player_id] = {'antidote': True, 'poison': True}
         self.alive_players = set(self.players.keys())
-        self.game_state = "night"
+        self.started_at = time.time()
         self.day_count = 1
+        self.game_state = "night"
         self.night_confirmations = set()
         self.day_confirmations = set()
         self.add_log("遊戲開始！第1個夜晚降臨...")
@@ -111,31 +470,79 @@ class WerewolfGame:
             'description': role_info['description']
         }
         if role_info['team'] == 'werewolf':
-            teammates = []
-            for pid, p in self.players.items():
-                if (self.all_roles[p['role']]['team'] == 'werewolf' and pid != player_id and p['alive']):
-                    teammates.append({'id': pid, 'name': p['name'], 'role': self.all_roles[p['role']]['name']})
-            result['teammates'] = teammates
-            result['wolf_leader'] = (player_id == self.get_wolf_leader())
+            # 所有狼人共用同一份隊友清單，每隻狼只排除自己
+            views = self.get_views()
+            result['teammates'] = [t for t in views['wolves'] if t['id'] != player_id]
+            result['wolf_leader'] = (player_id == views['wolf_leader'])
         if player['role'] == 'witch' and player_id in self.witch_potions:
             result['potions'] = self.witch_potions[player_id]
         return result
 
+    def legal_actions(self):
+        # 玩家 -> {行動: 目標集合}，目標為 None 表示不需指定；每階段算一次，驗證與推送共用
+        if self._legal is None:
+            self._legal = self._build_legal_actions()
+        return self._legal
+
+    def _build_legal_actions(self):
+        targets = frozenset(self.alive_players)
+        legal = {}
+        if self.game_state == 'night':
+            leader = self.get_wolf_leader()
+            for pid in self.alive_players:
+                role = self.players[pid]['role']
+                ability = self.all_roles[role]['ability']
+                actions = {}
+                # 狼人殺人只允許首狼，其他狼與白狼王夜晚都不能行動
+                if pid == leader:
+                    actions['kill'] = targets
+                if ability in NIGHT_ABILITY_ACTIONS:
+                    action = NIGHT_ABILITY_ACTIONS[ability]
+                    actions[action] = None if action == 'peek' else targets
+                if ability == 'potion':
+                    for potion, available in self.witch_potions.get(pid, {}).items():
+                        if available:
+                            actions[potion] = targets
+                legal[pid] = actions
+        elif self.game_state == 'day':
+            for pid in self.alive_players:
+                ability = self.all_roles[self.players[pid]['role']]['ability']
+                legal[pid] = {ability: targets} if ability in ('duel', 'self_destruct') else {}
+        elif self.game_state == 'voting':
+            for pid in self.alive_players:
+                legal[pid] = {'vote': targets} if self.players[pid]['can_vote'] else {}
+        # 推送用的目標清單依座位排序，同一個集合只轉換一次
+        target_list = [pid for pid in self.players if pid in targets]
+        self._legal_views = {
+            pid: {action: None if allowed is None else target_list for action, allowed in actions.items()}
+            for pid, actions in legal.items()
+        }
+        return legal
+
+    def legal_actions_view(self, player_id):
+        self.legal_actions()
+        return self._legal_views.get(player_id, {})
+
+    @profiled
     def night_action(self, player_id, action_type, target_id=None, additional_target=None):
         if self.game_state != "night":
             return False, "現在不是夜晚階段"
         if player_id not in self.alive_players:
             return False, "死者無法行動"
-        player = self.players[player_id]
-        role = player['role']
-        role_ability = self.all_roles[role]['ability']
-        # 狼人殺人只允許首狼
-        if role_ability == 'kill':
-            if player_id != self.get_wolf_leader():
+        allowed = self.legal_actions()[player_id]
+        if action_type not in allowed:
+            if action_type == 'kill' and self.all_roles[self.players[player_id]['role']]['team'] == 'werewolf':
                 return False, "只有狼人代表可以決定殺人目標"
-        if action_type == "self_destruct" and role == "white_wolf_king":
-            return False, "白狼王只能在白天自爆"
-        if not self._validate_night_action(player_id, action_type, target_id, additional_target):
+            if action_type == "self_destruct" and self.players[player_id]['role'] == "white_wolf_king":
+                return False, "白狼王只能在白天自爆"
+            return False, "無效的行動"
+        targets = allowed[action_type]
+        # 目標必須是存活玩家，避免無效 ID 在結算夜晚時出錯
+        if targets is not None and target_id not in targets:
+            return False, "無效的行動"
+        if action_type == 'exchange' and additional_target not in targets:
+            return False, "無效的行動"
+        if additional_target is not None and additional_target not in self.alive_players:
             return False, "無效的行動"
         self.night_actions[player_id] = {
             'action': action_type,
@@ -144,48 +551,70 @@ class WerewolfGame:
         }
         return True, f"{action_type}行動已記錄"
 
-    def _validate_night_action(self, player_id, action_type, target_id, additional_target):
-        player = self.players[player_id]
-        role = player['role']
-        role_ability = self.all_roles[role]['ability']
-        valid_actions = {
-            'kill': ['kill'],
-            'check': ['check'],
-            'protect': ['protect'],
-            'poison': ['potion'],
-            'antidote': ['potion'],
-            'self_destruct': [],  # 白狼王夜晚不可自爆
-            'exchange': ['exchange'],
-            'peek': ['peek']
-        }
-        if action_type not in valid_actions.get(role_ability, []):
-            return False
-        if action_type in ['poison', 'antidote'] and role == 'witch':
-            potion_type = 'poison' if action_type == 'poison' else 'antidote'
-            if not self.witch_potions[player_id][potion_type]:
-                return False
-        if action_type == 'exchange' and (not target_id or not additional_target):
-            return False
-        return True
+    def _kill(self, player_id, cause):
+        self.players[player_id]['alive'] = False
+        self.alive_players.discard(player_id)
+        self._legal = None
+        if self.started_at and player_id not in self.deaths:
+            self.deaths[player_id] = (cause, self.day_count, time.time() - self.started_at)
+        # 確認集合只保留存活玩家，計數才能直接和存活人數比較
+        self.night_confirmations.discard(player_id)
+        self.day_confirmations.discard(player_id)
+        self.voting_confirmations.discard(player_id)
 
-    def confirm_night(self, player_id):
-        self.night_confirmations.add(player_id)
-        if self.night_confirmations >= self.alive_players:
-            self.night_confirmations.clear()
+    def _confirm(self, confirmations, player_id):
+        if player_id in self.alive_players:
+            confirmations.add(player_id)
+        if len(confirmations) >= len(self.alive_players):
+            confirmations.clear()
             return True
         return False
 
+    def confirm_night(self, player_id):
+        return self._confirm(self.night_confirmations, player_id)
+
     def confirm_day(self, player_id):
-        self.day_confirmations.add(player_id)
-        if self.day_confirmations >= self.alive_players:
-            self.day_confirmations.clear()
-            return True
-        return False
+        return self._confirm(self.day_confirmations, player_id)
+
+    def current_confirmations(self):
+        # 目前階段的確認集合，不需要確認的階段為 None
+        return {
+            'night': self.night_confirmations,
+            'day': self.day_confirmations,
+            'voting': self.voting_confirmations
+        }.get(self.game_state)
+
+    def pending_confirmations(self):
+        confirmations = self.current_confirmations()
+        if confirmations is None:
+            return 0, 0
+        return len(confirmations), len(self.alive_players) - len(confirmations)
 
+    def mark_seen(self, player_id, now):
+        player = self.players[player_id]
+        self.last_seen[player['seat']] = now
+        if player_id in self.away:
+            self.away.discard(player_id)
+            self.presence_dirty = True
+            self.touch()
+
+    def sweep_presence(self, threshold):
+        # 所有座位都在時限內時只需一次 min；有人暫離才逐一比對
+        if not self.last_seen or min(self.last_seen) >= threshold:
+            return
+        last_seen = self.last_seen
+        for pid, player in self.players.items():
+            if last_seen[player['seat']] < threshold and pid not in self.away:
+                self.away.add(pid)
+                self.presence_dirty = True
+        if self.presence_dirty:
+            self.touch()
+
+    @profiled
     def process_night(self):
         if self.game_state != "night":
             return False, "不是夜晚階段"
-        killed = set()
+        killed = {}  # 死者 -> 死因
         protected = set()
         results = []
         # 處理守護
@@ -201,25 +630,24 @@ class WerewolfGame:
         if werewolf_targets:
             wolf_target = werewolf_targets[0]
             if wolf_target not in protected:
-                killed.add(wolf_target)
+                killed[wolf_target] = 'wolf'
         self.last_wolf_target = wolf_target
         # 女巫夜晚得知誰被殺
         for pid, player in self.players.items():
             if player['role'] == 'witch' and player['alive']:
-                socketio.emit('witch_night_info', {
+                emit_to_player(player, 'witch_night_info', {
                     'killed_player_id': wolf_target,
                     'killed_player_name': self.players[wolf_target]['name'] if wolf_target else None
-                }, room=player['socket_id'])
+                })
         # 女巫毒殺
         for player_id, action in self.night_actions.items():
             if action['action'] == 'poison':
-                killed.add(action['target'])
+                killed.setdefault(action['target'], 'poison')
                 self.witch_potions[player_id]['poison'] = False
         # 女巫解藥
         for player_id, action in self.night_actions.items():
             if action['action'] == 'antidote':
-                if action['target'] in killed:
-                    killed.remove(action['target'])
+                killed.pop(action['target'], None)
                 self.witch_potions[player_id]['antidote'] = False
         # 預言家查驗
         for player_id, action in self.night_actions.items():
@@ -242,7 +670,7 @@ class WerewolfGame:
                 role2 = self.players[target2]['role']
                 self.players[target1]['role'] = role2
                 self.players[target2]['role'] = role1
-                results.append({'player_id': player_id, 'type': 'exchange', 'message': f"已交換 {self.players[target1]['name']} 和 {self.players[target2]['name']} 的身份"})
+                results.append({'player_id': player_id, 'type': 'exchange', 'targets': [target1, target2], 'message': f"已交換 {self.players[target1]['name']} 和 {self.players[target2]['name']} 的身份"})
         # 狼王夜間被殺
         wolf_king_now = None
         for player_id in list(killed):
@@ -250,16 +678,14 @@ class WerewolfGame:
                 wolf_king_now = player_id
                 break
         if wolf_king_now:
-            self.players[wolf_king_now]['alive'] = False
-            self.alive_players.discard(wolf_king_now)
+            self._kill(wolf_king_now, killed[wolf_king_now])
             self.revenge_waiting = (wolf_king_now, 'night')
             self.game_state = "wolf_king_revenge"
             self.add_log(f"{self.players[wolf_king_now]['name']}（狼王）死亡，等待其帶走一人")
             return True, results
-        for player_id in killed:
+        for player_id, cause in killed.items():
             if player_id in self.players:
-                self.players[player_id]['alive'] = False
-                self.alive_players.discard(player_id)
+                self._kill(player_id, cause)
         if killed:
             killed_names = [self.players[pid]['name'] for pid in killed if pid in self.players]
             self.add_log(f"夜晚結束，{', '.join(killed_names)} 死亡")
@@ -269,118 +695,166 @@ class WerewolfGame:
         self.night_actions = {}
         winner = self.check_winner()
         if winner:
-            self.game_state = "ended"
-            self.add_log(f"遊戲結束！{winner}勝利！")
+            self._end_game(winner)
         return True, results
 
+    @profiled
     def day_action(self, player_id, action_type, target_id=None):
         if self.game_state != "day":
             return False, "現在不是白天階段"
         if player_id not in self.alive_players:
             return False, "死者無法行動"
+        allowed = self.legal_actions()[player_id]
+        if action_type not in allowed:
+            return False, "無效的行動"
+        if target_id not in allowed[action_type]:
+            return False, "目標已死亡"
         player = self.players[player_id]
-        if action_type == 'duel' and player['role'] == 'knight':
-            if target_id not in self.alive_players:
-                return False, "目標已死亡"
+        if action_type == 'duel':
             target = self.players[target_id]
             target_is_werewolf = self.all_roles[target['role']]['team'] == 'werewolf'
             if target_is_werewolf:
-                self.players[target_id]['alive'] = False
-                self.alive_players.discard(target_id)
+                self._kill(target_id, 'duel')
                 self.add_log(f"騎士 {player['name']} 決鬥成功，{target['name']} 死亡")
             else:
-                self.players[player_id]['alive'] = False
-                self.alive_players.discard(player_id)
+                self._kill(player_id, 'duel')
                 self.add_log(f"騎士 {player['name']} 決鬥失敗，自己死亡")
             return True, "決鬥完成"
-        if action_type == 'self_destruct' and player['role'] == 'white_wolf_king':
-            if target_id not in self.alive_players:
-                return False, "目標已死亡"
-            self.players[target_id]['alive'] = False
-            self.alive_players.discard(target_id)
-            self.players[player_id]['alive'] = False
-            self.alive_players.discard(player_id)
-            self.add_log(f"白狼王 {player['name']} 白天自爆，帶走了 {self.players[target_id]['name']}")
-            winner = self.check_winner()
-            if winner:
-                self.game_state = "ended"
-                self.add_log(f"遊戲結束！{winner}勝利！")
-            return True, "自爆完成"
-        return False, "無效的行動"
+        self._kill(target_id, 'self_destruct')
+        self._kill(player_id, 'self_destruct')
+        self.add_log(f"白狼王 {player['name']} 白天自爆，帶走了 {self.players[target_id]['name']}")
+        winner = self.check_winner()
+        if winner:
+            self._end_game(winner)
+        return True, "自爆完成"
 
     def confirm_vote(self, player_id):
-        self.voting_confirmations.add(player_id)
-        if self.voting_confirmations >= self.alive_players:
-            self.voting_confirmations.clear()
-            return True
-        return False
+        return self._confirm(self.voting_confirmations, player_id)
+
+    def _tally(self, target_id, delta):
+        old = self.vote_counts.get(target_id, 0)
+        new = old + delta
+        if old:
+            bucket = self.vote_buckets[old]
+            bucket.discard(target_id)
+            if not bucket:
+                del self.vote_buckets[old]
+        if new:
+            self.vote_counts[target_id] = new
+            self.vote_buckets.setdefault(new, set()).add(target_id)
+        else:
+            del self.vote_counts[target_id]
+        # 票數每次只變動 1，最高票只可能同步加一或減一
+        if new > self.vote_max:
+            self.vote_max = new
+        elif old == self.vote_max and old not in self.vote_buckets:
+            self.vote_max = new
+
+    def clear_votes(self):
+        self.votes = {}
+        self.vote_counts = {}
+        self.vote_buckets = {}
+        self.vote_max = 0
 
+    @profiled
     def vote(self, player_id, target_id):
         if self.game_state != "voting":
             return False, "現在不是投票階段"
         if player_id not in self.alive_players:
             return False, "死者無法投票"
-        if not self.players[player_id]['can_vote']:
+        allowed = self.legal_actions()[player_id]
+        if 'vote' not in allowed:
             return False, "你已失去投票權"
-        self.votes[player_id] = target_id
+        if target_id not in allowed['vote']:
+            return False, "目標已死亡"
+        previous = self.votes.get(player_id)
+        if previous != target_id:
+            if previous is not None:
+                self._tally(previous, -1)
+            self._tally(target_id, 1)
+            self.votes[player_id] = target_id
         return True, "投票成功"
 
+    @profiled
     def process_vote(self):
         if not self.votes:
             self.add_log("沒有人投票，進入夜晚")
             self.game_state = "night"
             self.day_count += 1
             return True, "投票結束"
-        vote_count = {}
-        for voter, target in self.votes.items():
-            vote_count[target] = vote_count.get(target, 0) + 1
-        max_votes = max(vote_count.values())
-        candidates = [pid for pid, count in vote_count.items() if count == max_votes]
+        candidates = self.vote_buckets[self.vote_max]
         if len(candidates) == 1:
-            eliminated = candidates[0]
+            eliminated = next(iter(candidates))
             eliminated_player = self.players[eliminated]
             eliminated_role = self.all_roles[eliminated_player['role']]['name']
             if eliminated_player['role'] == 'idiot':
                 eliminated_player['can_vote'] = False
                 self.add_log(f"{eliminated_player['name']} (白痴) 被投票出局但沒有死亡，失去投票權")
             elif eliminated_player['role'] == 'wolf_king':
-                eliminated_player['alive'] = False
-                self.alive_players.discard(eliminated)
+                self._kill(eliminated, 'vote')
                 self.revenge_waiting = (eliminated, 'day')
                 self.game_state = "wolf_king_revenge"
                 self.add_log(f"{eliminated_player['name']} (狼王) 被投票出局，等待其帶走一人")
+                self.clear_votes()
                 return True, "投票結束"
             else:
-                self.players[eliminated]['alive'] = False
-                self.alive_players.discard(eliminated)
+                self._kill(eliminated, 'vote')
                 self.add_log(f"{eliminated_player['name']} ({eliminated_role}) 被投票出局")
         else:
             self.add_log("投票平票，沒有人出局")
-        self.votes = {}
+        self.clear_votes()
         self.game_state = "night"
         self.day_count += 1
         self.add_log(f"第{self.day_count}個夜晚降臨...")
         winner = self.check_winner()
         if winner:
-            self.game_state = "ended"
-            self.add_log(f"遊戲結束！{winner}勝利！")
+            self._end_game(winner)
         return True, "投票結束"
 
+    @profiled
     def wolf_king_revenge(self, revenge_target_id):
         wolf_king_id, _ = self.revenge_waiting
         if revenge_target_id in self.alive_players:
-            self.players[revenge_target_id]['alive'] = False
-            self.alive_players.discard(revenge_target_id)
+            self._kill(revenge_target_id, 'revenge')
             self.add_log(f"狼王帶走了 {self.players[revenge_target_id]['name']}")
         self.revenge_waiting = None
         winner = self.check_winner()
         if winner:
-            self.game_state = "ended"
-            self.add_log(f"遊戲結束！{winner}勝利！")
+            self._end_game(winner)
         else:
             if self.game_state == "wolf_king_revenge":
                 _, cause = wolf_king_id, _
                 self.game_state = "day" if cause == 'day' else "night"
+        self.touch()
+
+    def _end_game(self, winner):
+        self.game_state = "ended"
+        self.winner = winner
+        self.add_log(f"遊戲結束！{winner}勝利！")
+        event_log.event('game_ended', room_id=self.room_id, winner=winner, day=self.day_count,
+                        players=len(self.players), duration=round(time.time() - self.started_at, 1))
+        on_game_ended(self)
+
+    def stats_record(self):
+        ended_at = time.time()
+        players = []
+        for pid, player in self.players.items():
+            cause, day, at = self.deaths.get(pid, ('alive', 0, 0.0))
+            players.append({
+                'role': player['role'],
+                'team': self.all_roles[player['role']]['team'],
+                'death_cause': cause,
+                'death_day': day,
+                'death_time': at
+            })
+        return {
+            'ended_at': ended_at,
+            'duration': ended_at - self.started_at,
+            'day_count': self.day_count,
+            'winner': self.winner,
+            'seed': self.seed,
+            'players': players
+        }
 
     def check_winner(self):
         if not self.alive_players:
@@ -398,921 +872,1872 @@ class WerewolfGame:
     def add_log(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
         self.game_log.append(f"[{timestamp}] {message}")
+        self.touch()
 
-    def get_game_state(self, player_id=None):
-        state = {
-            'game_state': self.game_state,
-            'day_count': self.day_count,
-            'players': [],
-            'game_log': self.game_log[-10:],
-            'is_host': player_id == self.host_id if player_id else False
-        }
+    def touch(self):
+        self.revision += 1
+
+    def begin_voting(self):
+        self.game_state = "voting"
+        self.touch()
+
+    def get_views(self):
+        if self._views_revision != self.revision:
+            self._views = self._build_views()
+            self._views_revision = self.revision
+        return self._views
+
+    def _build_views(self):
+        # 每個版本只掃描一次玩家，分出公開、各玩家私有、狼人陣營三種視角
+        reveal = self.game_state == "ended"
+        public_players = []
+        private_players = {}
+        index = {}
+        wolves = []
         for pid, player in self.players.items():
             player_info = {
                 'id': pid,
                 'name': player['name'],
+                'bot': player['bot'],
                 'alive': player['alive'],
-                'can_vote': player.get('can_vote', True)
+                'can_vote': player.get('can_vote', True),
+                'away': pid in self.away
             }
-            if self.game_state == "ended" or pid == player_id:
-                if player['role'] and player['role'] in self.all_roles:
-                    player_info['role'] = self.all_roles[player['role']]['name']
-                    player_info['team'] = self.all_roles[player['role']]['team']
-            state['players'].append(player_info)
+            private_info = player_info
+            if player['role'] and player['role'] in self.all_roles:
+                role_info = self.all_roles[player['role']]
+                private_info = dict(player_info, role=role_info['name'], team=role_info['team'])
+                if role_info['team'] == 'werewolf' and player['alive']:
+                    wolves.append({'id': pid, 'name': player['name'], 'role': role_info['name']})
+            index[pid] = len(public_players)
+            public_players.append(private_info if reveal else player_info)
+            private_players[pid] = private_info
+        public = {
+            'game_state': self.game_state,
+            'day_count': self.day_count,
+            'players': public_players,
+            'game_log': self.game_log[-10:],
+            'is_host': False
+        }
         if self.game_state == "wolf_king_revenge" and self.revenge_waiting:
-            state['revenge_waiting'] = {
+            public['revenge_waiting'] = {
                 'wolf_king_id': self.revenge_waiting[0],
                 'wolf_king_name': self.players[self.revenge_waiting[0]]['name']
             }
+        return {
+            'public': public,
+            'private': private_players,
+            'index': index,
+            'wolves': wolves,
+            'wolf_leader': self.get_wolf_leader()
+        }
+
+    def get_game_state(self, player_id=None):
+        views = self.get_views()
+        public = views['public']
+        if not player_id:
+            return public
+        # 私有視角只替換自己那一格，其他玩家沿用公開資料
+        state = dict(public)
+        state['is_host'] = player_id == self.host_id
+        state['legal_actions'] = self.legal_actions_view(player_id)
+        position = views['index'].get(player_id)
+        if position is not None and self.game_state != "ended":
+            players = list(public['players'])
+            players[position] = views['private'][player_id]
+            state['players'] = players
         return state
 
-games = {}
+    def get_full_state(self):
+        views = self.get_views()
+        state = dict(views['public'])
+        state['players'] = list(views['private'].values())
+        return state
+
+    # 交接時保存的欄位；觀眾、節流、快取等連線相關狀態在新行程重新建立
+    SNAPSHOT_FIELDS = (
+        'room_id', 'seed', 'players', 'game_state', 'current_phase', 'day_count', 'votes', 'night_actions',
+        'game_log', 'alive_players', 'host_id', 'custom_roles', 'revenge_waiting', 'night_confirmations',
+        'day_confirmations', 'voting_confirmations', 'last_wolf_target', 'witch_potions', 'wolf_chat',
+        'started_at', 'winner', 'deaths'
+    )
+
+    def to_dict(self):
+        data = {}
+        for field in self.SNAPSHOT_FIELDS:
+            value = getattr(self, field)
+            data[field] = list(value) if isinstance(value, (set, deque)) else value
+        data['players'] = {pid: dict(player, socket_id=None) for pid, player in self.players.items()}
+        data['rng_state'] = self.rng.getstate()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        game = cls(data['room_id'], data['seed'])
+        for field in cls.SNAPSHOT_FIELDS:
+            setattr(game, field, data[field])
+        # 接續原行程的亂數序列，交接前後的結果與不交接時一致
+        version, internal_state, gauss_next = data['rng_state']
+        game.rng.setstate((version, tuple(internal_state), gauss_next))
+        game.alive_players = set(data['alive_players'])
+        game.night_confirmations = set(data['night_confirmations'])
+        game.day_confirmations = set(data['day_confirmations'])
+        game.voting_confirmations = set(data['voting_confirmations'])
+        game.wolf_chat = deque(data['wolf_chat'], maxlen=WOLF_CHAT_HISTORY)
+        game.revenge_waiting = tuple(data['revenge_waiting']) if data['revenge_waiting'] else None
+        game.deaths = {pid: tuple(death) for pid, death in data['deaths'].items()}
+        # 座位重新編號；交接後每位真人重新計時，給客戶端重新連線的時間
+        now = time.monotonic()
+        for seat, player in enumerate(game.players.values()):
+            player.setdefault('bot', False)  # 舊版行程交接過來的資料
+            player['seat'] = seat
+            game.last_seen.append(math.inf if player['bot'] else now)
+        # 票數統計由投票記錄重建
+        for target in game.votes.values():
+            game._tally(target, 1)
+        game._legal = None  # 存活名單是在設定階段之後才還原的
+        game.touch()
+        return game
+
+room_states = Counter()  # game_state -> 房間數
+
+class GameRegistry(dict):
+    # 房間登記與移除時同步更新 room_states，管理面板不必掃描所有房間
+    def __setitem__(self, room_id, game):
+        if room_id in self:
+            self._untrack(self[room_id])
+        game.tracked = True
+        room_states[game.game_state] += 1
+        super().__setitem__(room_id, game)
+
+    def __delitem__(self, room_id):
+        self._untrack(self[room_id])
+        super().__delitem__(room_id)
+
+    def pop(self, room_id, *default):
+        if room_id in self:
+            self._untrack(self[room_id])
+        return super().pop(room_id, *default)
+
+    @staticmethod
+    def _untrack(game):
+        game.tracked = False
+        room_states[game.game_state] -= 1
+
+games = GameRegistry()
+role_presets = PresetLibrary(ROLE_DEFINITIONS)
+role_presets.load(BUILTIN_PRESETS)
+if ROLE_PRESETS_FILE:
+    try:
+        role_presets.load_file(ROLE_PRESETS_FILE)
+    except (OSError, ValueError) as exc:
+        app.logger.error("讀取角色預設組合失敗: %r", exc)
+for preset_id, reason in role_presets.errors.items():
+    app.logger.warning("略過不合法的角色預設組合 %s: %s", preset_id, reason)
+stats_store = StatsStore(STATS_DIR) if STATS_DIR else None
+rating_service = RatingService(RATINGS_DB) if RATINGS_DB else None
+
+# 工作執行緒池的排隊與執行時間統計
+offload_metrics = {
+    'pending': 0,
+    'completed': 0,
+    'failed': 0,
+    'wait_total': 0.0,
+    'wait_max': 0.0,
+    'run_total': 0.0,
+    'run_max': 0.0
+}
+
+def offload(fn, *args, room_id=None, event=None, callback=None):
+    # 把耗時工作移出事件迴圈，完成後把結果送回原房間(room_id + event)或交給 callback
+    submitted = time.monotonic()
+    offload_metrics['pending'] += 1
+
+    def timed():
+        started = time.monotonic()
+        try:
+            return fn(*args), started, None
+        except Exception as exc:
+            return None, started, exc
 
-@app.route('/')
-def index():
-    return render_template_string(HTML_TEMPLATE)
+    def done(outcome):
+        result, started, error = outcome
+        finished = time.monotonic()
+        offload_metrics['pending'] -= 1
+        offload_metrics['failed' if error else 'completed'] += 1
+        offload_metrics['wait_total'] += started - submitted
+        offload_metrics['wait_max'] = max(offload_metrics['wait_max'], started - submitted)
+        offload_metrics['run_total'] += finished - started
+        offload_metrics['run_max'] = max(offload_metrics['run_max'], finished - started)
+        if error:
+            app.logger.error("背景工作失敗 %s: %r", getattr(fn, '__name__', fn), error)
+            return
+        if callback:
+            callback(result)
+        if event and room_id:
+            transport.emit(event, result, to=room_id)
+    transport.run_in_worker(timed, done)
+
+def offload_stats():
+    done = offload_metrics['completed'] + offload_metrics['failed']
+    return dict(
+        offload_metrics,
+        wait_avg=offload_metrics['wait_total'] / done if done else 0.0,
+        run_avg=offload_metrics['run_total'] / done if done else 0.0
+    )
+
+def on_game_ended(game):
+    if stats_store:
+        offload(stats_store.append, [game.stats_record()])
+    if rating_service:
+        teams = [
+            (player['profile_id'], game.all_roles[player['role']]['team'])
+            for player in game.players.values() if player['profile_id']
+        ]
+        offload(rating_service.apply_result, teams, WINNER_TEAMS.get(game.winner),
+                room_id=game.room_id, event='ratings_updated')
+    if game.tournament_id:
+        tournament_table_ended(game)
+
+def player_profile(data, player_name):
+    if not rating_service:
+        return None
+    profile_id, changed = rating_service.ensure_profile(data.get('profile_id'), player_name)
+    if changed:
+        offload(rating_service.save, [profile_id])
+    return profile_id
+spectated_rooms = set()
+spectator_pump_running = False
+
+Asset = namedtuple('Asset', ['body', 'gzip', 'br', 'etag', 'content_type', 'cache_control'])
+client_assets = {}  # URL 路徑 -> Asset
+
+def make_asset(body, content_type, cache_control):
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    gzipped = gzip.compress(body, 9, mtime=0)
+    compressed_br = brotli.compress(body) if brotli else None
+    return Asset(
+        body=body,
+        gzip=gzipped if len(gzipped) < len(body) else None,
+        br=compressed_br if compressed_br and len(compressed_br) < len(body) else None,
+        etag=hashlib.sha256(body).hexdigest()[:20],
+        content_type=content_type,
+        cache_control=cache_control
+    )
+
+def build_client_assets():
+    # 回傳新的對照表，由呼叫端一次併入 client_assets；可在工作執行緒中執行
+    assets = {}
+    urls = {}
+    for name, content_type in CLIENT_FILES.items():
+        path = os.path.join(CLIENT_DIR, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            body = f.read()
+        stem, ext = os.path.splitext(name)
+        # 檔名帶內容雜湊，內容不變就能永久快取
+        url = f"/assets/{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+        assets[url] = make_asset(body, content_type, 'public, max-age=31536000, immutable')
+        urls[name] = url
+    # 內建的 socket.io 客戶端不見時退回 CDN；離線部署會載不到，要留下警告
+    if 'vendor/socket.io.min.js' not in urls:
+        app.logger.warning("找不到 %s，客戶端改從 CDN 載入 socket.io: %s",
+                           os.path.join(CLIENT_DIR, 'vendor/socket.io.min.js'), SOCKETIO_CDN)
+        urls['vendor/socket.io.min.js'] = SOCKETIO_CDN
+    for page_url, page in CLIENT_PAGES.items():
+        with open(os.path.join(CLIENT_DIR, page), encoding='utf-8') as f:
+            html = f.read()
+        for name, url in urls.items():
+            html = html.replace(f"__ASSET:{name}__", url)
+        assets[page_url] = make_asset(html.encode('utf-8'), 'text/html; charset=utf-8', 'no-cache')
+    return assets
+
+# HTTP 路由與 Socket.IO 處理器一樣和伺服器模式無關：handler(headers) 回傳 (狀態碼, 標頭, 內容)
+# headers 以小寫標頭名稱查詢
+HTTP_ROUTES = {}
+
+def http_route(path):
+    def decorator(handler):
+        HTTP_ROUTES[path] = handler
+        return handler
+    return decorator
+
+def json_response(payload, status=200):
+    return status, {'Content-Type': 'application/json'}, json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+def handle_http(path, headers):
+    handler = HTTP_ROUTES.get(path)
+    if handler:
+        return handler(headers)
+    if path in CLIENT_PAGES or path.startswith('/assets/'):
+        if not client_assets:
+            # 啟動後的預先建立還沒完成時，由第一個請求自己建立
+            client_assets.update(build_client_assets())
+        return serve_asset(path, headers)
+    return 404, {'Content-Type': 'text/plain'}, b'Not Found'
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    return any(tag.strip() in ('*', f'"{etag}"', f'W/"{etag}"') for tag in header.split(','))
+
+def serve_asset(url, headers):
+    asset = client_assets.get(url)
+    if asset is None:
+        return 404, {'Content-Type': 'text/plain'}, b'Not Found'
+    accept = headers.get('accept-encoding', '')
+    body, encoding = asset.body, None
+    if asset.br and 'br' in accept:
+        body, encoding = asset.br, 'br'
+    elif asset.gzip and 'gzip' in accept:
+        body, encoding = asset.gzip, 'gzip'
+    # 不同編碼是不同的表示，各自使用強 ETag
+    etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+    response_headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': asset.cache_control,
+        'Vary': 'Accept-Encoding'
+    }
+    if etag_matches(headers.get('if-none-match'), etag):
+        return 304, response_headers, b''
+    response_headers['Content-Type'] = asset.content_type
+    if encoding:
+        response_headers['Content-Encoding'] = encoding
+    return 200, response_headers, body
+
+@app.route('/', defaults={'path': ''})
+@app.route('/<path:path>')
+def http_entry(path):
+    status, headers, body = handle_http('/' + path, request.headers)
+    return Response(body, status=status, headers=headers)
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'limited')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.limited = False
+
+    def refill(self, now):
+        # 補充到現在為止的額度，回傳是否還有一個 token 可用；扣除由呼叫端決定
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens >= 1
+
+sid_buckets = {}  # socket_id -> {事件: TokenBucket}
+ip_buckets = {}  # IP -> {事件: TokenBucket}
+
+def client_ip(sid):
+    environ = transport.environ(sid) or {}
+    if TRUST_PROXY and environ.get('HTTP_X_FORWARDED_FOR'):
+        return environ['HTTP_X_FORWARDED_FOR'].split(',')[0].strip()
+    # ASGI 模式的 environ 沒有真正的 REMOTE_ADDR，要從 scope 取
+    scope = environ.get('asgi.scope')
+    if scope and scope.get('client'):
+        return scope['client'][0]
+    return environ.get('REMOTE_ADDR')
+
+def prune_ip_buckets(now):
+    # 先清掉已閒置到額度補滿的 IP，不影響正在被限流的來源
+    for ip in list(ip_buckets):
+        if all(now - b.updated > b.capacity / b.rate for b in ip_buckets[ip].values()):
+            del ip_buckets[ip]
+    # 活躍的 IP 仍超過上限時，淘汰最久沒有事件的；多清一成，避免之後每個新 IP 都要重新掃描
+    excess = len(ip_buckets) - MAX_TRACKED_IPS + 1
+    if excess > 0:
+        excess += MAX_TRACKED_IPS // 10
+        oldest = heapq.nsmallest(excess, ip_buckets,
+                                 key=lambda ip: max((b.updated for b in ip_buckets[ip].values()), default=0.0))
+        for ip in oldest:
+            del ip_buckets[ip]
+
+# 回傳 (是否放行, 是否需要通知客戶端)
+def allow_event(sid, event):
+    now = time.monotonic()
+    rate, capacity = RATE_LIMITS.get(event, DEFAULT_RATE_LIMIT)
+    buckets = sid_buckets.setdefault(sid, {})
+    bucket = buckets.get(event)
+    if bucket is None:
+        bucket = buckets[event] = TokenBucket(rate, capacity, now)
+    ip = client_ip(sid)
+    per_ip = ip_buckets.get(ip)
+    if per_ip is None:
+        if len(ip_buckets) >= MAX_TRACKED_IPS:
+            prune_ip_buckets(now)
+        per_ip = ip_buckets[ip] = {}
+    ip_bucket = per_ip.get(event)
+    if ip_bucket is None:
+        ip_bucket = per_ip[event] = TokenBucket(rate * IP_RATE_MULTIPLIER, capacity * IP_RATE_MULTIPLIER, now)
+    # 兩邊都有額度才一起扣，被 IP 限流時不會白白花掉這條連線的額度
+    if bucket.refill(now) and ip_bucket.refill(now):
+        bucket.tokens -= 1
+        ip_bucket.tokens -= 1
+        bucket.limited = False
+        return True, False
+    # 同一段被限流期間只通知一次，避免洪水事件換來等量的錯誤回應
+    notify = not bucket.limited
+    bucket.limited = True
+    return False, notify
+
+# 事件參數格式：欄位 -> Field(允許型別, 是否必填, 最大長度, 清單元素格式)
+Field = namedtuple('Field', ['types', 'required', 'max_len', 'items'], defaults=(True, None, None))
+ROOM_ID = Field((str,), True, 8)
+PLAYER_ID = Field((str,), True, 36)
+TARGET_ID = Field((str,), True, 36)
+OPTIONAL_TARGET_ID = Field((str,), False, 36)
+PLAYER_NAME = Field((str,), True, 20)
+PROFILE_ID = Field((str,), False, 32)
+EVENT_SCHEMAS = {
+    'create_room': {'player_name': PLAYER_NAME, 'profile_id': PROFILE_ID,
+                    'seed': Field((int,), False), 'admin_token': Field((str,), False, 256)},
+    'join_room': {'room_id': ROOM_ID, 'player_name': PLAYER_NAME, 'profile_id': PROFILE_ID},
+    'get_leaderboard': {'limit': Field((int,), False)},
+    'get_rank': {'profile_id': Field((str,), True, 32)},
+    'get_role_catalog': {},
+    'spectate_room': {'room_id': ROOM_ID, 'spectator_name': Field((str,), False, 20)},
+    'set_roles': {'room_id': ROOM_ID, 'player_id': PLAYER_ID,
+                  'roles': Field((list,), True, 20, {'role': Field((str,), True, 20), 'count': Field((int,))})},
+    'apply_preset': {'room_id': ROOM_ID, 'player_id': PLAYER_ID, 'preset_id': Field((str,), True, 40)},
+    'start_game': {'room_id': ROOM_ID, 'player_id': PLAYER_ID},
+    'add_bot': {'room_id': ROOM_ID, 'player_id': PLAYER_ID, 'count': Field((int,), False)},
+    'night_action': {'room_id': ROOM_ID, 'player_id': PLAYER_ID, 'action_type': Field((str,), True, 20),
+                     'target_id': OPTIONAL_TARGET_ID, 'additional_target': OPTIONAL_TARGET_ID},
+    'night_confirm': {'room_id': ROOM_ID, 'player_id': PLAYER_ID},
+    'day_action': {'room_id': ROOM_ID, 'player_id': PLAYER_ID, 'action_type': Field((str,), True, 20),
+                   'target_id': TARGET_ID},
+    'day_confirm': {'room_id': ROOM_ID, 'player_id': PLAYER_ID},
+    'vote': {'room_id': ROOM_ID, 'player_id': PLAYER_ID, 'target_id': TARGET_ID},
+    'vote_confirm': {'room_id': ROOM_ID, 'player_id': PLAYER_ID},
+    'wolf_king_revenge': {'room_id': ROOM_ID, 'target_id': TARGET_ID},
+    'wolf_night_chat': {'room_id': ROOM_ID, 'player_id': PLAYER_ID, 'message': Field((str,))},
+    'resume_session': {'room_id': ROOM_ID, 'player_id': PLAYER_ID, 'resume_token': Field((str,), True, 32)},
+    'admin_profile': {'admin_token': Field((str,), True, 256), 'mode': Field((str,), False, 10),
+                      'room_id': Field((str,), False, 8), 'rate': Field((int, float), False), 'dump': Field((bool,), False)},
+    'admin_room_info': {'admin_token': Field((str,), True, 256), 'room_id': ROOM_ID},
+    'create_tournament': {'admin_token': Field((str,), True, 256), 'name': Field((str,), True, 40),
+                          'table_size': Field((int,)), 'rounds': Field((int,)), 'seed': Field((int,), False),
+                          'roles': Field((list,), True, 20, {'role': Field((str,), True, 20), 'count': Field((int,))})},
+    'join_tournament': {'tournament_id': ROOM_ID, 'player_name': PLAYER_NAME, 'profile_id': PROFILE_ID},
+    'start_tournament': {'admin_token': Field((str,), True, 256), 'tournament_id': ROOM_ID},
+}
+
+def compile_schema(schema):
+    checks = tuple(
+        (key, field.types, field.required, field.max_len,
+         compile_schema(field.items) if field.items else None)
+        for key, field in schema.items()
+    )
+
+    def validate(data):
+        if type(data) is not dict:
+            return False
+        for key, types, required, max_len, item_validator in checks:
+            value = data.get(key)
+            if value is None:
+                if required:
+                    return False
+                continue
+            if type(value) not in types:
+                return False
+            if max_len is not None and len(value) > max_len:
+                return False
+            if item_validator is not None:
+                for item in value:
+                    if not item_validator(item):
+                        return False
+        return True
+    return validate
+
+# 啟動時預先編譯，事件處理時只做型別與長度比對
+EVENT_VALIDATORS = {event: compile_schema(schema) for event, schema in EVENT_SCHEMAS.items()}
+schema_rejections = Counter()
+
+LATENCY_BOUNDS_MS = tuple(0.05 * 2 ** i for i in range(16))  # 0.05ms 到約 1.6s，每格加倍
+
+class LatencyHistogram:
+    # 固定分格的直方圖，記錄是 O(log 格數)，百分位數由分格估計
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+        self.total = 0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect.bisect_left(LATENCY_BOUNDS_MS, ms)] += 1
+        self.total += 1
+        self.max = max(self.max, ms)
+
+    def percentile(self, q):
+        threshold = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return LATENCY_BOUNDS_MS[i] if i < len(LATENCY_BOUNDS_MS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.total,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': round(self.max, 3)
+        }
+
+server_counters = {'connections': 0, 'events': 0}
+event_log = EventLog()
+
+def start_logging():
+    from flask.logging import default_handler
+    app.logger.removeHandler(default_handler)  # 改由 JSON lines 輸出
+    event_log.start(LOG_FILE, LOG_LEVEL, LOG_SAMPLE_RATES, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_QUEUE_SIZE)
+event_latency = {}  # 事件 -> 本次推送區間內的 LatencyHistogram
+
+SOCKET_HANDLERS = {}  # (命名空間, 事件) -> handler(sid, *參數)，由各伺服器模式註冊
+
+def on_socket(event, namespace='/'):
+    def decorator(handler):
+        SOCKET_HANDLERS[(namespace, event)] = handler
+        return handler
+    return decorator
+
+def on_event(event):
+    validator = EVENT_VALIDATORS.get(event)
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(sid, data=None):
+            server_counters['events'] += 1
+            allowed, notify = allow_event(sid, event)
+            if not allowed:
+                event_log.event('rate_limited', sample_key=event, level=logging.WARNING, event=event, sid=sid)
+                if notify:
+                    transport.emit('error', {'message': '操作過於頻繁，請稍後再試'}, to=sid)
+                return
+            if validator is not None and not validator(data):
+                schema_rejections[event] += 1
+                event_log.event('invalid_payload', sample_key=event, level=logging.WARNING, event=event, sid=sid)
+                transport.emit('error', {'message': '無效的請求格式'}, to=sid)
+                return
+            room_id = data.get('room_id') if isinstance(data, dict) else None
+            started = time.perf_counter()
+            try:
+                return profiler.run(handler, room_id, (sid, data), {})
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                histogram = event_latency.get(event)
+                if histogram is None:
+                    histogram = event_latency[event] = LatencyHistogram()
+                histogram.record(elapsed)
+                event_log.event('command', sample_key=event, event=event, sid=sid, room_id=room_id,
+                                player_id=data.get('player_id') if isinstance(data, dict) else None,
+                                ms=round(elapsed, 3))
+        return on_socket(event)(wrapper)
+    return decorator
+
+rss_cache = [0.0, 0.0]  # (讀取時間, RSS MB)
+
+def current_rss_mb():
+    now = time.monotonic()
+    if now - rss_cache[0] > 1:
+        try:
+            with open('/proc/self/statm') as f:
+                pages = int(f.read().split()[1])
+            rss_cache[1] = pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+        except (OSError, ValueError):
+            import resource
+            rss_cache[1] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        rss_cache[0] = now
+    return rss_cache[1]
+
+def admission_error(creating_room):
+    if drain_state['draining']:
+        return '伺服器即將更新，暫停建立與加入房間，請稍後再試'
+    if creating_room and MAX_ROOMS and len(games) >= MAX_ROOMS:
+        return '伺服器房間已滿，請稍後再試'
+    if MAX_RSS_MB and current_rss_mb() > MAX_RSS_MB:
+        return '伺服器忙碌中，請稍後再試'
+    return None
+
+def call_later(delay, fn, *args):
+    transport.call_later(delay, fn, *args)
+
+def emit_to_player(player, event, payload):
+    # 從交接檔接手、尚未重新連線的玩家沒有 socket_id，不能拿 None 當 room(會變成全體廣播)
+    if player['socket_id']:
+        transport.emit(event, payload, to=player['socket_id'])
+
+drain_state = {
+    'draining': False,
+    'started_at': None,
+    'handed_off': 0,
+    'snapshot': None,
+    'safe_to_kill': False
+}
+
+def active_games():
+    return [game for game in games.values() if game.players and game.game_state not in ('waiting', 'ended')]
+
+def start_drain():
+    if drain_state['draining']:
+        return
+    drain_state['draining'] = True
+    drain_state['started_at'] = time.monotonic()
+    app.logger.warning("開始排空，進行中的對局 %d 場", len(active_games()))
+    transport.emit('server_draining', {
+        'message': '伺服器即將更新，進行中的遊戲可以繼續，暫停建立與加入房間',
+        'timeout': DRAIN_TIMEOUT
+    })
+    drain_tick()
+
+def drain_tick():
+    if active_games() and time.monotonic() - drain_state['started_at'] < DRAIN_TIMEOUT:
+        call_later(1, drain_tick)
+        return
+    # 逾時仍未結束的對局與等待中的房間交給下一個行程；先移出 games，之後的操作不會漏進快照
+    # HANDOFF_DIR 設為空字串時停用移交，房間留在本行程直到被結束
+    rooms = [game for game in games.values() if game.players and game.game_state != 'ended'] if HANDOFF_DIR else []
+    for game in rooms:
+        del games[game.room_id]
+    if not rooms:
+        finish_drain(rooms, None)
+        return
+    snapshot = [game.to_dict() for game in rooms]
+    offload(write_handoff, snapshot, callback=lambda path: finish_drain(rooms, path))
+
+def write_handoff(snapshot):
+    path = os.path.join(HANDOFF_DIR, f"rooms-{int(time.time())}-{uuid.uuid4().hex[:8]}.json")
+    tmp_path = path + '.tmp'
+    try:
+        os.makedirs(HANDOFF_DIR, exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        app.logger.error("寫入移交快照失敗: %r", exc)
+        return None
+    return path
+
+def finish_drain(rooms, path):
+    if path is None and rooms:
+        # 快照沒寫成，房間放回本行程，排空仍然結束
+        for game in rooms:
+            games[game.room_id] = game
+        rooms = []
+    drain_state['handed_off'] = len(rooms)
+    drain_state['snapshot'] = path
+    for room_id in (game.room_id for game in rooms):
+        transport.emit('server_migrating', {'room_id': room_id, 'reconnect_url': SUCCESSOR_URL}, to=room_id)
+    # 讓移轉通知送出後才回報可以結束
+    call_later(1, mark_drained)
+
+def mark_drained():
+    drain_state['safe_to_kill'] = True
+    app.logger.warning("排空完成，移交 %d 個房間：%s", drain_state['handed_off'], drain_state['snapshot'])
+    if DRAIN_EXIT_DELAY >= 0:
+        call_later(DRAIN_EXIT_DELAY, exit_process)
+
+def exit_process():
+    event_log.stop()  # os._exit 不會執行清理，先把日誌寫完
+    os._exit(0)
+
+def claim_handoffs():
+    # 多個行程共用交接目錄時先改名認領，同一批房間只會被一個行程載入
+    snapshots = []
+    for name in sorted(os.listdir(HANDOFF_DIR)):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(HANDOFF_DIR, name)
+        claimed = f"{path}.{uuid.uuid4().hex[:8]}.claimed"
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            continue
+        with open(claimed) as f:
+            snapshots.extend(json.load(f))
+        os.remove(claimed)
+    return snapshots
+
+def restore_games(snapshots):
+    for data in snapshots:
+        if data['room_id'] in games:
+            app.logger.warning("交接的房間 %s 已存在，略過", data['room_id'])
+            continue
+        games[data['room_id']] = WerewolfGame.from_dict(data)
+        schedule_bots(games[data['room_id']])
+    if snapshots:
+        app.logger.info("接手 %d 個房間", len(snapshots))
+    startup_task_done('handoffs')
+
+def poll_handoffs():
+    if drain_state['draining']:
+        return
+    if HANDOFF_DIR and os.path.isdir(HANDOFF_DIR) and any(name.endswith('.json') for name in os.listdir(HANDOFF_DIR)):
+        offload(claim_handoffs, callback=restore_games)
+    else:
+        startup_task_done('handoffs')
+    call_later(HANDOFF_POLL_INTERVAL, poll_handoffs)
+
+# 啟動準備：第一次交接還原與積分載入都完成後 /readyz 才回 200，自動擴展時流量不會先導到還沒接手房間的行程
+startup_state = {'pending': {'handoffs'} | ({'ratings'} if rating_service else set()), 'ready_at': None}
+
+def startup_task_done(task):
+    if task not in startup_state['pending']:
+        return
+    startup_state['pending'].discard(task)
+    if not startup_state['pending']:
+        startup_state['ready_at'] = time.monotonic()
+        app.logger.info("啟動準備完成")
+
+def start_background_tasks():
+    # 開始接受連線後才執行，/healthz 不必等這些工作
+    poll_handoffs()
+    if rating_service:
+        offload(rating_service.load, callback=lambda _: startup_task_done('ratings'))
+    offload(build_client_assets, callback=client_assets.update)
+    call_later(PRESENCE_SWEEP_INTERVAL, sweep_presence)
+
+@http_route('/healthz')
+def healthz(headers):
+    # 存活檢查：事件迴圈還能回應就算健康
+    return json_response({'status': 'ok'})
+
+@http_route('/readyz')
+def readyz(headers):
+    # 就緒檢查：啟動準備完成且沒有在排空才接新流量
+    ready = not startup_state['pending'] and not drain_state['draining']
+    return json_response({
+        'ready': ready,
+        'pending': sorted(startup_state['pending']),
+        'draining': drain_state['draining'],
+        'rooms': len(games)
+    }, 200 if ready else 503)
+
+@http_route('/drain')
+def drain_status(headers):
+    started_at = drain_state['started_at']
+    return json_response({
+        'draining': drain_state['draining'],
+        'elapsed': time.monotonic() - started_at if started_at else 0.0,
+        'timeout': DRAIN_TIMEOUT,
+        'active_games': len(active_games()),
+        'rooms': len(games),
+        'handed_off': drain_state['handed_off'],
+        'snapshot': drain_state['snapshot'],
+        'safe_to_kill': drain_state['safe_to_kill']
+    })
+
+def throttled(state, key, fn, *args):
+    # 間隔內的多次呼叫合併為一次，並保證最後一次變動會在間隔結束時送出
+    entry = state.setdefault(key, [0.0, False])
+    if entry[1]:
+        return
+    wait = entry[0] + PROGRESS_BROADCAST_INTERVAL - time.monotonic()
+    if wait <= 0:
+        entry[0] = time.monotonic()
+        fn(*args)
+        return
+    entry[1] = True
+
+    def run():
+        entry[0] = time.monotonic()
+        entry[1] = False
+        fn(*args)
+    call_later(wait, run)
+
+def broadcast_progress(room_id):
+    game = games.get(room_id)
+    if not game:
+        return
+    confirmed, pending = game.pending_confirmations()
+    progress = {'phase': game.game_state, 'confirmed': confirmed, 'pending': pending}
+    if game.game_state == 'voting':
+        progress['votes_cast'] = len(game.votes)
+    transport.emit('phase_progress', progress, to=room_id)
+
+def spectator_room(room_id):
+    return room_id + "_spectators"
+
+def advance_spectator_view(game, now):
+    # 取出所有已到期的畫面，spectator_view 更新為最新到期的一幀；回傳該幀(沒有則 None)
+    frames = game.spectator_frames
+    due = None
+    # 每個畫面都帶完整公開狀態，只需保留最新到期的一幀
+    while frames and frames[0][0] <= now:
+        due = frames.popleft()
+    if due:
+        game.spectator_view = due[2]['game_state']
+    return due
+
+def queue_spectator_frame(game, event, payload):
+    # 沒有觀眾的房間也要排入，之後才加入的觀眾才拿得到延遲後的狀態；內容與送給玩家的是同一個物件
+    now = time.monotonic()
+    advance_spectator_view(game, now)
+    frames = game.spectator_frames
+    # 觀眾可容忍掉幀：佇列滿時丟掉最舊的畫面
+    if len(frames) >= SPECTATOR_QUEUE_LIMIT:
+        frames.popleft()
+    frames.append((now + SPECTATOR_DELAY, event, payload))
+
+def broadcast_state(room_id, event, payload):
+    transport.emit(event, payload, to=room_id)
+    game = games.get(room_id)
+    if game:
+        queue_spectator_frame(game, event, payload)
+
+def pump_spectators():
+    global spectator_pump_running
+    now = time.monotonic()
+    for room_id in list(spectated_rooms):
+        game = games.get(room_id)
+        if not game or not game.spectators:
+            spectated_rooms.discard(room_id)
+            continue
+        due = advance_spectator_view(game, now)
+        if due:
+            _, event, payload = due
+            transport.emit('spectator_update', {
+                'event': event,
+                'game_state': payload['game_state']
+            }, to=spectator_room(room_id))
+            transport.yield_now()  # 觀眾優先度較低，讓出給玩家事件
+    if spectated_rooms:
+        call_later(SPECTATOR_PUMP_INTERVAL, pump_spectators)
+    else:
+        spectator_pump_running = False
 
 def join_wolf_room(game, room_id):
     wolf_room = room_id + "_wolves"
+    wolves = {pid for pid, player in game.players.items() if game.all_roles[player['role']]['team'] == 'werewolf'}
+    # 魔術師交換後不再是狼人的玩家離開頻道
+    for pid in game.wolf_room_members - wolves:
+        if pid in game.players and game.players[pid]['socket_id']:
+            transport.leave_room(game.players[pid]['socket_id'], wolf_room)
+    game.wolf_room_members &= wolves
+    for pid in wolves - game.wolf_room_members:
+        player = game.players[pid]
+        # 尚未接回連線的玩家等 resume_session 時再加入
+        if not player['alive'] or not player['socket_id']:
+            continue
+        transport.enter_room(player['socket_id'], wolf_room)
+        game.wolf_room_members.add(pid)
+        # 新加入的狼人補看之前的聊天記錄
+        if game.wolf_chat:
+            emit_to_player(player, 'wolf_chat_history', {'messages': list(game.wolf_chat)})
+
+# 以下推進階段的流程由玩家事件與機器人回合共用
+def confirm_and_advance(game, confirm, advance, player_id):
+    if confirm(player_id):
+        advance(game)
+    else:
+        throttled(game.throttles, 'progress', broadcast_progress, game.room_id)
+
+def advance_night(game):
+    room_id = game.room_id
+    success, results = game.process_night()
+    if success:
+        for result in results:
+            if result['type'] == 'check':
+                emit_to_player(game.players[result['player_id']], 'check_result', result)
+            elif result['type'] == 'exchange':
+                for pid in result['targets']:
+                    emit_to_player(game.players[pid], 'role_assigned', {
+                        'role_info': game.get_player_role_info(pid),
+                        'game_state': game.get_game_state(pid)
+                    })
+        join_wolf_room(game, room_id)
+        broadcast_state(room_id, 'phase_changed', {
+            'new_phase': game.game_state,
+            'game_state': game.get_game_state()
+        })
+    game.night_actions = {}
+    push_legal_actions(game)
+    schedule_bots(game)
+
+def advance_day(game):
+    game.begin_voting()
+    broadcast_state(game.room_id, 'phase_changed', {
+        'new_phase': 'voting',
+        'game_state': game.get_game_state()
+    })
+    push_legal_actions(game)
+    schedule_bots(game)
+
+def advance_vote(game):
+    success, message = game.process_vote()
+    if success:
+        broadcast_state(game.room_id, 'phase_changed', {
+            'new_phase': game.game_state,
+            'game_state': game.get_game_state()
+        })
+    game.clear_votes()
+    push_legal_actions(game)
+    schedule_bots(game)
+
+def advance_revenge(game, target_id):
+    game.wolf_king_revenge(target_id)
+    broadcast_state(game.room_id, 'phase_changed', {
+        'new_phase': game.game_state,
+        'game_state': game.get_game_state()
+    })
+    push_legal_actions(game)
+    schedule_bots(game)
+
+def push_legal_actions(game):
+    # 公開狀態只廣播一次，合法行動各自私下送給真人玩家
     for pid, player in game.players.items():
-        if player['alive'] and game.all_roles[player['role']]['team'] == 'werewolf':
-            socketio.server.enter_room(player['socket_id'], wolf_room)
+        if not player['bot']:
+            emit_to_player(player, 'legal_actions', {
+                'game_state': game.game_state,
+                'day_count': game.day_count,
+                'actions': game.legal_actions_view(pid)
+            })
+
+def schedule_bots(game):
+    if game.bot_turn_pending or game.game_state in ('waiting', 'ended'):
+        return
+    if not any(player['bot'] for player in game.players.values()):
+        return
+    game.bot_turn_pending = True
+    call_later(BOT_THINK_TIME, bot_turn, game.room_id)
+
+def bot_target(game, player_id, avoid_team=None):
+    # 依座位順序列出候選人再抽，同一個種子的對局才能重現
+    candidates = [
+        pid for pid, player in game.players.items()
+        if player['alive'] and pid != player_id
+        and (avoid_team is None or game.all_roles[player['role']]['team'] != avoid_team)
+    ]
+    return game.rng.choice(candidates) if candidates else None
 
-@socketio.on('create_room')
-def handle_create_room(data):
+def bot_night_action(game, player_id):
+    legal = game.legal_actions()[player_id]
+    if 'kill' in legal:
+        target = bot_target(game, player_id, avoid_team='werewolf')
+        if target:
+            game.night_action(player_id, 'kill', target)
+    elif 'check' in legal:
+        target = bot_target(game, player_id)
+        if target:
+            game.night_action(player_id, 'check', target)
+    elif 'protect' in legal:
+        game.night_action(player_id, 'protect', game.rng.choice([pid for pid in game.players if pid in game.alive_players]))
+    # 其他角色(女巫、魔術師等)保留能力不用，一樣是合法的選擇
+
+def confirm_step(game):
+    # 目前階段的 (確認, 推進)；不需要確認的階段為 None
+    return {
+        'night': (game.confirm_night, advance_night),
+        'day': (game.confirm_day, advance_day),
+        'voting': (game.confirm_vote, advance_vote),
+    }.get(game.game_state)
+
+def bot_turn(room_id):
+    # 一個房間的所有機器人在同一個回合內行動，不佔用連線
+    game = games.get(room_id)
+    if not game:
+        return
+    game.bot_turn_pending = False
+    state = game.game_state
+    bots = [pid for pid, player in game.players.items() if player['bot'] and player['alive']]
+    if state == 'wolf_king_revenge':
+        wolf_king_id = game.revenge_waiting[0]
+        if game.players[wolf_king_id]['bot']:
+            advance_revenge(game, bot_target(game, wolf_king_id, avoid_team='werewolf'))
+        return
+    step = confirm_step(game)
+    if not step:
+        return
+    for pid in bots:
+        if state == 'night':
+            bot_night_action(game, pid)
+        elif state == 'voting' and game.players[pid]['can_vote']:
+            wolf = game.all_roles[game.players[pid]['role']]['team'] == 'werewolf'
+            target = bot_target(game, pid, avoid_team='werewolf' if wolf else None)
+            if target:
+                game.vote(pid, target)
+    confirm, advance = step
+    for pid in bots:
+        # 最後一個確認會推進階段，之後的機器人等下一個回合
+        if game.game_state != state:
+            break
+        confirm_and_advance(game, confirm, advance, pid)
+
+def flush_wolf_chat(room_id):
+    game = games.get(room_id)
+    if not game or not game.wolf_chat_pending:
+        return
+    messages, game.wolf_chat_pending = game.wolf_chat_pending, []
+    transport.emit('wolf_night_messages', {'messages': messages}, to=room_id + "_wolves")
+
+presence_stats = {'players': 0, 'away': 0, 'sweep_ms': 0.0}
+
+def sweep_presence():
+    # 單一定時巡檢：標記暫離、替暫離玩家確認，這段期間的在線變動合併成每房間一次廣播
+    started = time.perf_counter()
+    threshold = time.monotonic() - AWAY_AFTER
+    players = away = 0
+    for game in list(games.values()):
+        game.sweep_presence(threshold)
+        if game.away:
+            confirm_away(game)
+        if game.presence_dirty:
+            game.presence_dirty = False
+            broadcast_state(game.room_id, 'presence_changed', {'game_state': game.get_game_state()})
+        players += len(game.players)
+        away += len(game.away)
+    presence_stats.update(players=players, away=away, sweep_ms=round((time.perf_counter() - started) * 1000, 3))
+    call_later(PRESENCE_SWEEP_INTERVAL, sweep_presence)
+
+def confirm_away(game):
+    # 暫離的玩家視同放棄本階段行動，與機器人一樣照座位順序確認
+    if game.game_state == 'wolf_king_revenge':
+        wolf_king_id = game.revenge_waiting[0]
+        if wolf_king_id in game.away:
+            advance_revenge(game, bot_target(game, wolf_king_id, avoid_team='werewolf'))
+        return
+    step = confirm_step(game)
+    if not step:
+        return
+    state = game.game_state
+    confirmations = game.current_confirmations()
+    confirm, advance = step
+    for pid in [pid for pid in game.players if pid in game.away]:
+        if game.game_state != state:
+            break
+        if pid in game.alive_players and pid not in confirmations:
+            confirm_and_advance(game, confirm, advance, pid)
+
+@on_socket('heartbeat')
+def handle_heartbeat(sid, data=None):
+    # 心跳量大且內容固定，不經過 on_event 的限流、格式檢查與日誌，只更新最後出現時間
+    if not isinstance(data, dict):
+        return
+    room_id, player_id = data.get('room_id'), data.get('player_id')
+    if not isinstance(room_id, str) or not isinstance(player_id, str):
+        return
+    game = games.get(room_id)
+    player = game.players.get(player_id) if game else None
+    if player and player['socket_id'] == sid:
+        game.mark_seen(player_id, time.monotonic())
+
+@on_event('create_room')
+def handle_create_room(sid, data):
+    error = admission_error(creating_room=True)
+    if error:
+        transport.emit('error', {'message': error}, to=sid)
+        return
+    seed = data.get('seed')
+    if seed is not None:
+        # 指定種子等於事先知道所有人的身份，只開放給管理員
+        if not is_admin(data):
+            transport.emit('error', {'message': '沒有管理員權限'}, to=sid)
+            return
+        if not 0 <= seed < 2 ** 64:
+            transport.emit('error', {'message': '種子必須介於 0 與 2^64 之間'}, to=sid)
+            return
     room_id = str(uuid.uuid4())[:8]
-    games[room_id] = WerewolfGame(room_id)
-    player_id = games[room_id].add_player(data['player_name'], request.sid)
-    join_room(room_id)
-    emit('room_created', {
+    games[room_id] = WerewolfGame(room_id, seed)
+    profile_id = player_profile(data, data['player_name'])
+    player_id = games[room_id].add_player(data['player_name'], sid, profile_id)
+    transport.enter_room(sid, room_id)
+    transport.emit('room_created', {
         'room_id': room_id,
         'player_id': player_id,
+        'profile_id': profile_id,
+        'resume_token': games[room_id].players[player_id]['resume_token'],
         'game_state': games[room_id].get_game_state(player_id)
-    })
+    }, to=sid)
 
-@socketio.on('join_room')
-def handle_join_room(data):
+@on_event('join_room')
+def handle_join_room(sid, data):
     room_id = data['room_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     if games[room_id].game_state != 'waiting':
-        emit('error', {'message': '遊戲已開始，無法加入'})
+        transport.emit('error', {'message': '遊戲已開始，無法加入'}, to=sid)
         return
-    player_id = games[room_id].add_player(data['player_name'], request.sid)
-    join_room(room_id)
-    emit('joined_room', {
+    error = admission_error(creating_room=False)
+    if error:
+        transport.emit('error', {'message': error}, to=sid)
+        return
+    profile_id = player_profile(data, data['player_name'])
+    games[room_id].take_bot_seat()
+    player_id = games[room_id].add_player(data['player_name'], sid, profile_id)
+    transport.enter_room(sid, room_id)
+    transport.emit('joined_room', {
+        'room_id': room_id,
         'player_id': player_id,
+        'profile_id': profile_id,
+        'resume_token': games[room_id].players[player_id]['resume_token'],
         'game_state': games[room_id].get_game_state(player_id)
-    })
-    socketio.emit('player_joined', {
+    }, to=sid)
+    broadcast_state(room_id, 'player_joined', {
         'player_name': data['player_name'],
         'game_state': games[room_id].get_game_state()
-    }, room=room_id)
+    })
 
-@socketio.on('set_roles')
-def handle_set_roles(data):
+@on_event('set_roles')
+def handle_set_roles(sid, data):
     room_id = data['room_id']
     player_id = data['player_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     game = games[room_id]
     if player_id != game.host_id:
-        emit('error', {'message': '只有房主可以設置角色'})
+        transport.emit('error', {'message': '只有房主可以設置角色'}, to=sid)
+        return
+    success, message = game.set_custom_roles(data['roles'])
+    if not success:
+        transport.emit('error', {'message': message}, to=sid)
+        return
+    broadcast_roles(game)
+
+@on_event('apply_preset')
+def handle_apply_preset(sid, data):
+    room_id = data['room_id']
+    if room_id not in games:
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
+        return
+    game = games[room_id]
+    if data['player_id'] != game.host_id:
+        transport.emit('error', {'message': '只有房主可以設置角色'}, to=sid)
         return
-    game.set_custom_roles(data['roles'])
-    socketio.emit('roles_updated', {
-        'roles': data['roles'],
+    preset = role_presets.get(data['preset_id'])
+    if not preset:
+        transport.emit('error', {'message': '預設組合不存在'}, to=sid)
+        return
+    game.apply_preset(preset)
+    broadcast_roles(game)
+
+@on_event('get_role_catalog')
+def handle_get_role_catalog(sid, data):
+    transport.emit('role_catalog', role_presets.role_catalog(), to=sid)
+
+def broadcast_roles(game):
+    # 預設組合的平衡指標載入時已算好，自訂配置才現算
+    preset = role_presets.get(game.role_preset) if game.role_preset else None
+    broadcast_state(game.room_id, 'roles_updated', {
+        'roles': game.custom_roles,
+        'preset_id': game.role_preset,
+        'stats': preset['stats'] if preset else balance_stats(game.custom_roles, game.all_roles),
         'game_state': game.get_game_state()
-    }, room=room_id)
+    })
 
-@socketio.on('start_game')
-def handle_start_game(data):
+@on_event('add_bot')
+def handle_add_bot(sid, data):
+    room_id = data['room_id']
+    if room_id not in games:
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
+        return
+    game = games[room_id]
+    if data['player_id'] != game.host_id:
+        transport.emit('error', {'message': '只有房主可以加入機器人'}, to=sid)
+        return
+    if game.game_state != 'waiting':
+        transport.emit('error', {'message': '遊戲已開始，無法加入'}, to=sid)
+        return
+    count = data.get('count') or 1
+    bots = sum(1 for player in game.players.values() if player['bot'])
+    if count < 1 or bots + count > MAX_BOTS_PER_ROOM:
+        transport.emit('error', {'message': f'每個房間最多{MAX_BOTS_PER_ROOM}個機器人'}, to=sid)
+        return
+    error = admission_error(creating_room=False)
+    if error:
+        transport.emit('error', {'message': error}, to=sid)
+        return
+    names = [game.players[game.add_bot()]['name'] for _ in range(count)]
+    broadcast_state(room_id, 'player_joined', {
+        'player_name': ', '.join(names),
+        'game_state': game.get_game_state()
+    })
+
+@on_event('start_game')
+def handle_start_game(sid, data):
     room_id = data['room_id']
     player_id = data['player_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     game = games[room_id]
     if player_id != game.host_id:
-        emit('error', {'message': '只有房主可以開始遊戲'})
+        transport.emit('error', {'message': '只有房主可以開始遊戲'}, to=sid)
         return
     success, message = game.start_game()
     if success:
-        join_wolf_room(game, room_id)
-        for pid, player in game.players.items():
-            role_info = game.get_player_role_info(pid)
-            socketio.emit('role_assigned', {
-                'role_info': role_info,
-                'game_state': game.get_game_state(pid)
-            }, room=player['socket_id'])
+        begin_game(game)
     else:
-        emit('error', {'message': message})
+        transport.emit('error', {'message': message}, to=sid)
+
+def begin_game(game):
+    join_wolf_room(game, game.room_id)
+    for pid, player in game.players.items():
+        role_info = game.get_player_role_info(pid)
+        emit_to_player(player, 'role_assigned', {
+            'role_info': role_info,
+            'game_state': game.get_game_state(pid)
+        })
+    queue_spectator_frame(game, 'game_started', {'game_state': game.get_game_state()})
+    schedule_bots(game)
 
-@socketio.on('night_action')
-def handle_night_action(data):
+@on_event('night_action')
+def handle_night_action(sid, data):
     room_id = data['room_id']
     player_id = data['player_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     game = games[room_id]
     success, message = game.night_action(
         player_id, data['action_type'],
         data.get('target_id'), data.get('additional_target')
     )
-    emit('action_result', {'success': success, 'message': message})
+    transport.emit('action_result', {'success': success, 'message': message}, to=sid)
 
-@socketio.on('night_confirm')
-def handle_night_confirm(data):
+@on_event('night_confirm')
+def handle_night_confirm(sid, data):
     room_id = data['room_id']
     player_id = data['player_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     game = games[room_id]
-    everyone_done = game.confirm_night(player_id)
-    if everyone_done:
-        success, results = game.process_night()
-        if success:
-            for result in results:
-                if result['type'] == 'check':
-                    socketio.emit('check_result', result, room=game.players[result['player_id']]['socket_id'])
-            socketio.emit('phase_changed', {
-                'new_phase': game.game_state,
-                'game_state': game.get_game_state()
-            }, room=room_id)
-        game.night_actions = {}
-
-@socketio.on('day_action')
-def handle_day_action(data):
+    confirm_and_advance(game, game.confirm_night, advance_night, player_id)
+
+@on_event('day_action')
+def handle_day_action(sid, data):
     room_id = data['room_id']
     player_id = data['player_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     game = games[room_id]
     success, message = game.day_action(
         player_id, data['action_type'], data.get('target_id')
     )
-    emit('action_result', {'success': success, 'message': message})
+    transport.emit('action_result', {'success': success, 'message': message}, to=sid)
+    if success:
+        push_legal_actions(game)  # 有人死亡，其他人的目標跟著變
 
-@socketio.on('day_confirm')
-def handle_day_confirm(data):
+@on_event('day_confirm')
+def handle_day_confirm(sid, data):
     room_id = data['room_id']
     player_id = data['player_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     game = games[room_id]
-    everyone_done = game.confirm_day(player_id)
-    if everyone_done:
-        game.game_state = "voting"
-        socketio.emit('phase_changed', {
-            'new_phase': 'voting',
-            'game_state': game.get_game_state()
-        }, room=room_id)
+    confirm_and_advance(game, game.confirm_day, advance_day, player_id)
 
-@socketio.on('vote')
-def handle_vote(data):
+@on_event('vote')
+def handle_vote(sid, data):
     room_id = data['room_id']
     player_id = data['player_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     game = games[room_id]
     success, message = game.vote(player_id, data['target_id'])
-    emit('vote_result', {'success': success, 'message': message})
+    transport.emit('vote_result', {'success': success, 'message': message}, to=sid)
+    if success:
+        throttled(game.throttles, 'progress', broadcast_progress, room_id)
 
-@socketio.on('vote_confirm')
-def handle_vote_confirm(data):
+@on_event('vote_confirm')
+def handle_vote_confirm(sid, data):
     room_id = data['room_id']
     player_id = data['player_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     game = games[room_id]
-    everyone_done = game.confirm_vote(player_id)
-    if everyone_done:
-        success, message = game.process_vote()
-        if success:
-            socketio.emit('phase_changed', {
-                'new_phase': game.game_state,
-                'game_state': game.get_game_state()
-            }, room=room_id)
-        game.votes = {}
-
-@socketio.on('wolf_king_revenge')
-def handle_wolf_king_revenge(data):
+    confirm_and_advance(game, game.confirm_vote, advance_vote, player_id)
+
+@on_event('wolf_king_revenge')
+def handle_wolf_king_revenge(sid, data):
     room_id = data['room_id']
     target_id = data['target_id']
     if room_id not in games:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     game = games[room_id]
     if not game.revenge_waiting:
-        emit('error', {'message': '沒有狼王需要報復'})
+        transport.emit('error', {'message': '沒有狼王需要報復'}, to=sid)
         return
-    game.wolf_king_revenge(target_id)
-    socketio.emit('phase_changed', {
-        'new_phase': game.game_state,
-        'game_state': game.get_game_state()
-    }, room=room_id)
+    advance_revenge(game, target_id)
 
-@socketio.on('wolf_night_chat')
-def handle_wolf_night_chat(data):
+@on_event('wolf_night_chat')
+def handle_wolf_night_chat(sid, data):
     room_id = data['room_id']
     player_id = data['player_id']
     message = data['message']
     game = games.get(room_id)
     if not game:
-        emit('error', {'message': '房間不存在'})
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
         return
     player = game.players.get(player_id)
     if not player or not player['alive'] or game.all_roles[player['role']]['team'] != 'werewolf':
-        emit('error', {'message': '你不是狼人或你已經死亡'})
+        transport.emit('error', {'message': '你不是狼人或你已經死亡'}, to=sid)
         return
-    wolf_room = room_id + "_wolves"
-    socketio.emit('wolf_night_message', {
+    if not isinstance(message, str) or not message.strip():
+        transport.emit('error', {'message': '訊息不可為空'}, to=sid)
+        return
+    if len(message) > WOLF_CHAT_MAX_LEN:
+        transport.emit('error', {'message': f'訊息不可超過{WOLF_CHAT_MAX_LEN}字'}, to=sid)
+        return
+    entry = {
         'player_name': player['name'],
-        'message': message
-    }, room=wolf_room)
+        'message': message,
+        'time': datetime.now().strftime("%H:%M:%S")
+    }
+    game.wolf_chat.append(entry)
+    if WOLF_CHAT_BATCH_MS:
+        # 時間窗內的訊息合併成一次送出
+        if not game.wolf_chat_pending:
+            call_later(WOLF_CHAT_BATCH_MS / 1000, flush_wolf_chat, room_id)
+        game.wolf_chat_pending.append(entry)
+        return
+    transport.emit('wolf_night_message', entry, to=room_id + "_wolves")
+
+@on_event('admin_profile')
+def handle_admin_profile(sid, data):
+    if not is_admin(data):
+        transport.emit('error', {'message': '沒有管理員權限'}, to=sid)
+        return
+    path = None
+    if data.get('mode'):
+        try:
+            path = profiler.configure(data['mode'], data.get('room_id'), data.get('rate', 1.0))
+        except ValueError:
+            transport.emit('error', {'message': '不支援的剖析模式'}, to=sid)
+            return
+    elif data.get('dump'):
+        path = profiler.dump()
+    transport.emit('admin_profile_status', {
+        'mode': profiler.mode,
+        'room_id': profiler.room_id,
+        'rate': profiler.rate,
+        'dumped': path
+    }, to=sid)
+
+def admin_room_info(game):
+    return {
+        'room_id': game.room_id,
+        'seed': game.seed,
+        'game_state': game.get_full_state(),
+        'game_log': game.game_log[-ADMIN_LOG_TAIL:],
+        'spectators': len(game.spectators)
+    }
+
+@on_event('admin_room_info')
+def handle_admin_room_info(sid, data):
+    if not is_admin(data):
+        transport.emit('error', {'message': '沒有管理員權限'}, to=sid)
+        return
+    game = games.get(data['room_id'])
+    if not game:
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
+        return
+    transport.emit('admin_room_info', admin_room_info(game), to=sid)
+
+# 錦標賽：每桌是一般房間，結束時經 on_game_ended 回報成績，整輪結束後重新分桌
+tournaments = {}
+tournament_sids = {}  # socket_id -> (錦標賽 ID, 參賽者 ID)
+
+def tournament_room(tournament_id):
+    return "tournament_" + tournament_id
+
+def push_standings(tournament_id):
+    tournament = tournaments.get(tournament_id)
+    if tournament:
+        transport.emit('tournament_standings', tournament.summary(), to=tournament_room(tournament_id))
+
+def standings_changed(tournament):
+    # 大型賽事同時有很多桌結束，排名合併節流送出
+    throttled(tournament.throttles, 'standings', push_standings, tournament.tournament_id)
+
+def close_table(room_id):
+    game = games.get(room_id)
+    if not game:
+        return
+    for player in game.players.values():
+        if player['socket_id']:
+            transport.leave_room(player['socket_id'], room_id)
+            transport.leave_room(player['socket_id'], room_id + "_wolves")
+    del games[room_id]
+
+def open_table(tournament, entrant_ids):
+    room_id = str(uuid.uuid4())[:8]
+    game = WerewolfGame(room_id)
+    game.tournament_id = tournament.tournament_id
+    for entrant_id in entrant_ids:
+        entrant = tournament.entrants[entrant_id]
+        player_id = game.add_player(entrant['name'], entrant['socket_id'], entrant['profile_id'])
+        game.tournament_seats[player_id] = entrant_id
+    while len(game.players) < tournament.table_size:
+        game.add_bot()
+    game.host_id = None  # 錦標賽的桌由伺服器開局，沒有房主
+    game.set_custom_roles(tournament.roles)
+    games[room_id] = game
+    game.start_game()
+    tournament.add_table(room_id, entrant_ids)
+    for player_id, entrant_id in game.tournament_seats.items():
+        player = game.players[player_id]
+        transport.enter_room(player['socket_id'], room_id)
+        transport.emit('tournament_table', {
+            'tournament_id': tournament.tournament_id,
+            'round': tournament.round,
+            'room_id': room_id,
+            'player_id': player_id,
+            'resume_token': player['resume_token']
+        }, to=player['socket_id'])
+    begin_game(game)
+
+def start_round(tournament_id):
+    tournament = tournaments.get(tournament_id)
+    if not tournament or tournament.state not in ('registering', 'between_rounds'):
+        return
+    for room_id in tournament.tables:
+        close_table(room_id)
+    tournament.tables = {}
+    if len(tournament.active_entrants()) < 2:
+        tournament.state = 'finished'
+        finish_tournament(tournament_id)
+        return
+    for entrant_ids in tournament.seat_round():
+        open_table(tournament, entrant_ids)
+        transport.yield_now()  # 一次開很多桌時，每桌之間讓其他事件先處理
+    standings_changed(tournament)
+
+def finish_tournament(tournament_id):
+    tournament = tournaments.pop(tournament_id, None)
+    if not tournament:
+        return
+    transport.emit('tournament_standings', tournament.summary(), to=tournament_room(tournament_id))
+    for room_id in tournament.tables:
+        close_table(room_id)
+    for entrant in tournament.entrants.values():
+        if entrant['socket_id']:
+            tournament_sids.pop(entrant['socket_id'], None)
+            transport.leave_room(entrant['socket_id'], tournament_room(tournament_id))
+
+def tournament_table_ended(game, abandoned=False):
+    tournament = tournaments.get(game.tournament_id)
+    if not tournament:
+        return
+    results = {}
+    winning_team = WINNER_TEAMS.get(game.winner)
+    for player_id, entrant_id in game.tournament_seats.items():
+        player = game.players.get(player_id)
+        if abandoned or player is None:
+            continue  # 中途離開不計分
+        team = game.all_roles[player['role']]['team']
+        results[entrant_id] = (None if winning_team is None else team == winning_team, player['alive'])
+    if not tournament.record_table(game.room_id, results):
+        standings_changed(tournament)
+        return
+    push_standings(tournament.tournament_id)
+    # 留一段時間讓玩家看結果，再分下一輪或結束
+    if tournament.state == 'finished':
+        call_later(TOURNAMENT_ROUND_DELAY, finish_tournament, tournament.tournament_id)
+    else:
+        call_later(TOURNAMENT_ROUND_DELAY, start_round, tournament.tournament_id)
+
+@on_event('create_tournament')
+def handle_create_tournament(sid, data):
+    if not is_admin(data):
+        transport.emit('error', {'message': '沒有管理員權限'}, to=sid)
+        return
+    table_size, rounds, roles = data['table_size'], data['rounds'], data['roles']
+    if not 4 <= table_size <= 20 or not 1 <= rounds <= 20:
+        transport.emit('error', {'message': '每桌需 4 到 20 人，輪數需 1 到 20 輪'}, to=sid)
+        return
+    try:
+        roles = validate_roles(roles, ROLE_DEFINITIONS)
+    except RoleConfigError as exc:
+        transport.emit('error', {'message': str(exc)}, to=sid)
+        return
+    if sum(role['count'] for role in roles) != table_size:
+        transport.emit('error', {'message': '角色總數與每桌人數不符'}, to=sid)
+        return
+    seed = data.get('seed')
+    if seed is not None and not 0 <= seed < 2 ** 64:
+        transport.emit('error', {'message': '種子必須介於 0 與 2^64 之間'}, to=sid)
+        return
+    tournament_id = str(uuid.uuid4())[:8]
+    tournaments[tournament_id] = Tournament(tournament_id, data['name'], table_size, rounds, roles, seed)
+    transport.enter_room(sid, tournament_room(tournament_id))
+    transport.emit('tournament_created', tournaments[tournament_id].summary(), to=sid)
+
+@on_event('join_tournament')
+def handle_join_tournament(sid, data):
+    tournament = tournaments.get(data['tournament_id'])
+    if not tournament:
+        transport.emit('error', {'message': '錦標賽不存在'}, to=sid)
+        return
+    if tournament.state != 'registering':
+        transport.emit('error', {'message': '錦標賽已開始，無法報名'}, to=sid)
+        return
+    if sid in tournament_sids:
+        transport.emit('error', {'message': '已經報名其他錦標賽'}, to=sid)
+        return
+    if len(tournament.entrants) >= MAX_TOURNAMENT_ENTRANTS:
+        transport.emit('error', {'message': '報名人數已滿'}, to=sid)
+        return
+    error = admission_error(creating_room=False)
+    if error:
+        transport.emit('error', {'message': error}, to=sid)
+        return
+    profile_id = player_profile(data, data['player_name'])
+    entrant_id = tournament.add_entrant(data['player_name'], sid, profile_id)
+    tournament_sids[sid] = (tournament.tournament_id, entrant_id)
+    transport.enter_room(sid, tournament_room(tournament.tournament_id))
+    transport.emit('tournament_joined', {
+        'tournament_id': tournament.tournament_id,
+        'entrant_id': entrant_id,
+        'profile_id': profile_id
+    }, to=sid)
+    standings_changed(tournament)
+
+@on_event('start_tournament')
+def handle_start_tournament(sid, data):
+    if not is_admin(data):
+        transport.emit('error', {'message': '沒有管理員權限'}, to=sid)
+        return
+    tournament = tournaments.get(data['tournament_id'])
+    if not tournament or tournament.state != 'registering':
+        transport.emit('error', {'message': '錦標賽不存在或已開始'}, to=sid)
+        return
+    if len(tournament.active_entrants()) < 2:
+        transport.emit('error', {'message': '至少需要2名參賽者'}, to=sid)
+        return
+    start_round(tournament.tournament_id)
+
+def rejoin_tournament(game, player_id, sid):
+    tournament = tournaments.get(game.tournament_id)
+    entrant_id = game.tournament_seats.get(player_id)
+    if not tournament or not entrant_id:
+        return
+    tournament.entrants[entrant_id]['socket_id'] = sid
+    tournament_sids[sid] = (tournament.tournament_id, entrant_id)
+    transport.enter_room(sid, tournament_room(tournament.tournament_id))
+
+def leave_tournament(sid):
+    entry = tournament_sids.pop(sid, None)
+    tournament = tournaments.get(entry[0]) if entry else None
+    if not tournament:
+        return
+    if tournament.state == 'registering':
+        del tournament.entrants[entry[1]]
+    else:
+        # 已開賽的成績保留，但不再排進下一輪
+        tournament.entrants[entry[1]]['socket_id'] = None
+    standings_changed(tournament)
+
+@on_event('get_leaderboard')
+def handle_get_leaderboard(sid, data):
+    if not rating_service:
+        transport.emit('error', {'message': '排行榜未啟用'}, to=sid)
+        return
+    if not rating_service.loaded:
+        transport.emit('error', {'message': '排行榜載入中，請稍後再試'}, to=sid)
+        return
+    limit = min(max(data.get('limit') or 20, 1), 100)
+    transport.emit('leaderboard', {'top': rating_service.top(limit)}, to=sid)
+
+@on_event('get_rank')
+def handle_get_rank(sid, data):
+    if not rating_service:
+        transport.emit('error', {'message': '排行榜未啟用'}, to=sid)
+        return
+    if not rating_service.loaded:
+        transport.emit('error', {'message': '排行榜載入中，請稍後再試'}, to=sid)
+        return
+    transport.emit('player_rank', rating_service.rank(data['profile_id']), to=sid)
+
+@on_event('spectate_room')
+def handle_spectate_room(sid, data):
+    global spectator_pump_running
+    room_id = data['room_id']
+    if room_id not in games:
+        transport.emit('error', {'message': '房間不存在'}, to=sid)
+        return
+    game = games[room_id]
+    if len(game.spectators) >= MAX_SPECTATORS:
+        transport.emit('error', {'message': '觀戰人數已滿'}, to=sid)
+        return
+    # 只給已過延遲時間的狀態；還沒有到期的畫面時先不給，等第一幀到期再由 pump_spectators 送出
+    advance_spectator_view(game, time.monotonic())
+    game.spectators[sid] = data.get('spectator_name', '')
+    transport.enter_room(sid, spectator_room(room_id))
+    spectated_rooms.add(room_id)
+    if not spectator_pump_running:
+        spectator_pump_running = True
+        call_later(SPECTATOR_PUMP_INTERVAL, pump_spectators)
+    transport.emit('spectating', {
+        'room_id': room_id,
+        'delay': SPECTATOR_DELAY,
+        'game_state': game.spectator_view
+    }, to=sid)
+
+@on_event('resume_session')
+def handle_resume_session(sid, data):
+    room_id = data['room_id']
+    game = games.get(room_id)
+    if not game:
+        # 房間可能還在交接途中，客戶端稍後重試
+        transport.emit('resume_failed', {'message': '房間尚未移轉完成', 'retry': True}, to=sid)
+        return
+    player = game.players.get(data['player_id'])
+    if not player or not hmac.compare_digest(player['resume_token'], data['resume_token']):
+        transport.emit('resume_failed', {'message': '無法恢復遊戲，請重新加入', 'retry': False}, to=sid)
+        return
+    player['socket_id'] = sid
+    game.mark_seen(data['player_id'], time.monotonic())
+    transport.enter_room(sid, room_id)
+    rejoin_tournament(game, data['player_id'], sid)
+    if game.game_state != 'waiting':
+        game.wolf_room_members.discard(data['player_id'])
+        join_wolf_room(game, room_id)
+    transport.emit('session_resumed', {
+        'room_id': room_id,
+        'player_id': data['player_id'],
+        'role_info': game.get_player_role_info(data['player_id']) if player['role'] else None,
+        'game_state': game.get_game_state(data['player_id'])
+    }, to=sid)
+
+# 管理面板：統計由計數器即時維護，推送時只讀計數器，不掃描 games
+admin_sids = set()
+dashboard = {'running': False, 'last_at': 0.0, 'last_events': 0}
+
+def dashboard_stats():
+    now = time.monotonic()
+    elapsed = now - dashboard['last_at'] or 1
+    events = server_counters['events']
+    latency = {event: histogram.summary() for event, histogram in event_latency.items()}
+    event_latency.clear()
+    stats = {
+        'rooms': {state: count for state, count in room_states.items() if count},
+        'room_count': len(games),
+        'connections': server_counters['connections'],
+        'events_per_sec': round((events - dashboard['last_events']) / elapsed, 1),
+        'latency_ms': latency,
+        'rss_mb': round(current_rss_mb(), 1),
+        'offload': offload_stats(),
+        'schema_rejections': dict(schema_rejections),
+        'log': event_log.stats(),
+        'presence': dict(presence_stats),
+        'draining': drain_state['draining']
+    }
+    dashboard['last_at'] = now
+    dashboard['last_events'] = events
+    return stats
+
+def push_dashboard():
+    if not admin_sids:
+        dashboard['running'] = False
+        return
+    transport.emit('stats', dashboard_stats(), namespace='/admin', to='admins')
+    call_later(ADMIN_PUSH_INTERVAL, push_dashboard)
+
+@on_socket('connect', namespace='/admin')
+def handle_admin_connect(sid, auth=None):
+    if not is_admin(auth):
+        return False
+    admin_sids.add(sid)
+    transport.enter_room(sid, 'admins', namespace='/admin')
+    if not dashboard['running']:
+        dashboard['running'] = True
+        dashboard['last_at'] = time.monotonic()
+        dashboard['last_events'] = server_counters['events']
+        event_latency.clear()
+        call_later(ADMIN_PUSH_INTERVAL, push_dashboard)
+
+@on_socket('disconnect', namespace='/admin')
+def handle_admin_disconnect(sid, reason=None):
+    admin_sids.discard(sid)
+
+@on_socket('room_detail', namespace='/admin')
+def handle_room_detail(sid, data=None):
+    room_id = data.get('room_id') if isinstance(data, dict) else None
+    game = games.get(room_id) if isinstance(room_id, str) else None
+    if not game:
+        transport.emit('error', {'message': '房間不存在'}, to=sid, namespace='/admin')
+        return
+    transport.emit('room_detail', admin_room_info(game), to=sid, namespace='/admin')
+
+# 每個房間估算的欄位；角色表(all_roles)由所有房間共用，不算進單一房間
+ROOM_MEMORY_FIELDS = (
+    'players', 'game_log', 'night_actions', 'night_confirmations', 'day_confirmations', 'voting_confirmations',
+    'votes', 'vote_counts', 'vote_buckets', 'deaths', 'wolf_chat', 'wolf_chat_pending', 'spectators',
+    'spectator_frames', 'spectator_view', 'throttles', '_views', 'witch_potions'
+)
+memory_trace = {'snapshot': None, 'taken_at': None}
 
-@socketio.on('disconnect')
-def handle_disconnect():
+def deep_sizeof(obj, seen):
+    # 沿容器遞迴加總 sys.getsizeof；seen 裡的物件不重算，結果是近似值
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+    return size
+
+def room_memory(game):
+    seen = set()
+    fields = {name: deep_sizeof(getattr(game, name), seen) for name in ROOM_MEMORY_FIELDS}
+    return {
+        'room_id': game.room_id,
+        'game_state': game.game_state,
+        'players': len(game.players),
+        'connected': sum(1 for player in game.players.values() if player['socket_id']),
+        'game_log_lines': len(game.game_log),
+        'bytes': sum(fields.values()),
+        'fields': fields
+    }
+
+def memory_report(limit):
+    # 在事件迴圈上掃過所有房間，背景執行緒讀房間資料會和處理器同時改動
+    rooms = [room_memory(game) for game in list(games.values())]
+    totals = Counter()
+    for room in rooms:
+        totals.update(room['fields'])
+    rooms.sort(key=lambda room: room['bytes'], reverse=True)
+    return {
+        'room_count': len(rooms),
+        'room_bytes': sum(totals.values()),
+        'field_bytes': dict(totals.most_common()),
+        'rooms': rooms[:limit],
+        'rss_mb': round(current_rss_mb(), 1),
+        'objects': len(gc.get_objects()),
+        'tracing': tracemalloc.is_tracing()
+    }
+
+def memory_trace_diff():
+    # 與上一次快照比較，依配置位置(檔案:行號)分組；第一次只列出目前最大的位置
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    previous, previous_at = memory_trace['snapshot'], memory_trace['taken_at']
+    memory_trace['snapshot'], memory_trace['taken_at'] = snapshot, time.monotonic()
+    if previous is None:
+        stats = [(stat, 0, 0) for stat in snapshot.statistics('lineno')[:MEMORY_TRACE_TOP]]
+    else:
+        stats = [(stat, stat.size_diff, stat.count_diff) for stat in snapshot.compare_to(previous, 'lineno')[:MEMORY_TRACE_TOP]]
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'interval': memory_trace['taken_at'] - previous_at if previous_at else None,
+        'traced_kb': round(current / 1024, 1),
+        'peak_kb': round(peak / 1024, 1),
+        'sites': [{
+            'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            'size_kb': round(stat.size / 1024, 1),
+            'size_diff_kb': round(size_diff / 1024, 1),
+            'count': stat.count,
+            'count_diff': count_diff
+        } for stat, size_diff, count_diff in stats]
+    }
+
+def set_memory_trace(frames):
+    if frames > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    elif frames <= 0 and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    memory_trace['snapshot'] = memory_trace['taken_at'] = None
+
+@on_socket('memory_report', namespace='/admin')
+def handle_memory_report(sid, data=None):
+    data = data if isinstance(data, dict) else {}
+    limit = data.get('limit')
+    report = memory_report(min(max(limit, 1), 500) if isinstance(limit, int) else MEMORY_TOP_ROOMS)
+    if not report['tracing']:
+        transport.emit('memory_report', report, to=sid, namespace='/admin')
+        return
+
+    def send(trace):
+        report['trace'] = trace
+        transport.emit('memory_report', report, to=sid, namespace='/admin')
+    # 快照與比較很慢，交給工作執行緒
+    offload(memory_trace_diff, callback=send)
+
+@on_socket('memory_trace', namespace='/admin')
+def handle_memory_trace(sid, data=None):
+    frames = data.get('frames') if isinstance(data, dict) else None
+    if not isinstance(frames, int) or not 0 <= frames <= 50:
+        transport.emit('error', {'message': 'frames 必須是 0 到 50 的整數'}, to=sid, namespace='/admin')
+        return
+    set_memory_trace(frames)
+    transport.emit('memory_trace', {'tracing': tracemalloc.is_tracing()}, to=sid, namespace='/admin')
+
+@on_socket('connect')
+def handle_connect(sid, auth=None):
+    server_counters['connections'] += 1
+    event_log.event('connect', sid=sid, ip=client_ip(sid))
+    transport.emit('presence_config', {'heartbeat_interval': HEARTBEAT_INTERVAL}, to=sid)
+
+@on_socket('disconnect')
+def handle_disconnect(sid, reason=None):
+    server_counters['connections'] -= 1
+    sid_buckets.pop(sid, None)
+    event_log.event('disconnect', sid=sid, reason=reason)
+    leave_tournament(sid)
+    abandoned = []
     for room_id, game in games.items():
+        if sid in game.spectators:
+            del game.spectators[sid]
+            continue
         for player_id, player in game.players.items():
-            if player['socket_id'] == request.sid:
+            if player['socket_id'] == sid:
                 game.remove_player(player_id)
-                leave_room(room_id)
-                socketio.emit('player_left', {
+                transport.leave_room(sid, room_id)
+                if not game.has_humans():
+                    # 只剩機器人的房間直接回收，不讓機器人自己打完
+                    abandoned.append(room_id)
+                    break
+                broadcast_state(room_id, 'player_left', {
                     'player_name': player['name'],
                     'game_state': game.get_game_state()
-                }, room=room_id)
+                })
                 break
+    for room_id in abandoned:
+        if games[room_id].tournament_id:
+            tournament_table_ended(games[room_id], abandoned=True)
+        del games[room_id]
 
+def register_flask_handlers():
+    for (namespace, event), handler in SOCKET_HANDLERS.items():
+        def dispatch(*args, handler=handler):
+            return handler(request.sid, *args)
+        socketio.on(event, namespace=namespace)(dispatch)
 
+register_flask_handlers()
+if SERVER_MODE == 'eventlet':
+    socketio.init_app(app)
 
-
-    # HTML模板
-HTML_TEMPLATE ='''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>狼人殺遊戲</title>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.0/socket.io.js"></script>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            margin: 0;
-            padding: 20px;
-            background: #1a1a1a;
-            color: #fff;
-        }
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-        }
-        .card {
-            background: #2d2d2d;
-            border-radius: 10px;
-            padding: 20px;
-            margin: 10px 0;
-            box-shadow: 0 4px 6px rgba(0,0,0,0.3);
-        }
-        .btn {
-            background: #4CAF50;
-            color: white;
-            padding: 10px 15px;
-            border: none;
-            border-radius: 5px;
-            cursor: pointer;
-            margin: 5px;
-        }
-        .btn:hover {
-            background: #45a049;
-        }
-        .btn-danger {
-            background: #f44336;
-        }
-        .btn-danger:hover {
-            background: #da190b;
-        }
-        .btn-warning {
-            background: #ff9800;
-        }
-        .btn-warning:hover {
-            background: #e68900;
-        }
-        input, select {
-            padding: 8px;
-            margin: 5px;
-            border: 1px solid #555;
-            border-radius: 4px;
-            background: #333;
-            color: #fff;
-        }
-        .role-config {
-            display: flex;
-            align-items: center;
-            margin: 10px 0;
-        }
-        .role-config label {
-            min-width: 100px;
-        }
-        .players-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(200px, 1fr));
-            gap: 10px;
-        }
-        .player-card {
-            background: #3d3d3d;
-            padding: 15px;
-            border-radius: 8px;
-            text-align: center;
-        }
-        .player-alive {
-            border-left: 4px solid #4CAF50;
-        }
-        .player-dead {
-            border-left: 4px solid #f44336;
-            opacity: 0.6;
-        }
-        .game-log {
-            height: 200px;
-            overflow-y: auto;
-            background: #1e1e1e;
-            padding: 10px;
-            border-radius: 5px;
-            font-family: monospace;
-        }
-        .hidden {
-            display: none;
-        }
-        .role-info {
-            background: #4a4a4a;
-            padding: 15px;
-            border-radius: 8px;
-            margin: 10px 0;
-        }
-        .werewolf {
-            background: #8b0000;
-        }
-        .village {
-            background: #228b22;
-        }
-        .action-buttons {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 10px;
-            margin: 10px 0;
-        }
-        .phase-indicator {
-            font-size: 24px;
-            font-weight: bold;
-            text-align: center;
-            padding: 20px;
-        }
-        .night {
-            background: #191970;
-        }
-        .day {
-            background: #ffa500;
-            color: #000;
-        }
-        .voting {
-            background: #dc143c;
-        }
-        .ended {
-            background: #666;
-        }
-        /* 狼人聊天室樣式 */
-        #wolf-chat {
-            margin-top: 10px;
-            background: #232338;
-            border: 2px solid #8b0000;
-        }
-        #wolf-chat-messages {
-            height: 100px;
-            overflow-y: auto;
-            background: #222;
-            padding: 8px;
-            margin-bottom: 8px;
-            border-radius: 4px;
-            font-size: 15px;
-        }
-        #wolf-chat-input {
-            width: 70%;
-        }
-        #witch-night-info {
-            color: #ff0;
-            margin-bottom: 8px;
-        }
-        #not-wolf-leader-tip {
-            color: #ffb;
-            background: #444;
-            padding: 6px;
-            border-radius: 5px;
-            margin: 10px 0;
-            font-size: 15px;
-            text-align: center;
-        }
-    </style>
-</head>
-<body>
-<div class="container">
-    <h1>🐺 狼人殺遊戲</h1>
-    <!-- 登入界面 -->
-    <div id="login-screen" class="card">
-        <h2>加入遊戲</h2>
-        <input type="text" id="player-name" placeholder="輸入你的名字" maxlength="20">
-        <br>
-        <button class="btn" onclick="createRoom()">創建房間</button>
-        <input type="text" id="room-id" placeholder="房間ID" maxlength="8">
-        <button class="btn" onclick="joinRoom()">加入房間</button>
-    </div>
-    <!-- 房間設置界面 -->
-    <div id="room-setup" class="card hidden">
-        <h2>房間設置</h2>
-        <p>房間ID: <span id="current-room-id"></span></p>
-        <div id="host-controls" class="hidden">
-            <h3>角色配置</h3>
-            <div id="role-config">
-                <div class="role-config"><label>村民:</label><input type="number" id="villager-count" min="0" max="20" value="2"></div>
-                <div class="role-config"><label>狼人:</label><input type="number" id="werewolf-count" min="1" max="10" value="2"></div>
-                <div class="role-config"><label>預言家:</label><input type="number" id="seer-count" min="0" max="2" value="1"></div>
-                <div class="role-config"><label>女巫:</label><input type="number" id="witch-count" min="0" max="2" value="1"></div>
-                <div class="role-config"><label>獵人:</label><input type="number" id="hunter-count" min="0" max="2" value="1"></div>
-                <div class="role-config"><label>守衛:</label><input type="number" id="guard-count" min="0" max="2" value="1"></div>
-                <div class="role-config"><label>狼王:</label><input type="number" id="wolf_king-count" min="0" max="2" value="0"></div>
-                <div class="role-config"><label>白狼王:</label><input type="number" id="white_wolf_king-count" min="0" max="1" value="0"></div>
-                <div class="role-config"><label>騎士:</label><input type="number" id="knight-count" min="0" max="2" value="0"></div>
-                <div class="role-config"><label>白痴:</label><input type="number" id="idiot-count" min="0" max="1" value="0"></div>
-            </div>
-            <p>總角色數: <span id="total-roles">8</span> | 當前玩家數: <span id="current-players">0</span></p>
-            <button class="btn" onclick="updateRoles()">更新角色配置</button>
-            <button class="btn btn-warning" onclick="startGame()">開始遊戲</button>
-        </div>
-    </div>
-    <!-- 遊戲界面 -->
-    <div id="game-screen" class="hidden">
-        <div id="phase-indicator" class="phase-indicator">等待開始</div>
-        <div id="role-info" class="role-info hidden">
-            <h3>你的角色</h3>
-            <p><strong>角色:</strong> <span id="my-role"></span></p>
-            <p><strong>陣營:</strong> <span id="my-team"></span></p>
-            <p><strong>能力:</strong> <span id="my-ability"></span></p>
-            <div id="teammates" class="hidden">
-                <p><strong>隊友:</strong> <span id="teammate-list"></span></p>
-            </div>
-        </div>
-        <!-- 狼人聊天室 -->
-        <div id="wolf-chat" class="card hidden">
-            <h4>狼人聊天室（僅夜晚狼人可見）</h4>
-            <div id="wolf-chat-messages"></div>
-            <input id="wolf-chat-input" type="text" placeholder="輸入訊息">
-            <button onclick="sendWolfMessage()">發送</button>
-        </div>
-        <div id="action-area" class="card">
-            <h3>行動區域</h3>
-            <div id="night-actions" class="hidden">
-                <h4>夜晚行動</h4>
-                <div id="not-wolf-leader-tip" class="hidden">狼人請在聊天室討論，由「首狼人」代表決定殺人對象。</div>
-                <div id="witch-night-info" class="hidden"></div>
-                <div class="action-buttons" id="night-buttons"></div>
-                <select id="night-target" class="hidden">
-                    <option value="">選擇目標</option>
-                </select>
-                <select id="additional-target" class="hidden">
-                    <option value="">選擇第二個目標</option>
-                </select>
-                <button class="btn hidden" id="confirm-night-action" onclick="confirmNightAction()">確認行動</button>
-                <button class="btn hidden" id="night-confirm-btn" onclick="nightConfirm()">我已完成夜晚行動</button>
-            </div>
-            <div id="day-actions" class="hidden">
-                <h4>白天行動</h4>
-                <div class="action-buttons" id="day-buttons"></div>
-                <select id="day-target" class="hidden">
-                    <option value="">選擇目標</option>
-                </select>
-                <button class="btn hidden" id="confirm-day-action" onclick="confirmDayAction()">確認行動</button>
-                <button class="btn hidden" id="day-confirm-btn" onclick="dayConfirm()">我已完成白天行動</button>
-            </div>
-            <div id="voting-area" class="hidden">
-                <h4>投票出局</h4>
-                <select id="vote-target">
-                    <option value="">選擇投票目標</option>
-                </select>
-                <button class="btn" onclick="vote()">投票</button>
-                <button class="btn" id="vote-confirm-btn" onclick="voteConfirm()">我已完成投票</button>
-            </div>
-        </div>
-        <div class="card">
-            <h3>玩家列表</h3>
-            <div id="players-list" class="players-grid"></div>
-        </div>
-        <div class="card">
-            <h3>遊戲記錄</h3>
-            <div id="game-log" class="game-log"></div>
-        </div>
-    </div>
-</div>
-<script>
-const socket = io();
-let currentRoomId = null;
-let currentPlayerId = null;
-let isHost = false;
-let myRole = null;
-let gameState = null;
-let witchKilledId = null;
-
-// 角色配置更新
-function updateRoleCount() {
-    const roles = ['villager', 'werewolf', 'seer', 'witch', 'hunter', 'guard', 'wolf_king', 'white_wolf_king', 'knight', 'idiot'];
-    let total = 0;
-    roles.forEach(role => {
-        const count = parseInt(document.getElementById(role + '-count').value) || 0;
-        total += count;
-    });
-    document.getElementById('total-roles').textContent = total;
-}
-document.addEventListener('DOMContentLoaded', function() {
-    const roleInputs = document.querySelectorAll('#role-config input[type="number"]');
-    roleInputs.forEach(input => {
-        input.addEventListener('change', updateRoleCount);
-    });
-    updateRoleCount();
-});
-function createRoom() {
-    const playerName = document.getElementById('player-name').value.trim();
-    if (!playerName) { alert('請輸入玩家名字'); return; }
-    socket.emit('create_room', { player_name: playerName });
-}
-function joinRoom() {
-    const playerName = document.getElementById('player-name').value.trim();
-    const roomId = document.getElementById('room-id').value.trim();
-    if (!playerName || !roomId) { alert('請輸入玩家名字和房間ID'); return; }
-    socket.emit('join_room', { player_name: playerName, room_id: roomId });
-}
-function updateRoles() {
-    const roles = [];
-    const roleNames = ['villager', 'werewolf', 'seer', 'witch', 'hunter', 'guard', 'wolf_king', 'white_wolf_king', 'knight', 'idiot'];
-    roleNames.forEach(role => {
-        const count = parseInt(document.getElementById(role + '-count').value) || 0;
-        if (count > 0) { roles.push({ role: role, count: count }); }
-    });
-    socket.emit('set_roles', { room_id: currentRoomId, player_id: currentPlayerId, roles: roles });
-}
-function startGame() {
-    socket.emit('start_game', { room_id: currentRoomId, player_id: currentPlayerId });
-}
-function confirmNightAction() {
-    const actionType = document.querySelector('#night-buttons .btn.selected')?.dataset.action;
-    const target = document.getElementById('night-target').value;
-    const additionalTarget = document.getElementById('additional-target').value;
-    if (!actionType) { alert('請選擇行動類型'); return; }
-    if (!target && actionType !== 'peek') { alert('請選擇目標'); return; }
-    socket.emit('night_action', {
-        room_id: currentRoomId,
-        player_id: currentPlayerId,
-        action_type: actionType,
-        target_id: target || null,
-        additional_target: additionalTarget || null
-    });
-}
-function nightConfirm() {
-    socket.emit('night_confirm', { room_id: currentRoomId, player_id: currentPlayerId });
-    document.getElementById('night-confirm-btn').classList.add('hidden');
-}
-function confirmDayAction() {
-    const actionType = document.querySelector('#day-buttons .btn.selected')?.dataset.action;
-    const target = document.getElementById('day-target').value;
-    if (!actionType || !target) { alert('請選擇行動類型和目標'); return; }
-    socket.emit('day_action', {
-        room_id: currentRoomId,
-        player_id: currentPlayerId,
-        action_type: actionType,
-        target_id: target
-    });
-}
-function dayConfirm() {
-    socket.emit('day_confirm', { room_id: currentRoomId, player_id: currentPlayerId });
-    document.getElementById('day-confirm-btn').classList.add('hidden');
-}
-// 狼人聊天室
-function sendWolfMessage() {
-    const msg = document.getElementById('wolf-chat-input').value.trim();
-    if (!msg) return;
-    socket.emit('wolf_night_chat', {
-        room_id: currentRoomId,
-        player_id: currentPlayerId,
-        message: msg
-    });
-    document.getElementById('wolf-chat-input').value = '';
-}
-socket.on('wolf_night_message', function(data) {
-    const msgDiv = document.createElement('div');
-    msgDiv.textContent = `${data.player_name}: ${data.message}`;
-    document.getElementById('wolf-chat-messages').appendChild(msgDiv);
-    const box = document.getElementById('wolf-chat-messages');
-    box.scrollTop = box.scrollHeight;
-});
-// 狼王報復彈窗
-function showWolfKingRevengeSelector(alivePlayers) {
-    const selector = document.createElement('select');
-    selector.innerHTML = '<option value="">選擇要帶走的玩家</option>';
-    alivePlayers.forEach(player => {
-        if (player.id !== currentPlayerId) {
-            selector.innerHTML += `<option value="${player.id}">${player.name}</option>`;
-        }
-    });
-    const btn = document.createElement('button');
-    btn.textContent = '確定帶走';
-    btn.className = 'btn btn-danger';
-    btn.onclick = function() {
-        const val = selector.value;
-        if (!val) { alert('請選擇玩家'); return; }
-        socket.emit('wolf_king_revenge', {
-            room_id: currentRoomId,
-            target_id: val
-        });
-        document.body.removeChild(document.getElementById('wolfking-revenge-modal'));
-    };
-    const modal = document.createElement('div');
-    modal.id = 'wolfking-revenge-modal';
-    modal.style = 'position:fixed;top:0;left:0;width:100vw;height:100vh;background:rgba(0,0,0,0.7);display:flex;align-items:center;justify-content:center;z-index:10000;';
-    modal.innerHTML = `<div style="background:#333;color:#fff;padding:40px;border-radius:12px;text-align:center;">
-        <h2>你是狼王，請選擇要帶走的人</h2>
-    </div>`;
-    modal.querySelector('div').appendChild(selector);
-    modal.querySelector('div').appendChild(document.createElement('br'));
-    modal.querySelector('div').appendChild(btn);
-    document.body.appendChild(modal);
-}
-function vote() {
-    const target = document.getElementById('vote-target').value;
-    if (!target) { alert('請選擇投票目標'); return; }
-    socket.emit('vote', { room_id: currentRoomId, player_id: currentPlayerId, target_id: target });
-}
-function voteConfirm() {
-    socket.emit('vote_confirm', { room_id: currentRoomId, player_id: currentPlayerId });
-    document.getElementById('vote-confirm-btn').classList.add('hidden');
-}
-function updatePlayersList(players) {
-    const playersContainer = document.getElementById('players-list');
-    playersContainer.innerHTML = '';
-    players.forEach(player => {
-        const playerDiv = document.createElement('div');
-        playerDiv.className = `player-card ${player.alive ? 'player-alive' : 'player-dead'}`;
-        let roleInfo = '';
-        if (player.role) {
-            roleInfo = `<br><small>${player.role} (${player.team})</small>`;
-        }
-        playerDiv.innerHTML = `
-            <strong>${player.name}</strong>
-            ${roleInfo}
-            <br><small>${player.alive ? '存活' : '死亡'}</small>
-            ${!player.can_vote && player.alive ? '<br><small>無投票權</small>' : ''}
-        `;
-        playersContainer.appendChild(playerDiv);
-    });
-    updateTargetSelectors(players);
-}
-function updateTargetSelectors(players) {
-    const alivePlayers = players.filter(p => p.alive && p.id !== currentPlayerId);
-    const nightTarget = document.getElementById('night-target');
-    nightTarget.innerHTML = '<option value="">選擇目標</option>';
-    alivePlayers.forEach(player => {
-        nightTarget.innerHTML += `<option value="${player.id}">${player.name}</option>`;
-    });
-    const additionalTarget = document.getElementById('additional-target');
-    additionalTarget.innerHTML = '<option value="">選擇第二個目標</option>';
-    players.filter(p => p.alive).forEach(player => {
-        additionalTarget.innerHTML += `<option value="${player.id}">${player.name}</option>`;
-    });
-    const dayTarget = document.getElementById('day-target');
-    dayTarget.innerHTML = '<option value="">選擇目標</option>';
-    alivePlayers.forEach(player => {
-        dayTarget.innerHTML += `<option value="${player.id}">${player.name}</option>`;
-    });
-    const voteTarget = document.getElementById('vote-target');
-    voteTarget.innerHTML = '<option value="">選擇投票目標</option>';
-    alivePlayers.forEach(player => {
-        voteTarget.innerHTML += `<option value="${player.id}">${player.name}</option>`;
-    });
-}
-function updateActionButtons(roleInfo, gameState) {
-    const nightButtons = document.getElementById('night-buttons');
-    const dayButtons = document.getElementById('day-buttons');
-    nightButtons.innerHTML = '';
-    dayButtons.innerHTML = '';
-    document.getElementById('not-wolf-leader-tip').classList.add('hidden');
-    document.getElementById('confirm-night-action').classList.add('hidden');
-    // 狼人代表制
-    if (!roleInfo) return;
-    if (gameState === 'night') {
-        if (roleInfo.ability === 'kill') {
-            if (roleInfo.wolf_leader) {
-                addActionButton(nightButtons, 'kill', '殺人');
-                document.getElementById('confirm-night-action').classList.remove('hidden');
-            } else {
-                // 不是首狼不能殺人，顯示提示
-                document.getElementById('not-wolf-leader-tip').classList.remove('hidden');
-            }
-        }
-        // 其他夜晚角色
-        if (roleInfo.ability && roleInfo.ability !== 'kill') {
-            if (roleInfo.ability === 'check') addActionButton(nightButtons, 'check', '查驗');
-            if (roleInfo.ability === 'protect') addActionButton(nightButtons, 'protect', '守護');
-            if (roleInfo.ability === 'potion') {
-                if (roleInfo.potions && roleInfo.potions.poison) addActionButton(nightButtons, 'poison', '毒殺');
-                if (roleInfo.potions && roleInfo.potions.antidote) addActionButton(nightButtons, 'antidote', '解藥');
-            }
-            if (roleInfo.ability === 'exchange') addActionButton(nightButtons, 'exchange', '交換');
-            if (roleInfo.ability === 'peek') addActionButton(nightButtons, 'peek', '偷看');
-            document.getElementById('confirm-night-action').classList.remove('hidden');
-        }
-    }
-    if (gameState === 'day') {
-        if (roleInfo.ability === 'duel') addActionButton(dayButtons, 'duel', '決鬥');
-        if (roleInfo.ability === 'self_destruct') addActionButton(dayButtons, 'self_destruct', '自爆');
-        document.getElementById('confirm-day-action').classList.remove('hidden');
-    }
-}
-function addActionButton(container, action, text) {
-    const button = document.createElement('button');
-    button.className = 'btn';
-    button.textContent = text;
-    button.dataset.action = action;
-    button.onclick = function() {
-        container.querySelectorAll('.btn').forEach(btn => btn.classList.remove('selected'));
-        this.classList.add('selected');
-        if (action === 'exchange') {
-            document.getElementById('night-target').classList.remove('hidden');
-            document.getElementById('additional-target').classList.remove('hidden');
-        } else if (action !== 'peek') {
-            if (container.id === 'night-buttons') {
-                document.getElementById('night-target').classList.remove('hidden');
-            } else {
-                document.getElementById('day-target').classList.remove('hidden');
-            }
-        }
-        if (container.id === 'night-buttons') {
-            document.getElementById('confirm-night-action').classList.remove('hidden');
-        } else {
-            document.getElementById('confirm-day-action').classList.remove('hidden');
-        }
-    };
-    container.appendChild(button);
-}
-function updateGameState(state) {
-    gameState = state;
-    document.getElementById('current-players').textContent = state.players.length;
-    const phaseIndicator = document.getElementById('phase-indicator');
-    const phaseText = {
-        'waiting': '等待開始',
-        'night': `第${state.day_count}夜`,
-        'day': `第${state.day_count}天`,
-        'voting': '投票階段',
-        'ended': '遊戲結束',
-        'wolf_king_revenge': '狼王報復'
-    };
-    phaseIndicator.textContent = phaseText[state.game_state] || state.game_state;
-    phaseIndicator.className = `phase-indicator ${state.game_state}`;
-    updatePlayersList(state.players);
-    const gameLog = document.getElementById('game-log');
-    gameLog.innerHTML = state.game_log.map(log => `<div>${log}</div>`).join('');
-    gameLog.scrollTop = gameLog.scrollHeight;
-    document.getElementById('night-actions').classList.toggle('hidden', state.game_state !== 'night');
-    document.getElementById('day-actions').classList.toggle('hidden', state.game_state !== 'day');
-    document.getElementById('voting-area').classList.toggle('hidden', state.game_state !== 'voting');
-    document.getElementById('host-game-controls').classList.add('hidden'); // 全員確定，不再顯示房主按鈕
-    isHost = state.is_host;
-    // 狼人聊天室只在夜晚且自己是狼人可見
-    if (state.game_state === 'night' && myRole && myRole.team === 'werewolf') {
-        document.getElementById('wolf-chat').classList.remove('hidden');
-    } else {
-        document.getElementById('wolf-chat').classList.add('hidden');
-        document.getElementById('wolf-chat-messages').innerHTML = '';
-    }
-    // 狼王報復觸發
-    if (state.game_state === "wolf_king_revenge" && state.revenge_waiting && state.revenge_waiting.wolf_king_id === currentPlayerId) {
-        showWolfKingRevengeSelector(state.players.filter(p => p.alive && p.id !== currentPlayerId));
-    } else if (document.getElementById('wolfking-revenge-modal')) {
-        document.body.removeChild(document.getElementById('wolfking-revenge-modal'));
-    }
-    // 確認按鈕顯示判斷
-    if (state.game_state === 'night') {
-        document.getElementById('night-confirm-btn').classList.remove('hidden');
-    } else {
-        document.getElementById('night-confirm-btn').classList.add('hidden');
-    }
-    if (state.game_state === 'day') {
-        document.getElementById('day-confirm-btn').classList.remove('hidden');
-    } else {
-        document.getElementById('day-confirm-btn').classList.add('hidden');
-    }
-    if (state.game_state === 'voting') {
-        document.getElementById('vote-confirm-btn').classList.remove('hidden');
-    } else {
-        document.getElementById('vote-confirm-btn').classList.add('hidden');
-    }
-    // 女巫夜晚資訊顯示重設
-    document.getElementById('witch-night-info').classList.add('hidden');
-    document.getElementById('witch-night-info').textContent = '';
-    // 狼人首領提示重設
-    document.getElementById('not-wolf-leader-tip').classList.add('hidden');
-}
-// 女巫夜晚得知誰被殺
-socket.on('witch_night_info', function(data) {
-    if (data && data.killed_player_id && data.killed_player_name) {
-        document.getElementById('witch-night-info').classList.remove('hidden');
-        document.getElementById('witch-night-info').textContent = `今晚被殺的是：${data.killed_player_name}`;
-        witchKilledId = data.killed_player_id;
-    } else {
-        document.getElementById('witch-night-info').classList.add('hidden');
-        document.getElementById('witch-night-info').textContent = '';
-        witchKilledId = null;
-    }
-});
-socket.on('room_created', function(data) {
-    currentRoomId = data.room_id;
-    currentPlayerId = data.player_id;
-    document.getElementById('current-room-id').textContent = currentRoomId;
-    document.getElementById('login-screen').classList.add('hidden');
-    document.getElementById('room-setup').classList.remove('hidden');
-    document.getElementById('host-controls').classList.remove('hidden');
-    updateGameState(data.game_state);
-});
-socket.on('joined_room', function(data) {
-    currentPlayerId = data.player_id;
-    document.getElementById('login-screen').classList.add('hidden');
-    document.getElementById('room-setup').classList.remove('hidden');
-    updateGameState(data.game_state);
-});
-socket.on('player_joined', function(data) { updateGameState(data.game_state); });
-socket.on('roles_updated', function(data) { updateGameState(data.game_state); });
-socket.on('role_assigned', function(data) {
-    myRole = data.role_info;
-    document.getElementById('my-role').textContent = myRole.role;
-    document.getElementById('my-team').textContent = myRole.team === 'werewolf' ? '狼人陣營' : '好人陣營';
-    document.getElementById('my-ability').textContent = myRole.description;
-    if (myRole.teammates && myRole.teammates.length > 0) {
-        document.getElementById('teammates').classList.remove('hidden');
-        document.getElementById('teammate-list').textContent = myRole.teammates.map(t => t.name).join(', ');
-    } else {
-        document.getElementById('teammates').classList.add('hidden');
-    }
-    document.getElementById('room-setup').classList.add('hidden');
-    document.getElementById('game-screen').classList.remove('hidden');
-    document.getElementById('role-info').classList.remove('hidden');
-    updateGameState(data.game_state);
-    updateActionButtons(myRole, data.game_state.game_state);
-});
-socket.on('phase_changed', function(data) {
-    updateGameState(data.game_state);
-    if (myRole) {
-        updateActionButtons(myRole, data.game_state.game_state);
-    }
-});
-socket.on('check_result', function(data) {
-    alert(`查驗結果：${data.target_name} 是 ${data.result}`);
-});
-socket.on('day_action_result', function(data) {
-    alert(data.message);
-    updateGameState(data.game_state);
-});
-socket.on('action_result', function(data) {
-    if (data.success) {
-        alert('行動成功：' + data.message);
-        document.querySelectorAll('#night-buttons .btn, #day-buttons .btn').forEach(btn => btn.classList.remove('selected'));
-        document.getElementById('night-target').classList.add('hidden');
-        document.getElementById('additional-target').classList.add('hidden');
-        document.getElementById('day-target').classList.add('hidden');
-        document.getElementById('confirm-night-action').classList.add('hidden');
-        document.getElementById('confirm-day-action').classList.add('hidden');
-    } else {
-        alert('行動失敗：' + data.message);
-    }
-});
-socket.on('vote_result', function(data) {
-    if (data.success) { alert('投票成功'); }
-    else { alert('投票失敗：' + data.message); }
-});
-socket.on('error', function(data) {
-    alert('錯誤：' + data.message);
-});
-const style = document.createElement('style');
-style.textContent = `.btn.selected { background: #ff6b6b !important; transform: scale(1.05); }`;
-document.head.appendChild(style);
-</script>
-</body>
-</html>
-'''
 if __name__ == '__main__':
-    import os
+    if PROFILE_MODE != 'off':
+        profiler.configure(PROFILE_MODE, PROFILE_ROOM, PROFILE_RATE)
+    set_memory_trace(MEMORY_TRACE_FRAMES)
+    start_logging()
+    # 訊號處理器裡只排程，實際排空在事件迴圈中進行
+    signal.signal(signal.SIGTERM, lambda signum, frame: call_later(0, start_drain))
+    call_later(0, start_background_tasks)
     port = int(os.environ.get("PORT", 5000))
     socketio.run(app, host="0.0.0.0", port=port)
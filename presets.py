@@ -0,0 +1,133 @@
+# 角色配置：檢查房主送來的配置，以及依人數分類的預設組合；預設組合在載入時檢查一次並算好平衡指標，
+# 房主選用時直接套用，開局不必再檢查；角色定義由 main.py 傳入
+import json
+
+MAX_ROLE_TOTAL = 500  # 角色總數上限，避免超大的 count 在開局時展開成巨大清單
+
+# 平衡估算用的角色強度(經驗值)：好人陣營與狼人陣營各自加總後比較
+ROLE_STRENGTH = {
+    'villager': 1.0,
+    'seer': 3.0,
+    'witch': 3.0,
+    'hunter': 2.0,
+    'guard': 2.0,
+    'knight': 2.0,
+    'idiot': 1.5,
+    'magician': 2.0,
+    'little_girl': 1.5,
+    'werewolf': 4.0,
+    'wolf_king': 5.0,
+    'white_wolf_king': 5.0,
+}
+
+BUILTIN_PRESETS = {
+    'beginner_6': {'name': '入門六人局', 'roles': {'villager': 2, 'werewolf': 2, 'seer': 1, 'witch': 1}},
+    'guard_7': {'name': '守衛七人局', 'roles': {'villager': 2, 'werewolf': 2, 'seer': 1, 'witch': 1, 'guard': 1}},
+    'classic_8': {'name': '經典八人局', 'roles': {'villager': 2, 'werewolf': 2, 'seer': 1, 'witch': 1, 'hunter': 1,
+                                                'guard': 1}},
+    'classic_9': {'name': '預女獵九人局', 'roles': {'villager': 3, 'werewolf': 3, 'seer': 1, 'witch': 1, 'hunter': 1}},
+    'guard_10': {'name': '預女獵守十人局', 'roles': {'villager': 3, 'werewolf': 3, 'seer': 1, 'witch': 1, 'hunter': 1,
+                                                 'guard': 1}},
+    'magic_10': {'name': '魔術師十人局', 'roles': {'villager': 3, 'werewolf': 3, 'seer': 1, 'witch': 1, 'magician': 1,
+                                               'little_girl': 1}},
+    'wolf_king_12': {'name': '狼王守衛十二人局', 'roles': {'villager': 4, 'werewolf': 3, 'wolf_king': 1, 'seer': 1,
+                                                     'witch': 1, 'hunter': 1, 'guard': 1}},
+    'white_wolf_12': {'name': '白狼王騎士十二人局', 'roles': {'villager': 4, 'werewolf': 3, 'white_wolf_king': 1, 'seer': 1,
+                                                      'witch': 1, 'knight': 1, 'idiot': 1}},
+}
+
+
+class RoleConfigError(ValueError):
+    pass
+
+
+def validate_roles(roles, definitions):
+    # roles: [{'role', 'count'}]；回傳整理過的新清單(去掉 0 人的角色)，不合法時丟 RoleConfigError
+    normalized = []
+    seen = set()
+    for entry in roles:
+        role, count = entry.get('role'), entry.get('count')
+        if role not in definitions:
+            raise RoleConfigError(f"未知的角色：{role}")
+        if type(count) is not int or count < 0:
+            raise RoleConfigError(f"{definitions[role]['name']}的人數不正確")
+        if role in seen:
+            raise RoleConfigError(f"{definitions[role]['name']}重複設定")
+        seen.add(role)
+        if count:
+            normalized.append({'role': role, 'count': count})
+    total = sum(entry['count'] for entry in normalized)
+    if total > MAX_ROLE_TOTAL:
+        raise RoleConfigError(f"角色總數不可超過{MAX_ROLE_TOTAL}")
+    teams = {definitions[entry['role']]['team'] for entry in normalized}
+    if 'werewolf' not in teams or 'village' not in teams:
+        raise RoleConfigError("好人與狼人陣營至少各需一名")
+    return normalized
+
+
+def balance_stats(roles, definitions):
+    # 依角色強度估算：balance 為 (好人 - 狼人) / 總強度，0 代表均勢，正值偏向好人
+    strength = {'village': 0.0, 'werewolf': 0.0}
+    wolves = specials = 0
+    for entry in roles:
+        team = definitions[entry['role']]['team']
+        strength[team] += ROLE_STRENGTH.get(entry['role'], 1.0) * entry['count']
+        if team == 'werewolf':
+            wolves += entry['count']
+        elif entry['role'] != 'villager':
+            specials += entry['count']
+    total = sum(entry['count'] for entry in roles)
+    return {
+        'players': total,
+        'wolves': wolves,
+        'specials': specials,
+        'wolf_ratio': round(wolves / total, 2),
+        'village_strength': strength['village'],
+        'wolf_strength': strength['werewolf'],
+        'balance': round((strength['village'] - strength['werewolf']) / (strength['village'] + strength['werewolf']), 3)
+    }
+
+
+class PresetLibrary:
+    def __init__(self, definitions):
+        self.definitions = definitions
+        self.presets = {}  # preset_id -> {'preset_id', 'name', 'roles', 'stats'}
+        self.errors = {}  # 載入失敗的 preset_id -> 原因
+        self.catalog = None
+
+    def load(self, presets):
+        # presets: preset_id -> {'name', 'roles': {角色: 人數}}；不合法的組合記下原因後略過
+        for preset_id, preset in presets.items():
+            try:
+                roles = validate_roles([{'role': role, 'count': count} for role, count in preset['roles'].items()],
+                                       self.definitions)
+            except (RoleConfigError, KeyError, AttributeError, TypeError) as exc:
+                self.errors[preset_id] = str(exc)
+                continue
+            self.presets[preset_id] = {
+                'preset_id': preset_id,
+                'name': str(preset.get('name', preset_id)),
+                'roles': roles,
+                'stats': balance_stats(roles, self.definitions)
+            }
+        self.catalog = None
+
+    def load_file(self, path):
+        with open(path, encoding='utf-8') as f:
+            self.load(json.load(f))
+
+    def get(self, preset_id):
+        return self.presets.get(preset_id)
+
+    def role_catalog(self):
+        # 給客戶端的角色與預設清單；內容只在載入時改變，算一次後重複使用
+        if self.catalog is None:
+            self.catalog = {
+                'roles': [
+                    {'role': role, 'name': info['name'], 'team': info['team'], 'description': info['description']}
+                    for role, info in self.definitions.items()
+                ],
+                'presets': sorted(self.presets.values(), key=lambda p: (p['stats']['players'], p['preset_id'])),
+                'max_total': MAX_ROLE_TOTAL
+            }
+        return self.catalog
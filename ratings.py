@@ -0,0 +1,169 @@
+# 玩家檔案與積分：以陣營平均分計算的 Elo，排行榜用有序容器支援 O(log n) 排名查詢
+import os
+import sqlite3
+import threading
+import uuid
+
+from sortedcontainers import SortedList
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32.0
+
+
+class RatingService:
+    def __init__(self, path):
+        self.path = path
+        # lock 只保護記憶體中的資料，事件迴圈也會取用，持有期間不做磁碟 I/O；
+        # 載入與寫檔另用兩把只在工作執行緒取用的鎖排隊
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.profiles = {}  # profile_id -> {'name', 'rating', 'games', 'wins'}
+        self.leaderboard = SortedList()  # (-rating, profile_id)
+        self.provisional = set()  # 載入完成前回來的玩家，還沒有對上存檔的 profile_id
+        self.loaded = False
+
+    def _connect(self):
+        # 載入與寫檔都可能是第一次碰到資料庫(載入完成前就有新檔案要存)，兩邊都要先建好目錄與資料表
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute('''CREATE TABLE IF NOT EXISTS profiles (
+            profile_id TEXT PRIMARY KEY, name TEXT, rating REAL, games INTEGER, wins INTEGER)''')
+        return conn
+
+    # 啟動後由工作執行緒載入；讀檔與建立排行榜都不持有 lock，最後才換進來
+    # 載入完成前事件迴圈建立的新檔案比資料庫新，換入時蓋過讀到的那一筆；暫定檔案則以存檔為準，只沿用新名字
+    def load(self):
+        with self.load_lock:
+            if self.loaded:
+                return
+            conn = self._connect()
+            # 由 SQLite 排好序(查詢期間會釋放 GIL)，建立排行榜時的排序就只是線性檢查，不會長時間卡住其他執行緒
+            rows = conn.execute('SELECT * FROM profiles ORDER BY rating DESC, profile_id').fetchall()
+            conn.commit()
+            conn.close()
+            profiles = {
+                profile_id: {'name': name, 'rating': rating, 'games': games, 'wins': wins}
+                for profile_id, name, rating, games, wins in rows
+            }
+            leaderboard = SortedList((-rating, profile_id) for profile_id, _, rating, _, _ in rows)
+            dirty = []
+            with self.lock:
+                for profile_id, profile in self.profiles.items():
+                    stored = profiles.get(profile_id)
+                    if profile_id in self.provisional:
+                        if stored is None or stored['name'] != profile['name']:
+                            dirty.append(profile_id)
+                        if stored is not None:
+                            stored['name'] = profile['name']
+                            continue
+                    elif stored is not None:
+                        leaderboard.remove((-stored['rating'], profile_id))
+                    profiles[profile_id] = profile
+                    leaderboard.add((-profile['rating'], profile_id))
+                self.profiles = profiles
+                self.leaderboard = leaderboard
+                self.provisional = set()
+                self.loaded = True
+        if dirty:
+            self.save(dirty)
+
+    def _row(self, profile_id):
+        p = self.profiles[profile_id]
+        return (profile_id, p['name'], p['rating'], p['games'], p['wins'])
+
+    # 以下兩個方法會讀寫 SQLite，伺服器中應透過工作執行緒呼叫
+    def save(self, profile_ids):
+        # 在 lock 內只複製資料，寫檔時不擋住事件迴圈；write_lock 讓較舊的快照不會蓋過較新的
+        with self.write_lock:
+            with self.lock:
+                # 暫定檔案的積分還不是存檔裡的，寫入會蓋掉真正的資料；由 load 對上後再存
+                rows = [self._row(pid) for pid in profile_ids if pid in self.profiles and pid not in self.provisional]
+            if not rows:
+                return
+            conn = self._connect()
+            conn.executemany('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)', rows)
+            conn.commit()
+            conn.close()
+
+    def apply_result(self, teams, winning_team):
+        # teams: [(profile_id, 陣營)]；平局時 winning_team 為 None
+        self.load()  # 對局在載入完成前結束時，在這個工作執行緒等載入
+        updates = self._update_ratings(teams, winning_team)
+        self.save([pid for pid, _ in updates])
+        # 回傳給房間的結果不含 profile_id，避免檔案被他人冒用
+        return [
+            {'name': self.profiles[pid]['name'], 'rating': round(self.profiles[pid]['rating'], 1), 'delta': round(delta, 1)}
+            for pid, delta in updates
+        ]
+
+    # 回傳 (profile_id, 是否需要寫檔)；在事件迴圈上呼叫，只動記憶體
+    def ensure_profile(self, profile_id, name):
+        with self.lock:
+            profile = self.profiles.get(profile_id) if profile_id else None
+            if profile is None and profile_id and not self.loaded:
+                # 載入完成前回來的玩家：不在事件迴圈上查資料庫，先給暫定檔案，載入時換成存檔的資料
+                self.profiles[profile_id] = {'name': name, 'rating': INITIAL_RATING, 'games': 0, 'wins': 0}
+                self.leaderboard.add((-INITIAL_RATING, profile_id))
+                self.provisional.add(profile_id)
+                return profile_id, False
+            if profile is None:
+                profile_id = uuid.uuid4().hex
+                self.profiles[profile_id] = {'name': name, 'rating': INITIAL_RATING, 'games': 0, 'wins': 0}
+                self.leaderboard.add((-INITIAL_RATING, profile_id))
+                return profile_id, True
+            if profile['name'] != name:
+                profile['name'] = name
+                return profile_id, True
+            return profile_id, False
+
+    def _update_ratings(self, teams, winning_team):
+        with self.lock:
+            members = {}
+            for profile_id, team in teams:
+                if profile_id in self.profiles:
+                    members.setdefault(team, []).append(profile_id)
+            if len(members) < 2:
+                return []
+            averages = {
+                team: sum(self.profiles[pid]['rating'] for pid in pids) / len(pids)
+                for team, pids in members.items()
+            }
+            updates = []
+            for team, pids in members.items():
+                opponents = [avg for other, avg in averages.items() if other != team]
+                opponent_rating = sum(opponents) / len(opponents)
+                expected = 1 / (1 + 10 ** ((opponent_rating - averages[team]) / 400))
+                score = 0.5 if winning_team is None else float(team == winning_team)
+                for pid in pids:
+                    updates.append((pid, K_FACTOR * (score - expected), score == 1.0))
+            for pid, delta, won in updates:
+                profile = self.profiles[pid]
+                self.leaderboard.remove((-profile['rating'], pid))
+                profile['rating'] += delta
+                profile['games'] += 1
+                profile['wins'] += won
+                self.leaderboard.add((-profile['rating'], pid))
+            return [(pid, delta) for pid, delta, _ in updates]
+
+    # 排行榜查詢在事件迴圈上呼叫；呼叫端應先確認 loaded，載入前只有部分資料
+    def top(self, limit):
+        with self.lock:
+            return [
+                dict(self.profiles[pid], rank=rank, rating=round(-neg_rating, 1))
+                for rank, (neg_rating, pid) in enumerate(self.leaderboard.islice(0, limit), 1)
+            ]
+
+    def rank(self, profile_id):
+        with self.lock:
+            profile = self.profiles.get(profile_id)
+            if profile is None:
+                return None
+            return {
+                'name': profile['name'],
+                'rank': self.leaderboard.bisect_left((-profile['rating'], profile_id)) + 1,
+                'rating': round(profile['rating'], 1),
+                'games': profile['games'],
+                'wins': profile['wins'],
+                'total': len(self.leaderboard)
+            }
@@ -0,0 +1,154 @@
+# 對局統計：已結束的對局以欄位檔(columnar)累積，彙總時用 NumPy 向量化計算
+# 查詢不需要連到遊戲伺服器：python stats.py [統計目錄]
+import array
+import json
+import os
+import sys
+import threading
+
+ROLE_KEYS = ('villager', 'werewolf', 'seer', 'witch', 'hunter', 'guard', 'wolf_king',
+             'white_wolf_king', 'knight', 'idiot', 'magician', 'little_girl')
+TEAMS = ('village', 'werewolf')
+WINNERS = ('平局', '好人陣營', '狼人陣營')
+WINNER_TEAMS = {'好人陣營': 'village', '狼人陣營': 'werewolf'}
+DEATH_CAUSES = ('alive', 'wolf', 'poison', 'vote', 'duel', 'self_destruct', 'revenge')
+
+# 欄位 -> array/NumPy 共用的型別代碼
+GAME_COLUMNS = {
+    'ended_at': 'd',
+    'duration': 'd',
+    'day_count': 'i',
+    'winner': 'b',
+    'player_count': 'i',
+    'seed': 'Q',
+}
+PLAYER_COLUMNS = {
+    'game': 'q',
+    'role': 'b',
+    'team': 'b',
+    'won': 'b',
+    'death_cause': 'b',
+    'death_day': 'i',
+    'death_time': 'f',
+}
+TABLES = {'games': GAME_COLUMNS, 'players': PLAYER_COLUMNS}
+
+
+class StatsStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.counts = self._read_manifest()
+
+    def _manifest_path(self):
+        return os.path.join(self.path, 'manifest.json')
+
+    def _column_path(self, table, column):
+        return os.path.join(self.path, f"{table}.{column}.bin")
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'games': 0, 'players': 0}
+
+    # 會寫檔，伺服器中應透過工作執行緒呼叫
+    def append(self, records):
+        with self.lock:
+            game_index = self.counts['games']
+            games = {column: array.array(code) for column, code in GAME_COLUMNS.items()}
+            players = {column: array.array(code) for column, code in PLAYER_COLUMNS.items()}
+            for record in records:
+                games['ended_at'].append(record['ended_at'])
+                games['duration'].append(record['duration'])
+                games['day_count'].append(record['day_count'])
+                games['winner'].append(WINNERS.index(record['winner']))
+                games['player_count'].append(len(record['players']))
+                games['seed'].append(record['seed'])
+                winning_team = WINNER_TEAMS.get(record['winner'])
+                for player in record['players']:
+                    players['game'].append(game_index)
+                    players['role'].append(ROLE_KEYS.index(player['role']))
+                    players['team'].append(TEAMS.index(player['team']))
+                    players['won'].append(player['team'] == winning_team)
+                    players['death_cause'].append(DEATH_CAUSES.index(player['death_cause']))
+                    players['death_day'].append(player['death_day'])
+                    players['death_time'].append(player['death_time'])
+                game_index += 1
+            for table, columns in (('games', games), ('players', players)):
+                for column, values in columns.items():
+                    expected = self.counts[table] * values.itemsize
+                    with open(self._column_path(table, column), 'ab') as f:
+                        size = f.seek(0, os.SEEK_END)
+                        if size > expected:
+                            f.truncate(expected)  # 上次寫到一半中斷、清單未記錄的資料
+                        elif size < expected:
+                            f.write(bytes(expected - size))  # 後來新增的欄位，舊資料列補零
+                        values.tofile(f)
+            # 清單最後才更新，讀取端依清單截斷，寫到一半中斷也不會錯位
+            counts = {'games': game_index, 'players': self.counts['players'] + len(players['game'])}
+            tmp_path = self._manifest_path() + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(counts, f)
+            os.replace(tmp_path, self._manifest_path())
+            self.counts = counts
+
+    def load(self, table, columns):
+        import numpy as np
+        count = self._read_manifest()[table]
+        result = {}
+        for column in columns:
+            path = self._column_path(table, column)
+            code = TABLES[table][column]
+            if count and os.path.exists(path):
+                result[column] = np.fromfile(path, dtype=np.dtype(code), count=count)
+            else:
+                result[column] = np.zeros(0, dtype=np.dtype(code))
+        return result
+
+    def role_win_rates(self):
+        import numpy as np
+        data = self.load('players', ['role', 'won'])
+        # 角色與勝負合成一個索引，一次 bincount 同時得到場數與勝場
+        counts = np.bincount(data['role'].astype(np.intp) * 2 + data['won'], minlength=len(ROLE_KEYS) * 2)
+        counts = counts.reshape(len(ROLE_KEYS), 2)
+        wins = counts[:, 1]
+        games = counts.sum(axis=1)
+        rates = np.divide(wins, games, out=np.zeros(len(ROLE_KEYS)), where=games > 0)
+        return {
+            role: {'games': int(games[i]), 'wins': int(wins[i]), 'win_rate': float(rates[i])}
+            for i, role in enumerate(ROLE_KEYS) if games[i]
+        }
+
+    def game_length(self):
+        import numpy as np
+        data = self.load('games', ['duration', 'day_count', 'winner'])
+        if not len(data['duration']):
+            return {'games': 0}
+        winners = np.bincount(data['winner'], minlength=len(WINNERS))
+        return {
+            'games': int(len(data['duration'])),
+            'average_duration': float(data['duration'].mean()),
+            'average_days': float(data['day_count'].mean()),
+            'winners': {name: int(winners[i]) for i, name in enumerate(WINNERS)}
+        }
+
+    def death_causes(self):
+        import numpy as np
+        data = self.load('players', ['death_cause'])
+        counts = np.bincount(data['death_cause'], minlength=len(DEATH_CAUSES))
+        return {cause: int(counts[i]) for i, cause in enumerate(DEATH_CAUSES)}
+
+    def summary(self):
+        return {
+            'roles': self.role_win_rates(),
+            'length': self.game_length(),
+            'deaths': self.death_causes()
+        }
+
+
+if __name__ == '__main__':
+    store = StatsStore(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("STATS_DIR", "data/stats"))
+    print(json.dumps(store.summary(), ensure_ascii=False, indent=2))
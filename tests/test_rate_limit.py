@@ -0,0 +1,44 @@
+# 限流：連線與 IP 兩層額度都夠才一起扣，追蹤的 IP 數量不超過上限
+# 用法: python -m pytest -q tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name in ('STATS_DIR', 'RATINGS_DB', 'HANDOFF_DIR'):
+    os.environ.setdefault(name, '')
+
+import main  # noqa: E402
+
+
+def reset(monkeypatch, ips):
+    monkeypatch.setattr(main, 'sid_buckets', {})
+    monkeypatch.setattr(main, 'ip_buckets', {})
+    monkeypatch.setattr(main, 'client_ip', lambda sid: ips[sid])
+
+
+def test_ip_rejection_keeps_sid_tokens(monkeypatch):
+    reset(monkeypatch, {'a': '10.0.0.1', 'b': '10.0.0.1'})
+    monkeypatch.setitem(main.RATE_LIMITS, 'probe', (0.001, 2))
+    monkeypatch.setattr(main, 'IP_RATE_MULTIPLIER', 1)
+    # b 用光同一個 IP 的額度，a 之後被 IP 擋下時不該扣到自己的額度
+    assert main.allow_event('b', 'probe')[0] and main.allow_event('b', 'probe')[0]
+    assert not main.allow_event('a', 'probe')[0]
+    assert main.sid_buckets['a']['probe'].tokens >= 2 - 1e-3
+    main.ip_buckets['10.0.0.1']['probe'].tokens = 2
+    assert main.allow_event('a', 'probe')[0] and main.allow_event('a', 'probe')[0]
+    assert not main.allow_event('a', 'probe')[0]
+
+
+def test_active_ips_are_capped(monkeypatch):
+    ips = {f's{n}': f'10.1.{n // 256}.{n % 256}' for n in range(60)}
+    reset(monkeypatch, ips)
+    monkeypatch.setattr(main, 'MAX_TRACKED_IPS', 20)
+    clock = [1000.0]
+    monkeypatch.setattr(main.time, 'monotonic', lambda: clock[0])
+    # 每個 IP 都還在額度補滿前，閒置清理清不掉任何一個
+    for n in range(60):
+        clock[0] += 0.001
+        assert main.allow_event(f's{n}', 'join_room')[0]
+        assert len(main.ip_buckets) <= 20
+    # 留下的是最近有事件的 IP
+    assert ips['s59'] in main.ip_buckets and ips['s0'] not in main.ip_buckets
@@ -0,0 +1,54 @@
+# 積分服務：載入完成前的寫檔與回來的玩家都不能弄丟或蓋掉存檔
+# 用法: python -m pytest -q tests
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratings  # noqa: E402
+from ratings import INITIAL_RATING, RatingService  # noqa: E402
+
+
+def test_save_before_load_on_fresh_path(tmp_path):
+    path = str(tmp_path / 'new-dir' / 'ratings.sqlite3')
+    service = RatingService(path)
+    profile_id, changed = service.ensure_profile(None, 'fresh')
+    assert changed
+    service.save([profile_id])
+    reloaded = RatingService(path)
+    reloaded.load()
+    assert reloaded.profiles[profile_id]['name'] == 'fresh'
+
+
+def test_returning_player_before_load_keeps_stored_profile(tmp_path, monkeypatch):
+    path = str(tmp_path / 'ratings.sqlite3')
+    seeded = RatingService(path)
+    seeded.load()
+    profile_id, _ = seeded.ensure_profile(None, 'old name')
+    seeded.profiles[profile_id].update(rating=1620.0, games=12, wins=8)
+    seeded.save([profile_id])
+
+    service = RatingService(path)
+    real_connect = sqlite3.connect
+
+    def no_io(*args, **kwargs):
+        raise AssertionError('ensure_profile 不該碰資料庫')
+    # 事件迴圈上的呼叫只動記憶體
+    monkeypatch.setattr(ratings.sqlite3, 'connect', no_io)
+    assert service.ensure_profile(profile_id, 'new name') == (profile_id, False)
+    assert service.ensure_profile(profile_id, 'new name') == (profile_id, False)
+    # 暫定檔案不能寫入，否則會用初始積分蓋掉存檔
+    service.save([profile_id])
+    monkeypatch.setattr(ratings.sqlite3, 'connect', real_connect)
+    assert service.profiles[profile_id]['rating'] == INITIAL_RATING
+
+    service.load()
+    profile = service.profiles[profile_id]
+    assert (profile['name'], profile['rating'], profile['games'], profile['wins']) == ('new name', 1620.0, 12, 8)
+    assert service.rank(profile_id)['rank'] == 1 and len(service.leaderboard) == 1
+    # 新名字在載入時寫回存檔
+    reloaded = RatingService(path)
+    reloaded.load()
+    assert reloaded.profiles[profile_id]['name'] == 'new name'
+    assert reloaded.profiles[profile_id]['rating'] == 1620.0
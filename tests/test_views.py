@@ -0,0 +1,100 @@
+# 視角隔離：公開狀態不帶身分，玩家只看得到自己的身分，狼人只看得到存活的狼隊友，遊戲結束才公開全部身分
+# 用法: python -m pytest -q tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 不寫統計、積分與交接檔
+for name in ('STATS_DIR', 'RATINGS_DB', 'HANDOFF_DIR'):
+    os.environ.setdefault(name, '')
+
+import main  # noqa: E402
+
+ROLES = [{'role': 'villager', 'count': 2}, {'role': 'werewolf', 'count': 2}, {'role': 'seer', 'count': 1},
+         {'role': 'witch', 'count': 1}, {'role': 'guard', 'count': 1}, {'role': 'magician', 'count': 1}]
+
+
+def team_of(game, pid):
+    return game.all_roles[game.players[pid]['role']]['team']
+
+
+def players_with(game, role):
+    return [pid for pid, player in game.players.items() if player['role'] == role and player['alive']]
+
+
+def check_views(game):
+    if game.game_state == 'waiting':
+        # 開局前還沒有身分，任何視角都不該帶角色欄位
+        for pid in game.players:
+            assert all('role' not in entry for entry in game.get_game_state(pid)['players'])
+        return
+    ended = game.game_state == 'ended'
+    for entry in game.get_game_state()['players']:
+        if ended:
+            assert entry['role'] == game.all_roles[game.players[entry['id']]['role']]['name']
+        else:
+            assert 'role' not in entry and 'team' not in entry
+    for pid in game.players:
+        for entry in game.get_game_state(pid)['players']:
+            if ended or entry['id'] == pid:
+                info = game.all_roles[game.players[entry['id']]['role']]
+                assert (entry['role'], entry['team']) == (info['name'], info['team'])
+            else:
+                assert 'role' not in entry and 'team' not in entry
+        role_info = game.get_player_role_info(pid)
+        if team_of(game, pid) == 'werewolf':
+            living_wolves = {other for other in game.alive_players if team_of(game, other) == 'werewolf'}
+            assert {mate['id'] for mate in role_info['teammates']} == living_wolves - {pid}
+        else:
+            assert 'teammates' not in role_info
+
+
+def play_night(game, swap=None):
+    leader = game.get_wolf_leader()
+    victim = next(pid for pid in game.players if pid in game.alive_players and team_of(game, pid) == 'village'
+                  and pid not in (swap or ()))
+    assert game.night_action(leader, 'kill', victim)[0]
+    if swap:
+        magician = players_with(game, 'magician')[0]
+        assert game.night_action(magician, 'exchange', swap[0], swap[1])[0]
+    assert game.process_night()[0]
+
+
+def play_vote(game):
+    game.begin_voting()
+    check_views(game)
+    wolf = next(pid for pid in game.players if pid in game.alive_players and team_of(game, pid) == 'werewolf')
+    for pid in list(game.alive_players):
+        assert game.vote(pid, wolf)[0]
+    assert game.process_vote()[0]
+    return wolf
+
+
+def test_private_roles_never_leak():
+    game = main.WerewolfGame('views01', seed=7)
+    for seat in range(8):
+        game.add_player(f'p{seat}', None)
+    assert game.set_custom_roles(ROLES)[0]
+    check_views(game)
+    assert game.start_game()[0]
+    check_views(game)
+
+    # 第一晚魔術師把非首狼的狼人和一名村民交換，狼隊友要跟著換
+    leader = game.get_wolf_leader()
+    wolf = next(pid for pid in players_with(game, 'werewolf') if pid != leader)
+    villager = players_with(game, 'villager')[0]
+    play_night(game, swap=(wolf, villager))
+    assert game.players[villager]['role'] == 'werewolf' and game.players[wolf]['role'] == 'villager'
+    check_views(game)
+
+    voted_wolves = []
+    while game.game_state != 'ended':
+        assert game.day_count <= 8
+        if game.game_state == 'day':
+            voted_wolves.append(play_vote(game))
+        else:
+            play_night(game)
+        check_views(game)
+
+    assert voted_wolves and not game.players[voted_wolves[0]]['alive']
+    assert game.winner == '好人陣營'
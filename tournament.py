@@ -0,0 +1,107 @@
+# 多桌錦標賽：報名、依積分分桌(瑞士制)與彙總各桌成績；房間的建立與訊息由 main.py 處理
+import math
+import random
+import secrets
+
+WIN_POINTS = 3
+DRAW_POINTS = 1
+
+
+class Tournament:
+    def __init__(self, tournament_id, name, table_size, rounds, roles, seed=None):
+        self.tournament_id = tournament_id
+        self.name = name
+        self.table_size = table_size
+        self.rounds = rounds
+        self.roles = roles
+        # 分桌用的亂數與房間一樣可由種子重現
+        self.seed = secrets.randbits(64) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.entrants = {}  # entrant_id -> {'name', 'profile_id', 'socket_id', 'points', 'wins', 'games', 'survived'}
+        self.state = 'registering'  # registering -> playing <-> between_rounds -> finished
+        self.round = 0
+        self.tables = {}  # 本輪 room_id -> [entrant_id]
+        self.pending_tables = set()  # 本輪尚未結束的桌
+        self.throttles = {}
+
+    def add_entrant(self, name, socket_id, profile_id=None):
+        entrant_id = secrets.token_hex(8)
+        self.entrants[entrant_id] = {
+            'name': name,
+            'profile_id': profile_id,
+            'socket_id': socket_id,
+            'points': 0,
+            'wins': 0,
+            'games': 0,
+            'survived': 0
+        }
+        return entrant_id
+
+    def active_entrants(self):
+        # 斷線的參賽者不再排進下一輪
+        return [eid for eid, entrant in self.entrants.items() if entrant['socket_id']]
+
+    def standing_key(self, entrant_id):
+        entrant = self.entrants[entrant_id]
+        return (-entrant['points'], -entrant['wins'], -entrant['survived'])
+
+    def seat_round(self):
+        # 第一輪隨機分桌，之後依積分排序，相近名次同桌；桌數取最少，各桌人數最多差一人
+        entrant_ids = self.active_entrants()
+        self.rng.shuffle(entrant_ids)
+        if self.round:
+            entrant_ids.sort(key=self.standing_key)
+        table_count = math.ceil(len(entrant_ids) / self.table_size)
+        base, extra = divmod(len(entrant_ids), table_count)
+        seating = []
+        start = 0
+        for i in range(table_count):
+            size = base + (i < extra)
+            seating.append(entrant_ids[start:start + size])
+            start += size
+        self.round += 1
+        self.state = 'playing'
+        return seating
+
+    def add_table(self, room_id, entrant_ids):
+        self.tables[room_id] = entrant_ids
+        self.pending_tables.add(room_id)
+
+    def record_table(self, room_id, results):
+        # results: entrant_id -> (是否獲勝，平局為 None, 是否存活)；桌子中途解散時為空
+        if room_id not in self.pending_tables:
+            return False
+        self.pending_tables.discard(room_id)
+        for entrant_id, (won, survived) in results.items():
+            entrant = self.entrants[entrant_id]
+            entrant['games'] += 1
+            entrant['survived'] += survived
+            if won is None:
+                entrant['points'] += DRAW_POINTS
+            elif won:
+                entrant['points'] += WIN_POINTS
+                entrant['wins'] += 1
+        if self.pending_tables:
+            return False
+        self.state = 'finished' if self.round >= self.rounds else 'between_rounds'
+        return True
+
+    def standings(self):
+        ranked = sorted(self.entrants, key=self.standing_key)
+        return [
+            dict(rank=rank, name=self.entrants[eid]['name'], points=self.entrants[eid]['points'],
+                 wins=self.entrants[eid]['wins'], games=self.entrants[eid]['games'])
+            for rank, eid in enumerate(ranked, 1)
+        ]
+
+    def summary(self):
+        return {
+            'tournament_id': self.tournament_id,
+            'name': self.name,
+            'state': self.state,
+            'round': self.round,
+            'rounds': self.rounds,
+            'tables': len(self.tables),
+            'tables_playing': len(self.pending_tables),
+            'standings': self.standings()
+        }